@@ -0,0 +1,82 @@
+"""
+Per-turn latency: fresh genai.Client per call vs the shared LLMClient.
+
+Makes real Gemini calls against the configured Vertex AI project, so it needs
+the same credentials as the app. Run from the repository root:
+
+    python -m benchmarks.bench_llm_client --turns 10
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from google import genai
+from google.genai import types
+
+from config import get_settings
+from llm import LLMClient
+
+PROMPT = "Reply with the single word: ok"
+
+
+async def _one_turn(client: genai.Client) -> None:
+    await client.aio.models.generate_content(
+        model=get_settings().llm.gcp_model,
+        contents=PROMPT,
+        config=types.GenerateContentConfig(max_output_tokens=8),
+    )
+
+
+async def fresh_client_turn() -> float:
+    """Mirror the old behaviour: build a client inside every turn."""
+    settings = get_settings().llm
+    start = time.perf_counter()
+    client = genai.Client(
+        vertexai=True, project=settings.gcp_project, location=settings.gcp_location
+    )
+    await _one_turn(client)
+    return time.perf_counter() - start
+
+
+async def pooled_client_turn(llm_client: LLMClient) -> float:
+    start = time.perf_counter()
+    await _one_turn(llm_client.client)
+    return time.perf_counter() - start
+
+
+def _report(label: str, samples: list) -> None:
+    ms = sorted(s * 1000 for s in samples)
+    p95 = ms[min(len(ms) - 1, int(round(0.95 * (len(ms) - 1))))]
+    print(
+        f"{label:<8} n={len(ms):<3} mean={statistics.mean(ms):8.1f}ms "
+        f"p50={statistics.median(ms):8.1f}ms p95={p95:8.1f}ms"
+    )
+
+
+async def main(turns: int) -> None:
+    llm_client = await LLMClient.create()
+    try:
+        # Warm both paths once so the first-call costs don't skew the run.
+        await fresh_client_turn()
+        await pooled_client_turn(llm_client)
+
+        fresh, pooled = [], []
+        for _ in range(turns):
+            fresh.append(await fresh_client_turn())
+            pooled.append(await pooled_client_turn(llm_client))
+
+        _report("fresh", fresh)
+        _report("pooled", pooled)
+        saved = statistics.mean(fresh) - statistics.mean(pooled)
+        print(f"mean per-turn saving: {saved * 1000:.1f}ms")
+    finally:
+        await llm_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.turns))
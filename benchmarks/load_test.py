@@ -0,0 +1,300 @@
+"""
+Offline load test for /chat and the WebSocket premium flow.
+
+Starts `main.app` under uvicorn with the stand-ins from `benchmarks.stubs`
+instead of Gemini, Vertex AI Search and AlloyDB, then drives concurrent chat
+sessions against it. Every session holds a WebSocket open, posts turns to
+/chat and waits for each premium flow to complete before the next turn.
+
+Reports p50/p95/p99 for the /chat response, the first premium frame and the
+completed premium frame, plus throughput and event-loop lag of the server.
+Needs `httpx` and `websockets` on top of the app's requirements. Run from the
+repository root:
+
+    python -m benchmarks.load_test --sessions 50 --turns 5
+    python -m benchmarks.load_test --answer-latency 800:2500 --json baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+import uvicorn
+import websockets
+
+from benchmarks.stubs import Latency, StubProfile, install
+
+FILLER = ["hi", "thanks!", "ok"]
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class LoopLagMonitor:
+    """Samples how late the server's event loop wakes up from a short sleep."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+
+    async def run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(time.perf_counter() - started - self.interval)
+
+
+class Server:
+    """Runs the app under uvicorn on its own thread and event loop."""
+
+    def __init__(self, app, port: int):
+        self.server = uvicorn.Server(
+            uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+        )
+        self.lag = LoopLagMonitor()
+        self.thread = threading.Thread(target=asyncio.run, args=(self._serve(),))
+
+    async def _serve(self) -> None:
+        monitor = asyncio.create_task(self.lag.run())
+        try:
+            await self.server.serve()
+        finally:
+            monitor.cancel()
+
+    def start(self) -> None:
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError("Server failed to start")
+            time.sleep(0.05)
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join()
+
+
+async def _session(
+    base_url: str,
+    ws_url: str,
+    http: httpx.AsyncClient,
+    questions: List[str],
+    args,
+    samples: Dict[str, List[float]],
+    errors: Dict[str, int],
+) -> None:
+    client_id = f"load-{uuid.uuid4().hex[:12]}"
+    async with websockets.connect(f"{ws_url}/ws/{client_id}") as ws:
+        for _ in range(args.turns):
+            if random.random() < args.filler_ratio:
+                message = random.choice(FILLER)
+            else:
+                message = random.choice(questions)
+
+            started = time.perf_counter()
+            try:
+                response = await http.post(
+                    f"{base_url}/chat", json={"message": message, "clientId": client_id}
+                )
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                errors[type(e).__name__] += 1
+                continue
+            samples["chat"].append(time.perf_counter() - started)
+
+            if response.json().get("premium_applicable"):
+                await _await_premium(ws, started, args.premium_timeout, samples, errors)
+            if args.think_time:
+                await asyncio.sleep(random.expovariate(1 / args.think_time))
+
+
+async def _await_premium(ws, started, timeout, samples, errors) -> None:
+    first = None
+    deadline = started + timeout
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            errors["premium_timeout"] += 1
+            return
+        try:
+            frame = json.loads(await asyncio.wait_for(ws.recv(), remaining))
+        except asyncio.TimeoutError:
+            errors["premium_timeout"] += 1
+            return
+        status = frame.get("status")
+        if first is None and status in ("videos", "documents", "completed"):
+            first = time.perf_counter() - started
+            samples["premium_first_result"].append(first)
+        if status == "completed":
+            samples["premium_completed"].append(time.perf_counter() - started)
+            return
+        if status == "error":
+            errors["premium_error"] += 1
+            return
+
+
+def _summarize(samples, errors, lag, elapsed, gemini_calls, args) -> dict:
+    summary = {
+        "sessions": args.sessions,
+        "turns_per_session": args.turns,
+        "elapsed_seconds": round(elapsed, 2),
+        "chat_per_second": round(len(samples["chat"]) / elapsed, 2),
+        "premium_per_second": round(len(samples["premium_completed"]) / elapsed, 2),
+        "gemini_calls": gemini_calls,
+        "errors": dict(errors),
+        "latency_ms": {},
+    }
+    for name in ("chat", "premium_first_result", "premium_completed"):
+        values = samples[name]
+        if values:
+            summary["latency_ms"][name] = {
+                "n": len(values),
+                **{
+                    f"p{int(q * 100)}": round(_percentile(values, q) * 1000, 1)
+                    for q in (0.5, 0.95, 0.99)
+                },
+            }
+    if lag:
+        summary["event_loop_lag_ms"] = {
+            "p50": round(_percentile(lag, 0.5) * 1000, 2),
+            "p99": round(_percentile(lag, 0.99) * 1000, 2),
+            "max": round(max(lag) * 1000, 2),
+        }
+    return summary
+
+
+def _report(summary: dict) -> None:
+    print(
+        f"{summary['sessions']} sessions x {summary['turns_per_session']} turns "
+        f"in {summary['elapsed_seconds']}s; {summary['gemini_calls']} Gemini calls"
+    )
+    print(
+        f"throughput: {summary['chat_per_second']} chat/s, "
+        f"{summary['premium_per_second']} premium/s"
+    )
+    for name, stats in summary["latency_ms"].items():
+        print(
+            f"{name:<22} n={stats['n']:<5} p50={stats['p50']:8.1f}ms "
+            f"p95={stats['p95']:8.1f}ms p99={stats['p99']:8.1f}ms"
+        )
+    if "event_loop_lag_ms" in summary:
+        lag = summary["event_loop_lag_ms"]
+        print(
+            f"{'event loop lag':<22} p50={lag['p50']:.2f}ms p99={lag['p99']:.2f}ms "
+            f"max={lag['max']:.2f}ms"
+        )
+    if "model_routing" in summary:
+        routing = summary["model_routing"]
+        print(
+            f"model routes: {routing['routes']}; estimated cost "
+            f"${routing['cost_usd']:.4f} vs ${routing['baseline_cost_usd']:.4f} "
+            f"on a single model"
+        )
+    if "embedding_cache" in summary:
+        cache = summary["embedding_cache"]
+        print(
+            f"embedding cache: {cache['misses']} embedding calls, "
+            f"{cache['hits'] + cache['shared']} reused (hit rate {cache['hit_rate']:.0%})"
+        )
+    if summary["errors"]:
+        print(f"errors: {summary['errors']}")
+
+
+async def drive(args, port: int) -> tuple:
+    base_url = f"http://127.0.0.1:{port}"
+    ws_url = f"ws://127.0.0.1:{port}"
+    # A mix of short lookups and comparisons, so model routing sees both.
+    templates = [
+        "What did partners say about CTV measurement topic {i}?",
+        "Compare how partners measure reach on CTV versus linear TV for "
+        "campaign {i}, and explain why their attribution approaches differ.",
+    ]
+    questions = [templates[i % len(templates)].format(i=i) for i in range(args.questions)]
+    samples: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    limits = httpx.Limits(max_connections=args.sessions)
+    async with httpx.AsyncClient(limits=limits, timeout=args.premium_timeout) as http:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(
+                _session(base_url, ws_url, http, questions, args, samples, errors)
+                for _ in range(args.sessions)
+            )
+        )
+        elapsed = time.perf_counter() - started
+    return samples, errors, elapsed
+
+
+def main(args) -> dict:
+    profile = StubProfile(
+        answer=Latency.parse(args.answer_latency),
+        synthesis=Latency.parse(args.synthesis_latency),
+        search=Latency.parse(args.search_latency),
+        embedding=Latency.parse(args.embedding_latency),
+        similarity_search=Latency.parse(args.similarity_search_latency),
+    )
+
+    import main as app_module
+
+    genai_client = install(app_module, profile)
+    # The app logs every turn at INFO; keep the report readable.
+    logging.getLogger().setLevel(logging.WARNING)
+
+    server = Server(app_module.app, args.port)
+    server.start()
+    try:
+        samples, errors, elapsed = asyncio.run(drive(args, args.port))
+    finally:
+        server.stop()
+
+    summary = _summarize(
+        samples, errors, server.lag.samples, elapsed, genai_client.models.calls, args
+    )
+    routing = app_module.app.state.llm_client.router.as_dict()
+    summary["model_routing"] = {
+        "routes": routing["routes"],
+        "cost_usd": routing["cost_usd"],
+        "baseline_cost_usd": routing["baseline_cost_usd"],
+    }
+    embedding_cache = app_module.app.state.vector_store.embedding_cache
+    if embedding_cache:
+        summary["embedding_cache"] = embedding_cache.as_dict()
+    _report(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument(
+        "--questions",
+        type=int,
+        default=200,
+        help="distinct questions to draw from; fewer means more cache hits",
+    )
+    parser.add_argument("--filler-ratio", type=float, default=0.1)
+    parser.add_argument("--think-time", type=float, default=0.5, help="mean seconds")
+    parser.add_argument("--premium-timeout", type=float, default=60.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--json", help="also write the summary to this file")
+    parser.add_argument("--answer-latency", default="800:2500", help="median:p99 ms")
+    parser.add_argument("--synthesis-latency", default="2500:6000")
+    parser.add_argument("--search-latency", default="600:1500")
+    parser.add_argument("--embedding-latency", default="60:200")
+    parser.add_argument("--similarity-search-latency", default="40:150")
+    main(parser.parse_args())
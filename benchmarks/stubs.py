@@ -0,0 +1,293 @@
+"""
+Local stand-ins for the Gemini, Vertex AI Search and AlloyDB backends.
+
+Each stub sleeps for a latency drawn from a `Latency` distribution and then
+returns canned data shaped like the real service's, so the whole app can run
+under load without credentials or quota. `install` swaps them in for the real
+classes before the FastAPI startup hook runs.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+from dataclasses import dataclass
+from typing import List
+from types import SimpleNamespace
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config import get_settings
+from datasense_types import Document, VideoRecord
+from embedding_cache import CachedEmbeddings
+from llm import LLMClient
+from prompt_cache import PromptCache, prompt_key
+
+EMBEDDING_SIZE = 768
+
+
+@dataclass(frozen=True)
+class Latency:
+    """Log-normal latency described by its median and p99, in milliseconds."""
+
+    median_ms: float
+    p99_ms: float
+
+    @classmethod
+    def parse(cls, value: str) -> "Latency":
+        """Parse `"median:p99"`, e.g. `"800:2500"`; a single number is fixed."""
+        median, _, p99 = value.partition(":")
+        return cls(float(median), float(p99 or median))
+
+    def sample(self) -> float:
+        """One latency in seconds."""
+        if self.p99_ms <= self.median_ms:
+            return self.median_ms / 1000
+        # 2.326 is the z-score of the 99th percentile.
+        sigma = math.log(self.p99_ms / self.median_ms) / 2.326
+        return random.lognormvariate(math.log(self.median_ms), sigma) / 1000
+
+
+@dataclass
+class StubProfile:
+    """Latencies for every stubbed backend call."""
+
+    answer: Latency = Latency(800, 2500)
+    synthesis: Latency = Latency(2500, 6000)
+    chunk: Latency = Latency(30, 80)
+    search: Latency = Latency(600, 1500)
+    embedding: Latency = Latency(60, 200)
+    similarity_search: Latency = Latency(40, 150)
+    # Gemini latencies are scaled by this for "flash" models
+    light_model_factor: float = 0.4
+
+
+_CANNED = {
+    "GeminiTurnResponse": {
+        "answer": "Connected TV advertising reaches viewers on streaming devices "
+        "and smart TVs, with audience targeting closer to digital than linear TV.",
+        "premium_applicable": True,
+    },
+    "SynthesizedResponse": {
+        "thought_process": "The videos and documents both cover CTV measurement.",
+        "file_link": ["https://example.com/video.mp4"],
+        "partner_name": ["Example Partner"],
+        "file_name": ["ctv_overview.mp4"],
+        "thumbnail_link": ["https://example.com/thumb.jpg"],
+        "answer": "Partners measure CTV campaigns with household-level reach, "
+        "incremental lift studies and co-viewing adjusted frequency.",
+        "enough_context": True,
+    },
+}
+_SUMMARY = "The user asked about connected TV advertising and measurement."
+
+
+class StubPromptCache(PromptCache):
+    """Local stand-in for Gemini cached content; remembers each prompt's size."""
+
+    def __init__(self):
+        super().__init__()
+        self.tokens = {}
+
+    async def get(self, model: str, system_instruction: str):
+        name = f"cachedContents/local-{prompt_key(model, system_instruction)[:16]}"
+        if name in self.tokens:
+            self.stats.hits += 1
+        else:
+            self.stats.created += 1
+            self.tokens[name] = len(system_instruction) // 4
+        return name
+
+
+class _StubModels:
+    def __init__(self, profile: StubProfile, prompt_cache: StubPromptCache):
+        self.profile = profile
+        self.prompt_cache = prompt_cache
+        self.calls = 0
+
+    def _latency(self, model, config) -> float:
+        schema = getattr(config, "response_schema", None)
+        if schema is not None and schema.__name__ == "SynthesizedResponse":
+            seconds = self.profile.synthesis.sample()
+        else:
+            seconds = self.profile.answer.sample()
+        if "flash" in model:
+            seconds *= self.profile.light_model_factor
+        return seconds
+
+    def _response(self, contents, config) -> SimpleNamespace:
+        schema = getattr(config, "response_schema", None)
+        if schema is None:
+            text, parsed = _SUMMARY, None
+        else:
+            data = _CANNED[schema.__name__]
+            text, parsed = json.dumps(data), schema(**data)
+        # About four characters per token, like the real tokenizer on English.
+        cached_name = getattr(config, "cached_content", None)
+        cached_tokens = self.prompt_cache.tokens.get(cached_name, 0)
+        instruction = getattr(config, "system_instruction", None) or ""
+        usage = SimpleNamespace(
+            prompt_token_count=(len(str(contents)) + len(str(instruction))) // 4
+            + cached_tokens,
+            cached_content_token_count=cached_tokens,
+            candidates_token_count=len(text) // 4,
+        )
+        return SimpleNamespace(text=text, parsed=parsed, usage_metadata=usage)
+
+    async def get(self, model):
+        return SimpleNamespace(name=model)
+
+    async def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        await asyncio.sleep(self._latency(model, config))
+        return self._response(contents, config)
+
+    async def generate_content_stream(self, model, contents, config=None):
+        self.calls += 1
+        response = self._response(contents, config)
+        text = response.text
+        # The call's latency is split into time to first token and the rest.
+        total = self._latency(model, config)
+        pieces = [text[i : i + 24] for i in range(0, len(text), 24)]
+
+        async def chunks():
+            await asyncio.sleep(total / 2)
+            for i, piece in enumerate(pieces):
+                await asyncio.sleep(
+                    min(self.profile.chunk.sample(), total / 2 / len(pieces))
+                )
+                last = i == len(pieces) - 1
+                yield SimpleNamespace(
+                    text=piece, usage_metadata=response.usage_metadata if last else None
+                )
+
+        return chunks()
+
+
+class StubGenaiClient:
+    """Quacks like `genai.Client` for the calls the app makes."""
+
+    def __init__(self, profile: StubProfile):
+        self.prompt_cache = StubPromptCache()
+        self.models = _StubModels(profile, self.prompt_cache)
+        self.aio = SimpleNamespace(models=self.models, aclose=self._aclose)
+
+    async def _aclose(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class StubSearchService:
+    """Stand-in for `SearchService`."""
+
+    def __init__(self, profile: StubProfile):
+        self.profile = profile
+
+    async def search(self, search_query: str, page_size: int = 5):
+        await asyncio.sleep(self.profile.search.sample())
+        return [
+            Document(
+                title=f"CTV measurement guide {i}",
+                link=f"https://example.com/guide-{i}.pdf",
+                link_with_page=f"https://example.com/guide-{i}.pdf#page=3",
+                snippets=["Household reach and incremental lift for CTV."],
+                segment_content="CTV campaigns are measured with household reach. " * 20,
+                page_number=3,
+            )
+            for i in range(page_size)
+        ]
+
+
+class StubEmbeddings(Embeddings):
+    """Stand-in for `VertexAIEmbeddings`."""
+
+    def __init__(self, profile: StubProfile):
+        self.profile = profile
+
+    @staticmethod
+    def _vector(text: str) -> List[float]:
+        # Deterministic per normalized question, so repeats hit the semantic cache.
+        seed = int.from_bytes(
+            hashlib.sha1(text.strip().lower().encode()).digest()[:4], "big"
+        )
+        vector = np.random.default_rng(seed).standard_normal(EMBEDDING_SIZE)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.profile.embedding.sample())
+        return self._vector(text)
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.profile.embedding.sample())
+        return self._vector(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.profile.embedding.sample())
+        return [self._vector(text) for text in texts]
+
+
+class StubVectorStore:
+    """Stand-in for `VectorStore`, behind the same embedding cache."""
+
+    def __init__(self, profile: StubProfile):
+        self.profile = profile
+        self.embedding_service = StubEmbeddings(profile)
+        self.embedding_cache = None
+        if get_settings().embedding_cache.enabled:
+            self.embedding_cache = self.embedding_service = CachedEmbeddings(
+                self.embedding_service,
+                "stub-embedding",
+                max_entries=get_settings().embedding_cache.max_entries,
+            )
+
+    async def warm_up(self) -> bool:
+        return True
+
+    async def embed_query(self, query: str):
+        return await self.embedding_service.aembed_query(query)
+
+    async def asimilarity_search(self, query: str, k=None, min_score=None, filters=None):
+        await self.embed_query(query)
+        await asyncio.sleep(self.profile.similarity_search.sample())
+        return [
+            VideoRecord(
+                id=str(i),
+                partner="Example Partner",
+                created_at="2025-04-19T13:50:46",
+                video_file_path=f"https://example.com/video-{i}.mp4",
+                file_name=f"ctv_{i}.mp4",
+                thumbnail_uri=f"https://example.com/thumb-{i}.jpg",
+                page_content="transcript: CTV buyers want reach. " * 30,
+                score=0.9 - 0.05 * i,
+            )
+            for i in range(k or 3)
+        ]
+
+
+def install(app_module, profile: StubProfile) -> StubGenaiClient:
+    """
+    Point `app_module`'s startup hook at the stubs. Returns the stub Gemini
+    client so callers can read its call count.
+    """
+    genai_client = StubGenaiClient(profile)
+
+    async def create_vector_store():
+        return StubVectorStore(profile)
+
+    async def create_search_service():
+        return StubSearchService(profile)
+
+    async def create_llm_client():
+        llm_client = LLMClient(genai_client, get_settings().llm)
+        llm_client.prompt_cache = genai_client.prompt_cache
+        return llm_client
+
+    app_module._create_vector_store = create_vector_store
+    app_module._create_search_service = create_search_service
+    app_module._create_llm_client = create_llm_client
+    return genai_client
@@ -0,0 +1,256 @@
+"""
+WebSocket delivery across workers
+
+`ConnectionRegistry` tracks the WebSockets connected to this process. A
+`MessageBroker` delivers a message to a client's socket wherever it lives:
+`InProcessBroker` when a single worker serves everything, `RedisBroker` when
+`/chat` and the client's WebSocket may land on different uvicorn workers or
+Cloud Run instances. The broker also fans out disconnect notifications so
+every process can cancel work for a client that has gone away.
+
+Every WebSocket gets a connection id when it registers. Disconnect
+notifications carry it, so a client that has already reconnected keeps the
+work queued for its new connection.
+"""
+
+import asyncio
+import json
+import uuid
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import WebSocket
+
+from config import get_settings, setup_logging
+
+logger = setup_logging()
+
+# Called with the client id and the id of the connection that closed.
+DisconnectHandler = Callable[[str, str], None]
+
+
+class ConnectionRegistry:
+    """The WebSockets connected to this process, keyed by client id."""
+
+    def __init__(self):
+        self._sockets: Dict[str, Tuple[WebSocket, str]] = {}
+
+    def __contains__(self, client_id: str) -> bool:
+        return client_id in self._sockets
+
+    def __len__(self) -> int:
+        return len(self._sockets)
+
+    def register(self, client_id: str, websocket: WebSocket) -> str:
+        """Attach the socket and return its new connection id."""
+        connection_id = uuid.uuid4().hex
+        self._sockets[client_id] = (websocket, connection_id)
+        return connection_id
+
+    def connection_id(self, client_id: str) -> Optional[str]:
+        entry = self._sockets.get(client_id)
+        return entry[1] if entry else None
+
+    def unregister(self, client_id: str, websocket: WebSocket) -> Optional[str]:
+        """
+        Remove the socket if it is still the client's current one, returning
+        its connection id.
+        """
+        entry = self._sockets.get(client_id)
+        if entry is not None and entry[0] is websocket:
+            del self._sockets[client_id]
+            return entry[1]
+        return None
+
+    async def deliver(self, client_id: str, message: str) -> bool:
+        entry = self._sockets.get(client_id)
+        if entry is None:
+            return False
+        await entry[0].send_text(message)
+        return True
+
+
+class MessageBroker(ABC):
+    """Routes messages to client WebSockets, wherever they are connected."""
+
+    def __init__(self):
+        self.registry = ConnectionRegistry()
+        self._disconnect_handlers: List[DisconnectHandler] = []
+
+    def add_disconnect_handler(self, handler: DisconnectHandler) -> None:
+        self._disconnect_handlers.append(handler)
+
+    def _handle_disconnect(self, client_id: str, connection_id: str) -> None:
+        for handler in self._disconnect_handlers:
+            try:
+                handler(client_id, connection_id)
+            except Exception as e:
+                logger.error(f"Broker: disconnect handler failed for {client_id}: {e}")
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    @abstractmethod
+    async def register(self, client_id: str, websocket: WebSocket) -> None:
+        """Attach a client's WebSocket to this process."""
+
+    @abstractmethod
+    async def unregister(self, client_id: str, websocket: WebSocket) -> None:
+        """Detach a client's WebSocket and announce the disconnect."""
+
+    @abstractmethod
+    async def publish(self, client_id: str, message: str) -> bool:
+        """Send a message to the client. Returns False if nobody received it."""
+
+    @abstractmethod
+    async def is_connected(self, client_id: str) -> bool:
+        """Whether the client has a WebSocket on any process."""
+
+    @abstractmethod
+    async def connection_id(self, client_id: str) -> Optional[str]:
+        """The id of the client's current WebSocket on any process, if any."""
+
+
+class InProcessBroker(MessageBroker):
+    """Delivery within a single process."""
+
+    async def register(self, client_id: str, websocket: WebSocket) -> None:
+        self.registry.register(client_id, websocket)
+
+    async def unregister(self, client_id: str, websocket: WebSocket) -> None:
+        connection_id = self.registry.unregister(client_id, websocket)
+        if connection_id is not None:
+            self._handle_disconnect(client_id, connection_id)
+
+    async def publish(self, client_id: str, message: str) -> bool:
+        return await self.registry.deliver(client_id, message)
+
+    async def is_connected(self, client_id: str) -> bool:
+        return client_id in self.registry
+
+    async def connection_id(self, client_id: str) -> Optional[str]:
+        return self.registry.connection_id(client_id)
+
+
+class RedisBroker(MessageBroker):
+    """
+    Delivery across processes over Redis pub/sub.
+
+    Each process subscribes to one channel per locally connected client plus a
+    shared control channel for disconnects. Messages for local clients skip
+    Redis entirely. Each client's current connection id is kept in a Redis key
+    so other processes can tag its work. Pass `redis_client` to use a stand-in
+    such as fakeredis.
+    """
+
+    # How long a client's connection id outlives its last registration.
+    CONNECTION_TTL_SECONDS = 24 * 3600
+
+    def __init__(self, url: str, channel_prefix: str, redis_client=None):
+        super().__init__()
+        if redis_client is None:
+            import redis.asyncio as redis
+
+            redis_client = redis.from_url(url, decode_responses=True)
+        self._redis = redis_client
+        self._prefix = f"{channel_prefix}:client:"
+        self._control = f"{channel_prefix}:disconnect"
+        self._connections = f"{channel_prefix}:connection:"
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+
+    def _channel(self, client_id: str) -> str:
+        return f"{self._prefix}{client_id}"
+
+    async def start(self) -> None:
+        if self._pubsub is not None:
+            return
+        self._pubsub = self._redis.pubsub()
+        await self._pubsub.subscribe(self._control)
+        self._reader = asyncio.create_task(self._read())
+        logger.info("RedisBroker started.")
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+        await self._redis.aclose()
+
+    async def _read(self) -> None:
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    channel, data = message["channel"], message["data"]
+                    if channel == self._control:
+                        disconnect = json.loads(data)
+                        self._handle_disconnect(
+                            disconnect["client_id"], disconnect["connection_id"]
+                        )
+                        continue
+                    client_id = channel[len(self._prefix) :]
+                    try:
+                        await self.registry.deliver(client_id, data)
+                    except Exception as e:
+                        logger.error(f"RedisBroker: failed to deliver to {client_id}: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"RedisBroker: subscription error, retrying: {e}")
+                await asyncio.sleep(1)
+
+    async def register(self, client_id: str, websocket: WebSocket) -> None:
+        await self.start()
+        connection_id = self.registry.register(client_id, websocket)
+        await self._redis.set(
+            f"{self._connections}{client_id}",
+            connection_id,
+            ex=self.CONNECTION_TTL_SECONDS,
+        )
+        await self._pubsub.subscribe(self._channel(client_id))
+
+    async def unregister(self, client_id: str, websocket: WebSocket) -> None:
+        connection_id = self.registry.unregister(client_id, websocket)
+        if connection_id is None:
+            return
+        await self._pubsub.unsubscribe(self._channel(client_id))
+        # Every process, this one included, receives the announcement.
+        await self._redis.publish(
+            self._control,
+            json.dumps({"client_id": client_id, "connection_id": connection_id}),
+        )
+
+    async def publish(self, client_id: str, message: str) -> bool:
+        if client_id in self.registry:
+            return await self.registry.deliver(client_id, message)
+        receivers = await self._redis.publish(self._channel(client_id), message)
+        return receivers > 0
+
+    async def is_connected(self, client_id: str) -> bool:
+        if client_id in self.registry:
+            return True
+        counts = await self._redis.pubsub_numsub(self._channel(client_id))
+        return bool(counts and counts[0][1])
+
+    async def connection_id(self, client_id: str) -> Optional[str]:
+        if client_id in self.registry:
+            return self.registry.connection_id(client_id)
+        return await self._redis.get(f"{self._connections}{client_id}")
+
+
+def create_broker() -> MessageBroker:
+    settings = get_settings().broker
+    if settings.backend == "redis":
+        return RedisBroker(settings.redis_url, settings.channel_prefix)
+    elif settings.backend == "memory":
+        return InProcessBroker()
+    raise ValueError(f"Unknown broker backend: {settings.backend}")
+
+
+message_broker = create_broker()
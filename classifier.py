@@ -0,0 +1,101 @@
+"""
+Local, model-free pre-classifier for chat turns
+
+Obvious greetings, thanks and conversational filler never need RAG, and they
+don't need Gemini either. `classify_locally` answers them with a canned reply
+so the turn costs no LLM call at all.
+"""
+
+import re
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+
+@dataclass
+class FastPathResult:
+    answer: str
+    premium_applicable: bool = False
+
+
+@dataclass
+class TurnStats:
+    """Counters for how chat turns were answered."""
+
+    turns: int = 0
+    fast_path_turns: int = 0
+    llm_turns: int = 0
+
+    # Before the combined call every LLM turn cost two calls (answer + classifier).
+    CALLS_PER_TURN_BEFORE = 2
+
+    @property
+    def calls_saved_by_fast_path(self) -> int:
+        return self.fast_path_turns * self.CALLS_PER_TURN_BEFORE
+
+    @property
+    def calls_saved_by_combined_call(self) -> int:
+        return self.llm_turns * (self.CALLS_PER_TURN_BEFORE - 1)
+
+    def as_dict(self) -> dict:
+        stats = asdict(self)
+        stats["calls_saved_by_fast_path"] = self.calls_saved_by_fast_path
+        stats["calls_saved_by_combined_call"] = self.calls_saved_by_combined_call
+        stats["llm_calls_saved"] = (
+            self.calls_saved_by_fast_path + self.calls_saved_by_combined_call
+        )
+        return stats
+
+
+turn_stats = TurnStats()
+
+
+_FAST_PATH_REPLIES = [
+    (
+        re.compile(
+            r"^(hi|hello|hey|hiya|howdy|greetings|good (morning|afternoon|evening))"
+            r"( there| datasense| everyone| all)?$"
+        ),
+        "Hello! Ask me anything about the Thought Leaders content.",
+    ),
+    (
+        re.compile(
+            r"^(thanks|thank you|thank you so much|thanks a lot|thx|ty|cheers|"
+            r"much appreciated)( datasense)?$"
+        ),
+        "You're welcome! Let me know if there's anything else I can help with.",
+    ),
+    (
+        re.compile(r"^(bye|goodbye|see you|see ya|later|have a good (day|one))$"),
+        "Goodbye! Come back any time you have a question.",
+    ),
+    (
+        re.compile(
+            r"^(ok|okay|k|cool|great|nice|awesome|got it|sounds good|alright|"
+            r"perfect)$"
+        ),
+        "Great! Let me know if you have another question.",
+    ),
+]
+
+_PUNCTUATION = re.compile(r"[^\w\s']+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize(message: str) -> str:
+    message = _PUNCTUATION.sub(" ", message.lower())
+    return _WHITESPACE.sub(" ", message).strip()
+
+
+def classify_locally(message: str) -> Optional[FastPathResult]:
+    """
+    Answer obvious greetings and filler without calling Gemini.
+
+    Returns None when the message needs the model.
+    """
+    normalized = _normalize(message)
+    if not normalized or len(normalized.split()) > 5:
+        return None
+    for pattern, reply in _FAST_PATH_REPLIES:
+        if pattern.match(normalized):
+            return FastPathResult(answer=reply)
+    return None
@@ -0,0 +1,192 @@
+"""
+Single-flight coalescing for the premium flow
+
+Concurrent premium requests for the same question share one retrieval and
+synthesis pipeline. The first request (the leader) runs the pipeline; every
+request that arrives while it is in flight subscribes to it, and each frame
+the pipeline emits is fanned out to all subscribed WebSockets.
+"""
+
+import asyncio
+import re
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from config import setup_logging
+from frames import encode
+
+logger = setup_logging()
+
+Send = Callable[[str], Awaitable[None]]
+Emit = Callable[[dict], Awaitable[None]]
+
+
+@dataclass
+class CoalescingStats:
+    requests: int = 0
+    leaders: int = 0
+    coalesced: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.coalesced / self.requests if self.requests else 0.0
+
+    def as_dict(self) -> dict:
+        stats = asdict(self)
+        stats["hit_rate"] = round(self.hit_rate, 3)
+        return stats
+
+
+class _Subscriber:
+    """
+    One waiting request. Frames broadcast before it has caught up are
+    buffered, so they reach the client after the replay, in order.
+    """
+
+    def __init__(self, client_id: str, send: Send):
+        self.client_id = client_id
+        self.send = send
+        self.caught_up = False
+        self.pending: List[str] = []
+
+
+class _Flight:
+    """One in-flight pipeline and the clients waiting on it."""
+
+    def __init__(self):
+        # Keyed by a per-request token so one client can wait on a flight twice.
+        self.subscribers: Dict[object, _Subscriber] = {}
+        self.done = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        # Enough state to bring a late subscriber up to date.
+        self.last_status: Optional[str] = None
+        self.results: Dict[str, str] = {}
+        self.answer_so_far: List[str] = []
+
+    async def broadcast(self, frame: dict) -> None:
+        message = encode(frame)
+        status = frame.get("status")
+        if status == "premium_token":
+            self.answer_so_far.append(frame["delta"])
+        elif status in ("videos", "documents"):
+            self.results[status] = message
+        else:
+            self.last_status = message
+
+        for token, subscriber in list(self.subscribers.items()):
+            if not subscriber.caught_up:
+                subscriber.pending.append(message)
+                continue
+            try:
+                await subscriber.send(message)
+            except Exception as e:
+                logger.error(
+                    f"Coalescing: Failed to send to client {subscriber.client_id}, unsubscribing: {e}"
+                )
+                self.subscribers.pop(token, None)
+
+    def replay(self) -> List[str]:
+        """The frames that bring a new subscriber up to date, as of now."""
+        messages = [self.last_status] if self.last_status else []
+        messages.extend(self.results.values())
+        if self.answer_so_far:
+            messages.append(
+                encode(
+                    {"status": "premium_token", "delta": "".join(self.answer_so_far)}
+                )
+            )
+        return messages
+
+
+class PremiumFlightGroup:
+    """Runs at most one premium pipeline per normalized question at a time."""
+
+    def __init__(self):
+        self.stats = CoalescingStats()
+        self._flights: Dict[str, _Flight] = {}
+
+    @staticmethod
+    def key(question: str) -> str:
+        return re.sub(r"\s+", " ", question.strip().lower()).rstrip("?!. ")
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._flights
+
+    async def run(
+        self,
+        key: str,
+        client_id: str,
+        send: Send,
+        pipeline: Callable[[Emit], Awaitable[None]],
+    ) -> None:
+        """
+        Deliver the premium frames for `key` to `send`.
+
+        Starts `pipeline` if nothing is in flight for the key, otherwise joins
+        the running one. Returns once the pipeline has finished. The pipeline
+        runs in its own task: cancelling one waiting request only unsubscribes
+        it, and the pipeline is cancelled once nobody is waiting for it.
+        """
+        self.stats.requests += 1
+        started = encode(
+            {
+                "status": "premium_started",
+                "message": "Starting premium response generation...",
+            }
+        )
+
+        # Join or start the flight and subscribe without yielding to the loop,
+        # so no frame can be broadcast between the replay snapshot and the
+        # subscription.
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.stats.coalesced += 1
+            backlog = flight.replay()
+            logger.info(
+                f"Coalescing: client {client_id} joined in-flight request. {self.stats.as_dict()}"
+            )
+        else:
+            self.stats.leaders += 1
+            backlog = []
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._drive(key, flight, pipeline))
+        token = object()
+        subscriber = _Subscriber(client_id, send)
+        flight.subscribers[token] = subscriber
+
+        try:
+            try:
+                for message in [started, *backlog]:
+                    await send(message)
+                # Frames broadcast while the replay was going out.
+                while subscriber.pending:
+                    await send(subscriber.pending.pop(0))
+            except Exception as e:
+                logger.error(
+                    f"Coalescing: Failed to send initial message to client {client_id}: {e}"
+                )
+                return
+            subscriber.caught_up = True
+            await flight.done.wait()
+        finally:
+            flight.subscribers.pop(token, None)
+            if not flight.done.is_set() and not flight.subscribers:
+                logger.info(f"Coalescing: no clients left for '{key}', cancelling.")
+                flight.task.cancel()
+                # A task cancelled before it starts never runs `_drive`'s cleanup.
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    async def _drive(
+        self, key: str, flight: _Flight, pipeline: Callable[[Emit], Awaitable[None]]
+    ) -> None:
+        try:
+            await pipeline(flight.broadcast)
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.done.set()
+
+
+premium_flights = PremiumFlightGroup()
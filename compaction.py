@@ -0,0 +1,238 @@
+"""
+Token-budgeted history compaction
+
+Long conversations are sent to Gemini as a rolling summary of the older turns
+followed by the most recent turns verbatim. Summaries are cached per session
+and extended incrementally, so a prefix that has been summarized once is never
+sent to the model uncompressed again.
+"""
+
+import asyncio
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import List, Optional, Tuple
+
+from google.genai import types
+from google.genai.types import Content, Part
+
+from config import get_settings, setup_logging
+from llm import LLMClient
+
+logger = setup_logging()
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+SUMMARY_PROMPT = """
+    You maintain a running summary of a conversation between a user and an AI
+    assistant answering questions about Thought Leaders videos and documents.
+    Update the summary with the new turns. Keep names, partners, products,
+    figures and open questions; drop greetings and filler. Reply with the
+    updated summary only.
+
+    Current summary:
+    {summary}
+
+    New turns:
+    {transcript}
+"""
+
+
+def _text(content: Content) -> str:
+    return "".join(part.text or "" for part in content.parts or [])
+
+
+def _fingerprint(content: Content) -> str:
+    return hashlib.sha1(f"{content.role}\x00{_text(content)}".encode()).hexdigest()
+
+
+class TokenCounter:
+    """
+    Counts tokens locally. Uses the Gemini SentencePiece tokenizer when the
+    optional `sentencepiece` dependency is installed, otherwise estimates
+    from character length.
+    """
+
+    CHARS_PER_TOKEN = 4
+
+    def __init__(self, tokenizer=None):
+        self._tokenizer = tokenizer
+
+    @classmethod
+    async def create(cls, model_name: str):
+        try:
+            from google.genai.local_tokenizer import LocalTokenizer
+
+            # Loading fetches the tokenizer model on first use.
+            tokenizer = await asyncio.to_thread(LocalTokenizer, model_name=model_name)
+            await asyncio.to_thread(tokenizer.count_tokens, "warm up")
+            logger.info(f"TokenCounter: using local tokenizer for {model_name}.")
+            return cls(tokenizer)
+        except Exception as e:
+            logger.info(f"TokenCounter: local tokenizer unavailable ({e}), estimating.")
+            return cls()
+
+    def count(self, contents: List[Content]) -> int:
+        if not contents:
+            return 0
+        if self._tokenizer is not None:
+            return self._tokenizer.count_tokens(contents).total_tokens
+        chars = sum(len(_text(content)) for content in contents)
+        return -(-chars // self.CHARS_PER_TOKEN)
+
+
+@dataclass
+class _Summary:
+    text: str
+    # Fingerprints of the last two summarized turns; locates where the
+    # unsummarized turns start even after the front of the history is trimmed.
+    anchor: Tuple[str, ...]
+
+
+@dataclass
+class CompactionStats:
+    turns: int = 0
+    compacted_turns: int = 0
+    summary_calls: int = 0
+    summary_cache_hits: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    def as_dict(self) -> dict:
+        stats = asdict(self)
+        stats["tokens_saved"] = self.tokens_before - self.tokens_after
+        return stats
+
+
+class HistoryCompactor:
+    """Fits chat history into a token budget with a cached rolling summary."""
+
+    def __init__(
+        self,
+        llm_client: LLMClient,
+        token_counter: TokenCounter,
+        token_budget: int,
+        keep_recent_turns: int,
+        summary_max_tokens: int,
+        max_sessions: int,
+    ):
+        self.llm_client = llm_client
+        self.token_counter = token_counter
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.summary_max_tokens = summary_max_tokens
+        self.max_sessions = max_sessions
+        self.stats = CompactionStats()
+        self._summaries: "OrderedDict[str, _Summary]" = OrderedDict()
+
+    @classmethod
+    async def create(cls, llm_client: LLMClient):
+        settings = get_settings().history
+        token_counter = await TokenCounter.create(get_settings().llm.gcp_model)
+        return cls(
+            llm_client,
+            token_counter,
+            token_budget=settings.token_budget,
+            keep_recent_turns=settings.keep_recent_turns,
+            summary_max_tokens=settings.summary_max_tokens,
+            max_sessions=get_settings().sessions.max_sessions,
+        )
+
+    async def compact(self, session_key: str, history: List[Content]) -> List[Content]:
+        """
+        Return the history to send to the model. Always a new list, so callers
+        can append to it without touching the stored history.
+        """
+        self.stats.turns += 1
+        tokens = self.token_counter.count(history)
+        if len(history) <= self.keep_recent_turns or tokens <= self.token_budget:
+            return list(history)
+
+        split = len(history) - self.keep_recent_turns
+        # Keep whole exchanges: the verbatim part starts on a user turn.
+        while split < len(history) and history[split].role != "user":
+            split += 1
+        older, recent = history[:split], history[split:]
+        if not older:
+            return list(history)
+
+        fingerprints = [_fingerprint(content) for content in older]
+        cached, start = self._locate_summary(session_key, fingerprints)
+        compacted = None
+        if cached is not None:
+            # Turns after the summarized prefix can ride along verbatim until
+            # they no longer fit; only then is the summary extended.
+            candidate = [self._summary_content(cached.text)] + older[start:] + recent
+            if (
+                start == len(older)
+                or self.token_counter.count(candidate) <= self.token_budget
+            ):
+                self.stats.summary_cache_hits += 1
+                compacted = candidate
+        if compacted is None:
+            previous = cached.text if cached is not None else "(none)"
+            summary = await self._summarize(
+                session_key, previous, older[start:], fingerprints
+            )
+            compacted = [self._summary_content(summary)] + recent
+
+        self.stats.compacted_turns += 1
+        self.stats.tokens_before += tokens
+        self.stats.tokens_after += self.token_counter.count(compacted)
+        logger.info(
+            f"HistoryCompactor: compacted {len(older)} older turns for {session_key}. "
+            f"{self.stats.as_dict()}"
+        )
+        return compacted
+
+    def forget(self, session_key: str) -> None:
+        self._summaries.pop(session_key, None)
+
+    @staticmethod
+    def _summary_content(summary: str) -> Content:
+        return Content(role="user", parts=[Part.from_text(text=SUMMARY_PREFIX + summary)])
+
+    def _locate_summary(
+        self, session_key: str, fingerprints: List[str]
+    ) -> Tuple[Optional[_Summary], int]:
+        """
+        Find the session's cached summary and the index of the first older turn
+        it does not cover. Returns (None, 0) when there is no usable summary.
+        """
+        cached = self._summaries.get(session_key)
+        if cached is None:
+            return None, 0
+        self._summaries.move_to_end(session_key)
+        n = len(cached.anchor)
+        for end in range(len(fingerprints), n - 1, -1):
+            if tuple(fingerprints[end - n : end]) == cached.anchor:
+                return cached, end
+        return None, 0
+
+    async def _summarize(
+        self,
+        session_key: str,
+        previous: str,
+        turns: List[Content],
+        fingerprints: List[str],
+    ) -> str:
+        """Fold `turns` into the previous summary with one Gemini call."""
+        transcript = "\n".join(
+            f"{'User' if content.role == 'user' else 'Assistant'}: {_text(content)}"
+            for content in turns
+        )
+        response = await self.llm_client.generate_content(
+            stage="summary",
+            contents=SUMMARY_PROMPT.format(summary=previous, transcript=transcript),
+            config=types.GenerateContentConfig(
+                temperature=0.2, max_output_tokens=self.summary_max_tokens
+            ),
+        )
+        self.stats.summary_calls += 1
+        text = (response.text or "").strip() or previous
+
+        self._summaries[session_key] = _Summary(text, tuple(fingerprints[-2:]))
+        self._summaries.move_to_end(session_key)
+        while len(self._summaries) > self.max_sessions:
+            self._summaries.popitem(last=False)
+        return text
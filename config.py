@@ -6,7 +6,7 @@ import os
 from dotenv import load_dotenv
 import logging
 from functools import lru_cache
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 load_dotenv(dotenv_path="../.env")
 
@@ -31,7 +31,13 @@ def _get_config_variable(variable_name: str, default_value: str) -> str:
     return variable_value
 
 
-class SearchEngineSettings(BaseModel):
+class _EnvSettings(BaseModel):
+    # Defaults come from the environment as strings; validate them so that
+    # "False" becomes False and "1024" becomes 1024.
+    model_config = ConfigDict(validate_default=True)
+
+
+class SearchEngineSettings(_EnvSettings):
     project_number: str = _get_config_variable("GCP_PROJECT_NUMBER", "176935887576")
     engine_id: str = _get_config_variable(
         "VERTEXAI_SEARCH_ENGINE_ID", "datasense-test_1744153572996"
@@ -39,7 +45,7 @@ class SearchEngineSettings(BaseModel):
     location: str = _get_config_variable("SEARCH_ENGINE_LOCATION", "global")
 
 
-class LLMSettings(BaseModel):
+class LLMSettings(_EnvSettings):
     """
     LLM specific configuration
     """
@@ -57,13 +63,45 @@ class LLMSettings(BaseModel):
         "MODEL_MAX_OUTPUT_TOKENS", "1024"
     )
 
+    # Stream the premium answer over the WebSocket as it is synthesized. The
+    # field validates its own default, so "False" is False whatever the
+    # model config says.
+    synthesis_streaming: bool = Field(
+        default=_get_config_variable("SYNTHESIS_STREAMING", "True"),
+        validate_default=True,
+    )
+
+    # Call resilience: timeouts, retries, hedging and the circuit breaker
+    call_timeout_seconds: float = _get_config_variable("LLM_CALL_TIMEOUT_SECONDS", "30")
+    max_retries: int = _get_config_variable("LLM_MAX_RETRIES", "2")
+    retry_base_delay_seconds: float = _get_config_variable(
+        "LLM_RETRY_BASE_DELAY_SECONDS", "0.5"
+    )
+    retry_max_delay_seconds: float = _get_config_variable(
+        "LLM_RETRY_MAX_DELAY_SECONDS", "4"
+    )
+    hedge_enabled: bool = _get_config_variable("LLM_HEDGE_ENABLED", "True")
+    # Send the duplicate once a call is slower than this percentile of recent calls
+    hedge_percentile: float = _get_config_variable("LLM_HEDGE_PERCENTILE", "95")
+    hedge_min_delay_seconds: float = _get_config_variable(
+        "LLM_HEDGE_MIN_DELAY_SECONDS", "1"
+    )
+    breaker_failure_rate: float = _get_config_variable(
+        "LLM_BREAKER_FAILURE_RATE", "0.5"
+    )
+    breaker_window: int = _get_config_variable("LLM_BREAKER_WINDOW", "20")
+    breaker_min_calls: int = _get_config_variable("LLM_BREAKER_MIN_CALLS", "10")
+    breaker_open_seconds: float = _get_config_variable("LLM_BREAKER_OPEN_SECONDS", "30")
+    # Used while the breaker is open; empty to fail fast instead
+    fallback_model: str = _get_config_variable("LLM_FALLBACK_MODEL", "gemini-2.5-flash")
+
     system_instruction: str = _get_config_variable(
         "SYSTEM_INSTRUCTION",
         "You are an AI assistant for question-answering tasks. If a user ask a question, respond to the user and also set the premium_applicable as true. If it is not a question, set the premium_applicable as false.",
     )
 
 
-class DatabaseSettings(BaseModel):
+class DatabaseSettings(_EnvSettings):
     """
     Database specific configuration
     """
@@ -81,14 +119,227 @@ class DatabaseSettings(BaseModel):
     )
     embedding_vector_size: int = _get_config_variable("EMBEDDING_VECTOR_SIZE", "768")
     embedding_model: str = _get_config_variable("EMBEDDING_MODEL", "text-embedding-005")
+    # ANN index on the video embeddings: hnsw, ivfflat, ivf, scann or exact
+    index_type: str = _get_config_variable("VECTOR_INDEX_TYPE", "hnsw")
+    # ivfflat/ivf: clusters built, and clusters scanned per query
+    index_lists: int = _get_config_variable("VECTOR_INDEX_LISTS", "100")
+    index_probes: int = _get_config_variable("VECTOR_INDEX_PROBES", "10")
+    hnsw_m: int = _get_config_variable("VECTOR_INDEX_HNSW_M", "16")
+    hnsw_ef_construction: int = _get_config_variable(
+        "VECTOR_INDEX_HNSW_EF_CONSTRUCTION", "64"
+    )
+    hnsw_ef_search: int = _get_config_variable("VECTOR_INDEX_HNSW_EF_SEARCH", "40")
+    scann_num_leaves: int = _get_config_variable("VECTOR_INDEX_SCANN_LEAVES", "100")
+    scann_leaves_to_search: int = _get_config_variable(
+        "VECTOR_INDEX_SCANN_LEAVES_TO_SEARCH", "10"
+    )
+    # hnsw/ivfflat: keep scanning the index until filtered searches have k
+    # rows (pgvector 0.8+): off, strict_order or relaxed_order. ivfflat only
+    # supports relaxed_order, which it uses for either mode.
+    iterative_scan: str = _get_config_variable(
+        "VECTOR_INDEX_ITERATIVE_SCAN", "relaxed_order"
+    )
+    # "vector", or "hybrid" to fuse full-text matches with the nearest vectors
+    search_mode: str = _get_config_variable("VECTOR_SEARCH_MODE", "hybrid")
+    # Candidates taken from each side of a hybrid search before fusion
+    hybrid_candidates: int = _get_config_variable("VECTOR_HYBRID_CANDIDATES", "20")
+    hybrid_rrf_k: int = _get_config_variable("VECTOR_HYBRID_RRF_K", "60")
+    text_search_language: str = _get_config_variable(
+        "VECTOR_TEXT_SEARCH_LANGUAGE", "english"
+    )
+    # Videos returned by a vector search, and the lowest cosine similarity kept
+    search_k: int = _get_config_variable("VECTOR_SEARCH_K", "3")
+    min_score: float = _get_config_variable("VECTOR_SEARCH_MIN_SCORE", "0.0")
+
+
+class EmbeddingCacheSettings(_EnvSettings):
+    """
+    Query-embedding cache configuration
+    """
+
+    enabled: bool = _get_config_variable("EMBEDDING_CACHE_ENABLED", "True")
+    max_entries: int = _get_config_variable("EMBEDDING_CACHE_MAX_ENTRIES", "10000")
+    # SQLite file for a persistent second tier; empty keeps embeddings in memory only
+    disk_path: str = _get_config_variable("EMBEDDING_CACHE_DISK_PATH", "")
+
+
+class CacheSettings(_EnvSettings):
+    """
+    Semantic answer cache configuration
+    """
+
+    enabled: bool = _get_config_variable("SEMANTIC_CACHE_ENABLED", "True")
+    similarity_threshold: float = _get_config_variable(
+        "SEMANTIC_CACHE_SIMILARITY_THRESHOLD", "0.95"
+    )
+    ttl_seconds: float = _get_config_variable("SEMANTIC_CACHE_TTL_SECONDS", "3600")
+    max_entries: int = _get_config_variable("SEMANTIC_CACHE_MAX_ENTRIES", "1000")
+    max_bytes: int = _get_config_variable("SEMANTIC_CACHE_MAX_BYTES", "67108864")
+    # Only cache turns without earlier conversation; follow-ups depend on context.
+    standalone_only: bool = _get_config_variable(
+        "SEMANTIC_CACHE_STANDALONE_ONLY", "True"
+    )
+
+
+class PremiumSettings(_EnvSettings):
+    """
+    Premium (RAG) flow configuration
+    """
+
+    # Start retrieval alongside the normal answer instead of after it
+    speculative_retrieval: bool = _get_config_variable(
+        "PREMIUM_SPECULATIVE_RETRIEVAL", "False"
+    )
+
+    # Background task scheduling
+    max_workers: int = _get_config_variable("PREMIUM_MAX_WORKERS", "8")
+    max_queue: int = _get_config_variable("PREMIUM_MAX_QUEUE", "64")
+    per_client_limit: int = _get_config_variable("PREMIUM_PER_CLIENT_LIMIT", "2")
+
+
+class ModelRoutingSettings(_EnvSettings):
+    """
+    Per-stage Gemini models and the per-turn routing policy
+    """
+
+    # The normal answer (which also carries the premium classification) goes
+    # to the light model for simple turns and the answer model otherwise.
+    routing_enabled: bool = _get_config_variable("MODEL_ROUTING_ENABLED", "True")
+    answer_model: str = _get_config_variable(
+        "ANSWER_MODEL", _get_config_variable("GCP_MODEL", "gemini-2.5-pro")
+    )
+    light_model: str = _get_config_variable("LIGHT_MODEL", "gemini-2.5-flash")
+    synthesis_model: str = _get_config_variable(
+        "SYNTHESIS_MODEL", _get_config_variable("GCP_MODEL", "gemini-2.5-pro")
+    )
+    summary_model: str = _get_config_variable("SUMMARY_MODEL", "gemini-2.5-flash")
+    # Complexity score (0-1) at or above which a turn gets the answer model
+    complexity_threshold: float = _get_config_variable(
+        "MODEL_ROUTING_COMPLEXITY_THRESHOLD", "0.4"
+    )
+    # Use the light model while the answer model's p95 latency is above this
+    latency_budget_seconds: float = _get_config_variable(
+        "MODEL_ROUTING_LATENCY_BUDGET_SECONDS", "8"
+    )
+    # USD per million input/output tokens, for the cost metrics
+    model_prices: str = _get_config_variable(
+        "MODEL_PRICES", "gemini-2.5-pro=1.25/10,gemini-2.5-flash=0.30/2.50"
+    )
+
+
+class PromptCacheSettings(_EnvSettings):
+    """
+    Provider-side caching of static system prompts
+    """
+
+    enabled: bool = _get_config_variable("PROMPT_CACHE_ENABLED", "True")
+    # Comma-separated stages whose system instruction is static
+    stages: str = _get_config_variable("PROMPT_CACHE_STAGES", "synthesis")
+    ttl_seconds: float = _get_config_variable("PROMPT_CACHE_TTL_SECONDS", "3600")
+
+
+class ContextSettings(_EnvSettings):
+    """
+    Synthesis context packing configuration
+    """
+
+    packing_enabled: bool = _get_config_variable("CONTEXT_PACKING_ENABLED", "True")
+    token_budget: int = _get_config_variable("CONTEXT_TOKEN_BUDGET", "3000")
+    # Estimated Jaccard similarity at which two passages count as duplicates
+    duplicate_threshold: float = _get_config_variable(
+        "CONTEXT_DUPLICATE_THRESHOLD", "0.8"
+    )
+    shingle_size: int = _get_config_variable("CONTEXT_SHINGLE_SIZE", "5")
+    minhash_permutations: int = _get_config_variable(
+        "CONTEXT_MINHASH_PERMUTATIONS", "64"
+    )
+
+
+class RerankSettings(_EnvSettings):
+    """
+    Local reranking of premium retrieval candidates
+    """
+
+    enabled: bool = _get_config_variable("RERANK_ENABLED", "True")
+    # How many candidates to over-fetch from each source when reranking
+    video_candidates: int = _get_config_variable("RERANK_VIDEO_CANDIDATES", "8")
+    document_candidates: int = _get_config_variable("RERANK_DOCUMENT_CANDIDATES", "10")
+    # How many of each are shown to the user
+    video_results: int = _get_config_variable("RERANK_VIDEO_RESULTS", "3")
+    document_results: int = _get_config_variable("RERANK_DOCUMENT_RESULTS", "5")
+    # How many candidates of both sources together go to synthesis
+    top_n: int = _get_config_variable("RERANK_TOP_N", "6")
+    lexical_weight: float = _get_config_variable("RERANK_LEXICAL_WEIGHT", "0.4")
+
+
+class SessionSettings(_EnvSettings):
+    """
+    Server-side chat session configuration
+    """
+
+    backend: str = _get_config_variable("SESSION_BACKEND", "memory")
+    sqlite_path: str = _get_config_variable("SESSION_SQLITE_PATH", "sessions.db")
+    max_sessions: int = _get_config_variable("SESSION_MAX_SESSIONS", "10000")
+    max_turns: int = _get_config_variable("SESSION_MAX_TURNS", "50")
+    idle_ttl_seconds: float = _get_config_variable("SESSION_IDLE_TTL_SECONDS", "3600")
+
+
+class HistorySettings(_EnvSettings):
+    """
+    Chat history compaction configuration
+    """
+
+    enabled: bool = _get_config_variable("HISTORY_COMPACTION_ENABLED", "True")
+    token_budget: int = _get_config_variable("HISTORY_TOKEN_BUDGET", "8000")
+    keep_recent_turns: int = _get_config_variable("HISTORY_KEEP_RECENT_TURNS", "6")
+    summary_max_tokens: int = _get_config_variable("HISTORY_SUMMARY_MAX_TOKENS", "512")
+
+
+class BrokerSettings(_EnvSettings):
+    """
+    WebSocket message broker configuration
+    """
+
+    # "memory" for a single worker, "redis" to deliver across workers/instances
+    backend: str = _get_config_variable("BROKER_BACKEND", "memory")
+    redis_url: str = _get_config_variable("BROKER_REDIS_URL", "redis://localhost:6379/0")
+    channel_prefix: str = _get_config_variable("BROKER_CHANNEL_PREFIX", "datasense")
+
+
+class StartupSettings(_EnvSettings):
+    """
+    Application startup configuration
+    """
+
+    # "blocking" finishes backend initialization before serving requests;
+    # "background" serves /health/live immediately and initializes behind it.
+    mode: str = _get_config_variable("STARTUP_MODE", "blocking")
+    warm_up: bool = _get_config_variable("STARTUP_WARM_UP", "True")
+    # How long a chat request waits for a background startup before a 503
+    ready_timeout_seconds: float = _get_config_variable(
+        "STARTUP_READY_TIMEOUT_SECONDS", "30"
+    )
 
 
 class Settings(BaseModel):
     """Main settings class combining all sub-settings."""
 
     llm: LLMSettings = Field(default_factory=LLMSettings)
+    routing: ModelRoutingSettings = Field(default_factory=ModelRoutingSettings)
+    prompt_cache: PromptCacheSettings = Field(default_factory=PromptCacheSettings)
+    rerank: RerankSettings = Field(default_factory=RerankSettings)
+    context: ContextSettings = Field(default_factory=ContextSettings)
     database: DatabaseSettings = Field(default_factory=DatabaseSettings)
     search_engine: SearchEngineSettings = Field(default_factory=SearchEngineSettings)
+    cache: CacheSettings = Field(default_factory=CacheSettings)
+    embedding_cache: EmbeddingCacheSettings = Field(
+        default_factory=EmbeddingCacheSettings
+    )
+    premium: PremiumSettings = Field(default_factory=PremiumSettings)
+    sessions: SessionSettings = Field(default_factory=SessionSettings)
+    history: HistorySettings = Field(default_factory=HistorySettings)
+    broker: BrokerSettings = Field(default_factory=BrokerSettings)
+    startup: StartupSettings = Field(default_factory=StartupSettings)
 
 
 @lru_cache
@@ -0,0 +1,266 @@
+"""
+Token-budgeted context packing for synthesis
+
+Retrieved video transcripts and PDF segments often overlap: the same
+paragraph comes back from several extractive segments, and transcripts of
+re-cut videos repeat each other. `ContextPacker` splits the results into
+passages, ranks them (by reranker relevance, or by overlap with the question),
+drops near-duplicates of better-ranked passages (MinHash over word shingles)
+and packs the rest into a token budget with a compact one-line header per
+passage, instead of indented JSON.
+"""
+
+import json
+import re
+import zlib
+from dataclasses import dataclass, asdict
+from typing import List, Optional
+
+import numpy as np
+
+from config import get_settings, setup_logging
+from datasense_types import Document, VideoRecord
+from reranking import reranker
+
+logger = setup_logging()
+
+CHARS_PER_TOKEN = 4
+VIDEO_FIELDS = ["video_file_path", "partner", "file_name", "thumbnail_uri"]
+
+_WORD = re.compile(r"\w+")
+_MERSENNE_PRIME = (1 << 31) - 1
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+@dataclass
+class Passage:
+    headers: List[str]
+    text: str
+    rank: int
+    score: float = 0.0
+    # Relevance from the reranker, when it ran
+    prior: Optional[float] = None
+
+    def render(self) -> str:
+        return "\n".join([*self.headers, self.text])
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens_before: int
+    tokens_after: int
+    duplicates_removed: int
+    dropped_for_budget: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(self.tokens_before - self.tokens_after, 0)
+
+
+@dataclass
+class ContextPackingStats:
+    requests: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+    duplicates_removed: int = 0
+    dropped_for_budget: int = 0
+
+    def as_dict(self) -> dict:
+        stats = asdict(self)
+        stats["tokens_saved"] = self.tokens_before - self.tokens_after
+        stats["tokens_saved_per_request"] = (
+            round(stats["tokens_saved"] / self.requests, 1) if self.requests else 0.0
+        )
+        return stats
+
+
+class MinHasher:
+    """MinHash signatures over word shingles, vectorized with numpy."""
+
+    def __init__(self, permutations: int, shingle_size: int, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _MERSENNE_PRIME, permutations, dtype=np.int64)
+        self.b = rng.integers(0, _MERSENNE_PRIME, permutations, dtype=np.int64)
+        self.shingle_size = shingle_size
+
+    def signature(self, text: str) -> np.ndarray:
+        words = _WORD.findall(text.lower())
+        k = self.shingle_size
+        shingles = {
+            " ".join(words[i : i + k]) for i in range(max(len(words) - k + 1, 1))
+        }
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode()) & _MERSENNE_PRIME for s in shingles),
+            dtype=np.int64,
+            count=len(shingles),
+        )
+        # a < 2^31 and hashes < 2^31, so the products fit in int64.
+        return ((np.outer(hashes, self.a) + self.b) % _MERSENNE_PRIME).min(axis=0)
+
+
+class ContextPacker:
+    def __init__(
+        self,
+        enabled: bool,
+        token_budget: int,
+        duplicate_threshold: float,
+        shingle_size: int,
+        permutations: int,
+    ):
+        self.enabled = enabled
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+        self.hasher = MinHasher(permutations, shingle_size)
+        self.stats = ContextPackingStats()
+
+    @classmethod
+    def from_settings(cls):
+        settings = get_settings().context
+        return cls(
+            enabled=settings.packing_enabled,
+            token_budget=settings.token_budget,
+            duplicate_threshold=settings.duplicate_threshold,
+            shingle_size=settings.shingle_size,
+            permutations=settings.minhash_permutations,
+        )
+
+    def as_dict(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "token_budget": self.token_budget,
+            **self.stats.as_dict(),
+        }
+
+    def pack(
+        self,
+        question: str,
+        video_context: List[VideoRecord],
+        documents: List[Document],
+        baseline_text: Optional[str] = None,
+    ) -> PackedContext:
+        """
+        Pack the retrieved context for `question`. `baseline_text` is the
+        unpacked serialization, used only to report the tokens saved.
+        """
+        passages = self._passages(video_context, documents)
+        self._rank(question, passages)
+        unique = self._deduplicate(passages)
+        kept, dropped = self._fit(unique)
+        text = "\n\n".join(passage.render() for passage in kept)
+
+        packed = PackedContext(
+            text=text,
+            tokens_before=estimate_tokens(baseline_text or ""),
+            tokens_after=estimate_tokens(text),
+            duplicates_removed=len(passages) - len(unique),
+            dropped_for_budget=dropped,
+        )
+        self.stats.requests += 1
+        self.stats.tokens_before += packed.tokens_before
+        self.stats.tokens_after += packed.tokens_after
+        self.stats.duplicates_removed += packed.duplicates_removed
+        self.stats.dropped_for_budget += packed.dropped_for_budget
+        logger.info(
+            f"ContextPacker: {packed.tokens_before} -> {packed.tokens_after} tokens "
+            f"({packed.tokens_saved} saved, {packed.duplicates_removed} duplicates, "
+            f"{packed.dropped_for_budget} over budget)"
+        )
+        return packed
+
+    @staticmethod
+    def _passages(
+        video_context: List[VideoRecord], documents: List[Document]
+    ) -> List[Passage]:
+        passages = []
+        for video in video_context:
+            metadata = {field: getattr(video, field) for field in VIDEO_FIELDS}
+            header = "[video] " + json.dumps(metadata, separators=(",", ":"))
+            passages.append(
+                Passage(
+                    [header],
+                    video.page_content,
+                    len(passages),
+                    prior=video.score if reranker.enabled else None,
+                )
+            )
+        for doc in documents:
+            header = f"[document] {doc.title} (page {doc.page_number})"
+            # search.py joins a document's extractive segments with newlines.
+            for segment in (doc.segment_content or "").split("\n"):
+                if segment.strip():
+                    passages.append(
+                        Passage(
+                            [header],
+                            segment.strip(),
+                            len(passages),
+                            prior=doc.score if reranker.enabled else None,
+                        )
+                    )
+        return passages
+
+    def _deduplicate(self, passages: List[Passage]) -> List[Passage]:
+        """
+        Keep the best-ranked of every group of near-identical passages. A dropped
+        video's header moves to the kept passage, so its links still reach
+        the model.
+        """
+        kept: List[Passage] = []
+        signatures: List[np.ndarray] = []
+        for passage in passages:
+            signature = self.hasher.signature(passage.text)
+            if signatures:
+                similarity = (np.vstack(signatures) == signature).mean(axis=1)
+                best = int(similarity.argmax())
+                if similarity[best] >= self.duplicate_threshold:
+                    original = kept[best]
+                    original.headers += [
+                        header
+                        for header in passage.headers
+                        if header.startswith("[video]") and header not in original.headers
+                    ]
+                    continue
+            kept.append(passage)
+            signatures.append(signature)
+        return kept
+
+    @staticmethod
+    def _rank(question: str, passages: List[Passage]) -> None:
+        """
+        Order by reranker relevance when every passage has one, otherwise by
+        the share of question words a passage contains.
+        """
+        terms = {word for word in _WORD.findall(question.lower()) if len(word) > 2}
+        use_prior = all(passage.prior is not None for passage in passages)
+        for passage in passages:
+            if use_prior:
+                passage.score = passage.prior
+                continue
+            words = set(_WORD.findall(passage.text.lower()))
+            passage.score = len(terms & words) / len(terms) if terms else 0.0
+        passages.sort(key=lambda passage: (-passage.score, passage.rank))
+
+    def _fit(self, passages: List[Passage]):
+        """Greedily take passages in rank order while they fit the budget."""
+        kept, dropped, used = [], 0, 0
+        for passage in passages:
+            cost = estimate_tokens(passage.render()) + 1
+            if used + cost <= self.token_budget:
+                kept.append(passage)
+                used += cost
+            elif not kept:
+                # Never send an empty context: trim the best passage to fit.
+                headers = "\n".join(passage.headers)
+                room = max(self.token_budget - estimate_tokens(headers) - 1, 0)
+                passage.text = passage.text[: room * CHARS_PER_TOKEN]
+                kept.append(passage)
+                used = self.token_budget
+            else:
+                dropped += 1
+        return kept, dropped
+
+
+context_packer = ContextPacker.from_settings()
@@ -1,23 +1,45 @@
 from langchain_community.document_loaders.csv_loader import CSVLoader
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_google_alloydb_pg import AlloyDBEngine, AlloyDBVectorStore
 from langchain_google_vertexai import VertexAIEmbeddings
-import pandas as pd
-from langchain_google_alloydb_pg.indexes import IVFFlatIndex
 
-from typing import Any, List, Tuple
+import json
+import re
+from datetime import datetime, timezone
+from typing import Any, List, Optional, Tuple
 from sqlalchemy import text, inspect
 
 from config import setup_logging, get_settings
+from datasense_types import SearchFilters, VideoRecord
+from embedding_cache import CachedEmbeddings
+from telemetry import stage
+from vector_index import IndexConfig, set_config_statement
 
 logger = setup_logging()
 
+# Column names of the table created by `init_vectorstore_table`
+CONTENT_COLUMN = "content"
+EMBEDDING_COLUMN = "embedding"
+METADATA_COLUMN = "langchain_metadata"
+ID_COLUMN = "langchain_id"
+# Full-text search columns added by `create_text_index`: names and
+# transcript, and the partner and file names alone
+TEXT_SEARCH_COLUMN = "content_tsv"
+NAMES_SEARCH_COLUMN = "names_tsv"
+# Metadata fields searches can filter on, indexed by `create_filter_indexes`
+FILTER_FIELDS = ("partner", "file_name", "created_at")
+
 
 class VectorStore:
     """A class for managing vector operations and database interactions."""
 
     def __init__(
-        self, engine: AlloyDBEngine, vector_store: AlloyDBVectorStore, settings: dict
+        self,
+        engine: AlloyDBEngine,
+        vector_store: AlloyDBVectorStore,
+        settings: dict,
+        embedding_service: Optional[Embeddings] = None,
     ):
         """
         Private constructor. Use the `create` classmethod for initialization.
@@ -25,6 +47,14 @@ class VectorStore:
         self.engine = engine
         self.vector_store = vector_store
         self.settings = settings
+        self.embedding_service = embedding_service
+        self.index_config = IndexConfig.from_settings()
+        # Hybrid retrieval needs the full-text column; `create` checks for it.
+        self.hybrid = False
+        # Set when the embedding service is wrapped in the query-embedding cache
+        self.embedding_cache = (
+            embedding_service if isinstance(embedding_service, CachedEmbeddings) else None
+        )
         logger.info("VectorStore instance configured.")
 
     @classmethod
@@ -49,6 +79,10 @@ class VectorStore:
             embedding_service = VertexAIEmbeddings(
                 model_name=settings.embedding_model, project=settings.db_project
             )
+            if get_settings().embedding_cache.enabled:
+                embedding_service = CachedEmbeddings.from_settings(
+                    embedding_service, settings.embedding_model
+                )
 
             vector_store = await AlloyDBVectorStore.create(
                 engine,
@@ -58,7 +92,19 @@ class VectorStore:
 
             logger.info("Async VectorStore initialized successfully.")
             # Create and return an instance of the class with the live connections.
-            return cls(engine, vector_store, settings)
+            instance = cls(engine, vector_store, settings, embedding_service)
+            if settings.search_mode == "hybrid":
+                instance.hybrid = await engine._run_as_async(
+                    instance._has_text_search_columns()
+                )
+                if not instance.hybrid:
+                    logger.warning(
+                        f"VECTOR_SEARCH_MODE is hybrid but '{settings.table}' lacks the "
+                        f"{TEXT_SEARCH_COLUMN} or {NAMES_SEARCH_COLUMN} column; run "
+                        "VectorStore.create_text_index(). "
+                        "Falling back to vector search."
+                    )
+            return instance
 
         except Exception as e:
             logger.error(f"CRITICAL: Failed to initialize async VectorStore: {e}")
@@ -101,7 +147,9 @@ class VectorStore:
                 f"Successfully initialized vectorstore table '{self.settings.table}'."
             )
 
-            self.create_index(self)  # IVFFlatIndex
+            self.create_index()
+            self.create_text_index()
+            self.create_filter_indexes()
 
             return True  # Indicate success
         except Exception as e:
@@ -110,15 +158,107 @@ class VectorStore:
             return False
 
     def create_index(self) -> None:
-        """Create the IVFFlatIndex to speed up similarity search"""
-        logger.info(f"Creating index for table {self.settings.table}...")
+        """
+        Build the ANN index configured by `VECTOR_INDEX_TYPE` to speed up
+        similarity search, replacing any existing vector index.
+        """
+        label = self.index_config.build_label()
+        logger.info(f"Creating {label} index for table {self.settings.table}...")
+
+        self.vector_store.drop_vector_index()
+        index = self.index_config.build()
+        if index is not None:
+            self.vector_store.apply_vector_index(index)
+        logger.info(
+            f"Successfully created index {label} for table '{self.settings.table}'."
+        )
 
-        index = IVFFlatIndex()
-        self.vector_store.apply_vector_index(index)
+    def create_text_index(self) -> None:
+        """
+        Add the full-text search columns and their GIN indexes for hybrid
+        retrieval: one over the names and transcript, with the names weighted
+        above the transcript, and one over the partner and file names alone.
+        """
+        logger.info(f"Creating full-text index for table {self.settings.table}...")
+        self.engine._run_as_sync(self._create_text_index())
         logger.info(
-            f"Successfully created index '{index}' for table '{self.settings.table}'."
+            f"Successfully created full-text index for table '{self.settings.table}'."
         )
 
+    async def _create_text_index(self) -> None:
+        language = _text_search_language(self.settings.text_search_language)
+        table = self.settings.table
+        names = (
+            f"coalesce(\"{METADATA_COLUMN}\"->>'partner', '') || ' ' || "
+            f"coalesce(\"{METADATA_COLUMN}\"->>'file_name', '')"
+        )
+        async with self.engine._pool.connect() as conn:
+            await conn.execute(
+                text(
+                    f"""
+                    ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS "{TEXT_SEARCH_COLUMN}"
+                    tsvector GENERATED ALWAYS AS (
+                        setweight(to_tsvector('{language}', {names}), 'A') ||
+                        setweight(to_tsvector('{language}', coalesce("{CONTENT_COLUMN}", '')), 'B')
+                    ) STORED
+                    """
+                )
+            )
+            await conn.execute(
+                text(
+                    f"""
+                    ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS "{NAMES_SEARCH_COLUMN}"
+                    tsvector GENERATED ALWAYS AS (to_tsvector('{language}', {names})) STORED
+                    """
+                )
+            )
+            for column in (TEXT_SEARCH_COLUMN, NAMES_SEARCH_COLUMN):
+                await conn.execute(
+                    text(
+                        f'CREATE INDEX IF NOT EXISTS "{table}_{column}" '
+                        f'ON "{table}" USING gin ("{column}")'
+                    )
+                )
+            await conn.commit()
+
+    def create_filter_indexes(self) -> None:
+        """
+        Index the metadata fields in `FILTER_FIELDS`, so filtered searches
+        can narrow the table before ranking by distance.
+        """
+        logger.info(f"Creating metadata indexes for table {self.settings.table}...")
+        self.engine._run_as_sync(self._create_filter_indexes())
+        logger.info(
+            f"Successfully created metadata indexes for table '{self.settings.table}'."
+        )
+
+    async def _create_filter_indexes(self) -> None:
+        table = self.settings.table
+        async with self.engine._pool.connect() as conn:
+            for field in FILTER_FIELDS:
+                await conn.execute(
+                    text(
+                        f'CREATE INDEX IF NOT EXISTS "{table}_{field}" '
+                        f'ON "{table}" ({_metadata_field(field)})'
+                    )
+                )
+            await conn.commit()
+
+    async def _has_text_search_columns(self) -> bool:
+        async with self.engine._pool.connect() as conn:
+            result = await conn.execute(
+                text(
+                    "SELECT count(*) FROM information_schema.columns "
+                    "WHERE table_name = :table AND column_name IN (:text, :names)"
+                ),
+                {
+                    "table": self.settings.table,
+                    "text": TEXT_SEARCH_COLUMN,
+                    "names": NAMES_SEARCH_COLUMN,
+                },
+            )
+            return result.scalar() == 2
+
     def upsert(self, csv_file: str):
         """
         Insert or update records in the database from a pandas DataFrame.
@@ -147,56 +287,202 @@ class VectorStore:
         self.vector_store.add_documents(docs, ids=ids)
         logger.info(f"Inserted records into {self.settings.table}")
 
-    def similarity_search(self, query: str) -> list[Document]:
-        """Searches and returns videos.
-
-        Args:
-        query: The user query to search for related items
-
-        Returns:
-        List[Document]: A list of Documents
+    async def warm_up(self) -> bool:
+        """
+        Open a pooled AlloyDB connection and the embedding client with one
+        throwaway search, so the first user query doesn't pay for either.
         """
         try:
-            docs = self.vector_store.similarity_search(query, k=3)
-            # logger.info(f"Found similar documents {docs}")
+            await self.asimilarity_search("warm up", k=1)
+            return True
         except Exception as e:
-            logger.error(f"Error during similarity search: {e}")
-
-        df = self._create_dataframe_from_results(docs)
-
-        logger.info(f"similary_search outputs: {df}")
+            logger.error(f"VectorStore warm-up failed: {e}")
+            return False
 
-        return df
+    async def embed_query(self, query: str) -> List[float]:
+        """
+        Embeds a query with the same model used for the stored documents.
+        Repeats within and across requests come from the embedding cache.
+        """
+        with stage("embedding"):
+            return await self.embedding_service.aembed_query(query)
 
-    def _create_dataframe_from_results(
+    async def asimilarity_search(
         self,
-        results: List[Tuple[Any, ...]],
-    ) -> pd.DataFrame:
-        """
-        Create a pandas DataFrame from the search results.
+        query: str,
+        k: Optional[int] = None,
+        min_score: Optional[float] = None,
+        filters: Optional[SearchFilters] = None,
+    ) -> List[VideoRecord]:
+        """Searches and returns videos, best first.
 
         Args:
-            results: A list of Documents containing the search results.
+        query: The user query to search for related items
+        k: How many videos to return; defaults to `VECTOR_SEARCH_K`
+        min_score: Lowest cosine similarity to keep; defaults to
+            `VECTOR_SEARCH_MIN_SCORE`
+        filters: Partner, file name and creation time the videos must match
 
         Returns:
-            A pandas DataFrame containing the formatted search results.
+        List[VideoRecord]: The matching videos with their similarity scores
         """
-        data = []
-        for doc in results:
-            data.append(
-                {
-                    "id": doc.metadata.get("id"),
-                    "partner": doc.metadata.get("partner"),
-                    "created_at": doc.metadata.get("created_at"),
-                    "video_file_path": doc.metadata.get("video_file_path"),
-                    "file_name": doc.metadata.get("file_name"),
-                    "thumbnail_uri": doc.metadata.get("thumbnail_uri"),
-                    "page_content": doc.page_content,
-                }
+        embedding = await self.embed_query(query)
+        return await self.asimilarity_search_by_vector(
+            embedding, k, min_score, query_text=query, filters=filters
+        )
+
+    async def asimilarity_search_by_vector(
+        self,
+        embedding: List[float],
+        k: Optional[int] = None,
+        min_score: Optional[float] = None,
+        query_text: Optional[str] = None,
+        filters: Optional[SearchFilters] = None,
+    ) -> List[VideoRecord]:
+        """
+        Like `asimilarity_search`, for an already embedded query. With
+        `query_text` and hybrid search enabled, full-text matches are fused
+        with the nearest vectors.
+        """
+        params = {
+            "embedding": str([float(value) for value in embedding]),
+            "k": k or self.settings.search_k,
+            "min_score": self.settings.min_score if min_score is None else min_score,
+        }
+        where, filter_params = _filter_clause(filters)
+        params.update(filter_params)
+        if self.hybrid and query_text:
+            statement = self._hybrid_statement(where)
+            params.update(
+                query_text=query_text,
+                candidates=max(self.settings.hybrid_candidates, params["k"]),
+                rrf_k=self.settings.hybrid_rrf_k,
             )
-        df = pd.DataFrame(data)
+        else:
+            statement = self._vector_statement(where)
+        try:
+            with stage("similarity_search"):
+                # The engine's connection pool lives on its own event loop.
+                rows = await self.engine._run_as_async(
+                    self._fetch(statement, params, filtered=bool(where))
+                )
+        except Exception as e:
+            logger.error(f"Error during similarity search: {e}")
+            raise
+
+        records = [
+            VideoRecord.from_metadata(
+                _metadata(row["metadata"]), row["content"], row["score"]
+            )
+            for row in rows
+        ]
+        logger.info(f"similarity_search: {len(records)} videos {records}")
+        return records
+
+    def _vector_statement(self, where: str = "") -> str:
+        # Order by distance in the inner query so the vector index is used;
+        # metadata filters sit at the same level so the index scan applies
+        # them. The score threshold applies to the k rows it returns. The
+        # embedding column itself is never sent back.
+        return f"""
+            SELECT * FROM (
+                SELECT "{CONTENT_COLUMN}" AS content,
+                       "{METADATA_COLUMN}" AS metadata,
+                       1 - ("{EMBEDDING_COLUMN}" <=> CAST(:embedding AS vector)) AS score
+                FROM "{self.settings.table}"
+                {f"WHERE {where}" if where else ""}
+                ORDER BY "{EMBEDDING_COLUMN}" <=> CAST(:embedding AS vector)
+                LIMIT :k
+            ) AS nearest
+            WHERE score >= :min_score
+            ORDER BY score DESC
+            """
+
+    def _hybrid_statement(self, where: str = "") -> str:
+        # The nearest vectors (through the ANN index) and the best full-text
+        # matches (through the GIN indexes), `candidates` of each, fused with
+        # reciprocal rank fusion in the same statement. Full-text matches are
+        # videos whose names and transcript contain every question word, plus
+        # videos whose partner or file name contains any of them; OR-ing the
+        # words over transcripts would match nearly every row. Full-text
+        # matches skip the similarity threshold: they were found by wording,
+        # not meaning. `score` stays the cosine similarity; the order is by
+        # fused rank.
+        language = _text_search_language(self.settings.text_search_language)
+        table = self.settings.table
+        every_word = f"websearch_to_tsquery('{language}', :query_text)"
+        any_word = (
+            f"CAST(replace(CAST(plainto_tsquery('{language}', :query_text) AS text), "
+            f"'&', '|') AS tsquery)"
+        )
+        filtered = f"AND {where}" if where else ""
+
+        def matches(column: str, query: str) -> str:
+            return f"""
+                (SELECT "{ID_COLUMN}" AS id,
+                        "{CONTENT_COLUMN}" AS content,
+                        "{METADATA_COLUMN}" AS metadata,
+                        "{EMBEDDING_COLUMN}" <=> CAST(:embedding AS vector) AS distance,
+                        ts_rank_cd("{column}", terms) AS text_rank
+                 FROM "{table}", {query} AS terms
+                 WHERE "{column}" @@ terms {filtered}
+                 ORDER BY text_rank DESC
+                 LIMIT :candidates)"""
+
+        return f"""
+            WITH dense AS (
+                SELECT *, ROW_NUMBER() OVER (ORDER BY distance) AS rank FROM (
+                    SELECT "{ID_COLUMN}" AS id,
+                           "{CONTENT_COLUMN}" AS content,
+                           "{METADATA_COLUMN}" AS metadata,
+                           "{EMBEDDING_COLUMN}" <=> CAST(:embedding AS vector) AS distance
+                    FROM "{table}"
+                    {f"WHERE {where}" if where else ""}
+                    ORDER BY "{EMBEDDING_COLUMN}" <=> CAST(:embedding AS vector)
+                    LIMIT :candidates
+                ) AS nearest
+            ),
+            sparse AS (
+                SELECT *, ROW_NUMBER() OVER (ORDER BY text_rank DESC) AS rank FROM (
+                    SELECT DISTINCT ON (id) * FROM (
+                        {matches(TEXT_SEARCH_COLUMN, every_word)}
+                        UNION ALL
+                        {matches(NAMES_SEARCH_COLUMN, any_word)}
+                    ) AS matched
+                    ORDER BY id, text_rank DESC
+                ) AS best
+            )
+            SELECT COALESCE(dense.content, sparse.content) AS content,
+                   COALESCE(dense.metadata, sparse.metadata) AS metadata,
+                   1 - COALESCE(dense.distance, sparse.distance) AS score
+            FROM dense FULL OUTER JOIN sparse ON dense.id = sparse.id
+            WHERE sparse.id IS NOT NULL OR 1 - dense.distance >= :min_score
+            ORDER BY COALESCE(1.0 / (:rrf_k + dense.rank), 0)
+                   + COALESCE(1.0 / (:rrf_k + sparse.rank), 0) DESC
+            LIMIT :k
+            """
+
+    async def _fetch(self, statement: str, params: dict, filtered: bool = False) -> list:
+        # Index search settings apply to this connection's transaction only.
+        search_settings = self.index_config.search_settings(filtered)
+        async with self.engine._pool.connect() as conn:
+            if search_settings:
+                set_statement, set_params = set_config_statement(search_settings)
+                await conn.execute(text(set_statement), set_params)
+            result = await conn.execute(text(statement), params)
+            return result.mappings().fetchall()
+
+    def similarity_search(
+        self,
+        query: str,
+        k: Optional[int] = None,
+        filters: Optional[SearchFilters] = None,
+    ) -> List[VideoRecord]:
+        """Blocking `asimilarity_search`, for scripts outside the event loop."""
+        return self.engine._run_as_sync(
+            self.asimilarity_search(query, k, filters=filters)
+        )
 
-        return df
 
     # results = [Document(metadata={'source': '../data/out.csv', 'row': 1, 'id': 'f79e6bbc-1d5f-11f0-9d3f-fa0a240152c3', 'partner': 'Hearst Television', 'created_at': '2025-04-19T13:50:46.193881', 'video_file_path': 'https://drive.google.com/corp/drive/folders/1UkenEMoNWJoAdH3OSROPnA5OtN5WCDyH'}, page_content="transcript: Welcome to the Henry Ford's Innovation Nation. I'm Mo Rocca and today will astonish you. Coming up the Precision."),
     # Document(metadata={'source': '../data/out.csv', 'row': 0, 'id': 'f3b08f26-1d5f-11f0-9d3f-fa0a240152c3', 'partner': 'Hearst Television', 'created_at': '2025-04-19T13:50:39.601865', 'video_file_path': 'https://drive.google.com/file/d/1uxYSvoZvTjRcWk-dutVjjTMCsytkfuX6/'}, page_content="transcript: I'm Brandon McMillan. And for 7 years")]
@@ -208,3 +494,52 @@ class VectorStore:
 #       db = await vec.create_db()
 
 #   main()
+
+
+def _text_search_language(language: str) -> str:
+    # Interpolated into SQL as a text search configuration name.
+    if not re.fullmatch(r"[a-z_]+", language):
+        raise ValueError(f"Invalid text search language: {language!r}")
+    return language
+
+
+def _metadata_field(field: str) -> str:
+    # Matches the expression indexes built by `create_filter_indexes`.
+    return f"(\"{METADATA_COLUMN}\"->>'{field}')"
+
+
+def _filter_clause(filters: Optional[SearchFilters]) -> Tuple[str, dict]:
+    """
+    SQL conditions and bind parameters for `filters`; an empty clause when
+    nothing is filtered. `created_at` is stored as a naive UTC ISO string, so
+    bounds are converted to the same form.
+    """
+    if filters is None:
+        return "", {}
+    conditions, params = [], {}
+    if filters.partner:
+        conditions.append(f"{_metadata_field('partner')} = :filter_partner")
+        params["filter_partner"] = filters.partner
+    if filters.file_name:
+        conditions.append(f"{_metadata_field('file_name')} = :filter_file_name")
+        params["filter_file_name"] = filters.file_name
+    if filters.created_after:
+        conditions.append(f"{_metadata_field('created_at')} >= :filter_created_after")
+        params["filter_created_after"] = _naive_utc(filters.created_after)
+    if filters.created_before:
+        conditions.append(f"{_metadata_field('created_at')} < :filter_created_before")
+        params["filter_created_before"] = _naive_utc(filters.created_before)
+    return " AND ".join(conditions), params
+
+
+def _naive_utc(value: datetime) -> str:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat()
+
+
+def _metadata(value: Any) -> dict:
+    # JSON columns come back as text or as a dict depending on the driver codec.
+    if isinstance(value, str):
+        return json.loads(value)
+    return value or {}
@@ -2,28 +2,31 @@
 DataSense Library
 """
 
-from typing import List, Dict
+from typing import TYPE_CHECKING, AsyncIterator, List, Dict, Optional
 from gemini import (
     generate_normal_response,
+    generate_streaming_response,
     NormalResponse,
     PremiumResponse,
 )
 from google.genai.types import Part, Content
 from config import setup_logging
-from search import SearchService
+from llm import LLMClient
+from semantic_cache import SemanticCache
+from sessions import SessionStore
+from compaction import HistoryCompactor
+from datasense_types import SearchFilters
+
+if TYPE_CHECKING:
+    # The Discovery Engine client is slow to import; main loads it lazily.
+    from search import SearchService
 
 logger = setup_logging()
 
 
-async def chat_response(
-    history_obj: List[Dict],
-    user_input: str,
-    client_id: str,
-    vector_store,
-    search_engine: SearchService,
-) -> NormalResponse:
+def _prepare_content_history(history_obj: List[Dict]) -> List[Content]:
     """
-    Takes user input. Gets Gemini response.
+    Convert the chat history sent by the browser into Gemini `Content` turns.
     """
     content_history: List[Content] = []
     for item in history_obj:
@@ -39,19 +42,143 @@ async def chat_response(
     logger.info(
         f"datasense.py: Content history prepared with {len(content_history)} turns."
     )
+    return content_history
+
+
+async def _load_history(
+    history_obj: Optional[List[Dict]],
+    client_id: str,
+    session_store: Optional[SessionStore],
+) -> List[Content]:
+    """
+    Use the history sent by the browser if there is one, otherwise the
+    prepared history kept in the client's server-side session.
+    """
+    if history_obj is not None or session_store is None:
+        return _prepare_content_history(history_obj or [])
+    content_history = await session_store.get_history(client_id)
+    logger.info(
+        f"datasense.py: Content history loaded from session with {len(content_history)} turns."
+    )
+    return content_history
+
+
+async def _compact_history(
+    compactor: Optional[HistoryCompactor],
+    client_id: str,
+    content_history: List[Content],
+) -> List[Content]:
+    """
+    Fit the history into the configured token budget before it goes to Gemini.
+    Returns a new list; the full history is still what gets stored.
+    """
+    if compactor is None:
+        return list(content_history)
+    return await compactor.compact(client_id, content_history)
+
+
+async def _save_turn(
+    session_store: Optional[SessionStore],
+    client_id: str,
+    content_history: List[Content],
+    user_turn: Content,
+    answer: str,
+):
+    """
+    Store the history plus the user's turn and the answer.
+    """
+    if session_store is None:
+        return
+    answer_content = Content(role="assistant", parts=[Part.from_text(text=answer)])
+    await session_store.save_history(
+        client_id, content_history + [user_turn, answer_content]
+    )
+
+
+async def chat_response(
+    history_obj: Optional[List[Dict]],
+    user_input: str,
+    client_id: str,
+    vector_store,
+    search_engine: "SearchService",
+    llm_client: LLMClient,
+    semantic_cache: SemanticCache = None,
+    session_store: SessionStore = None,
+    compactor: HistoryCompactor = None,
+    filters: Optional[SearchFilters] = None,
+) -> NormalResponse:
+    """
+    Takes user input. Gets Gemini response.
+    """
+    content_history = await _load_history(history_obj, client_id, session_store)
+    user_turn = Content(role="user", parts=[Part.from_text(text=user_input)])
     try:
+        model_history = await _compact_history(compactor, client_id, content_history)
         response = await generate_normal_response(
-            content_history, user_input, client_id, vector_store, search_engine
+            model_history,
+            user_turn,
+            client_id,
+            vector_store,
+            search_engine,
+            llm_client,
+            semantic_cache,
+            filters,
         )
         logger.info(
             f"datasense.py: Gemini response generated successfully. {response}",
         )
+        await _save_turn(
+            session_store,
+            client_id,
+            content_history,
+            user_turn,
+            response.gemini_response,
+        )
     except Exception as e:
         logger.error(f"datasense.py: Error generating response: {e}")
         raise e
     return response
 
 
+async def chat_response_stream(
+    history_obj: Optional[List[Dict]],
+    user_input: str,
+    client_id: str,
+    vector_store,
+    search_engine: "SearchService",
+    llm_client: LLMClient,
+    semantic_cache: SemanticCache = None,
+    session_store: SessionStore = None,
+    compactor: HistoryCompactor = None,
+    filters: Optional[SearchFilters] = None,
+) -> AsyncIterator[dict]:
+    """
+    Takes user input. Streams the Gemini response as it is generated.
+    """
+    content_history = await _load_history(history_obj, client_id, session_store)
+    user_turn = Content(role="user", parts=[Part.from_text(text=user_input)])
+    model_history = await _compact_history(compactor, client_id, content_history)
+    async for event in generate_streaming_response(
+        model_history,
+        user_turn,
+        client_id,
+        vector_store,
+        search_engine,
+        llm_client,
+        semantic_cache,
+        filters,
+    ):
+        if event["event"] == "premium":
+            await _save_turn(
+                session_store,
+                client_id,
+                content_history,
+                user_turn,
+                event["data"]["gemini_response"],
+            )
+        yield event
+
+
 # async def premium_response() -> PremiumResponse:
 #     """
 #     Pass premium response to websocket
@@ -2,17 +2,133 @@
 Datasense types
 """
 
-from typing import List, Dict, TypedDict, Literal
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Dict, Optional, TypedDict, Literal
 from google.genai import types
 
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
+
+
+class SearchFilters(BaseModel):
+    """
+    Narrows the videos a premium answer is drawn from. Every field is
+    optional; `created_after` is inclusive and `created_before` exclusive.
+    `created_at` is stored as naive UTC: times with an offset are converted
+    to UTC, and times without one are taken as UTC.
+    """
+
+    partner: Optional[str] = None
+    file_name: Optional[str] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+
+    def is_empty(self) -> bool:
+        return not self.model_dump(exclude_none=True)
+
+    def key(self) -> str:
+        """A stable string for the filters, to tell filtered requests apart."""
+        return self.model_dump_json(exclude_none=True)
 
 
 class UserMessage(BaseModel):
     """
     Represents the user's message in the request payload.
+
+    chatHistory is optional: clients that omit it continue the conversation
+    kept in their server-side session. filters, when given, restrict the
+    videos the premium answer searches.
     """
 
     message: str
-    chatHistory: List[dict]
+    chatHistory: Optional[List[dict]] = None
+    clientId: str
+    filters: Optional[SearchFilters] = None
+
+    @field_validator("filters")
+    @classmethod
+    def _drop_empty_filters(cls, filters: Optional[SearchFilters]):
+        return None if filters is None or filters.is_empty() else filters
+
+
+class ResetRequest(BaseModel):
+    """
+    Identifies the client whose server-side session should be cleared.
+    """
+
     clientId: str
+
+
+@dataclass
+class Document:
+    """
+    One PDF result from Vertex AI Search. It lives here rather than in
+    `search` so that code handling results doesn't load the Discovery
+    Engine client.
+    """
+
+    title: str = ""
+    link: str = ""
+    link_with_page: str = ""
+    snippets: List[str] = None
+    segment_content: str = ""
+    page_number: int = 1
+    # Relevance to the question, set by the reranker
+    score: float = 0.0
+
+
+class VideoRecord:
+    """
+    One video returned by the vector search. `score` is the cosine similarity
+    to the query, replaced by the reranker's relevance when reranking runs.
+    """
+
+    __slots__ = (
+        "id",
+        "partner",
+        "created_at",
+        "video_file_path",
+        "file_name",
+        "thumbnail_uri",
+        "page_content",
+        "score",
+    )
+
+    def __init__(
+        self,
+        id: str = "",
+        partner: str = "",
+        created_at: str = "",
+        video_file_path: str = "",
+        file_name: str = "",
+        thumbnail_uri: str = "",
+        page_content: str = "",
+        score: float = 0.0,
+    ):
+        self.id = id
+        self.partner = partner
+        self.created_at = created_at
+        self.video_file_path = video_file_path
+        self.file_name = file_name
+        self.thumbnail_uri = thumbnail_uri
+        self.page_content = page_content
+        self.score = score
+
+    @classmethod
+    def from_metadata(cls, metadata: dict, page_content: str, score: float):
+        return cls(
+            id=str(metadata.get("id") or ""),
+            partner=metadata.get("partner") or "",
+            created_at=str(metadata.get("created_at") or ""),
+            video_file_path=metadata.get("video_file_path") or "",
+            file_name=metadata.get("file_name") or "",
+            thumbnail_uri=metadata.get("thumbnail_uri") or "",
+            page_content=page_content or "",
+            score=float(score),
+        )
+
+    def as_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"VideoRecord(file_name={self.file_name!r}, score={self.score:.3f})"
@@ -0,0 +1,207 @@
+"""
+Query-embedding cache
+
+`CachedEmbeddings` wraps the Vertex AI embedding service the vector store is
+created with. Query embeddings are kept in an in-memory LRU, optionally backed
+by a SQLite file so they survive restarts, keyed by model name and normalized
+question text. Concurrent requests for the same question share one call.
+
+The semantic cache lookup and the vector search of the same request both
+embed the question through this layer, so only the first pays for the
+round trip. Document embeddings (used when loading data) are not cached.
+"""
+
+import asyncio
+import functools
+import hashlib
+import sqlite3
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from prometheus_client import Counter
+
+from config import get_settings, setup_logging
+
+logger = setup_logging()
+
+EMBEDDING_CACHE_LOOKUPS = Counter(
+    "datasense_embedding_cache_lookups_total",
+    "Query-embedding cache lookups by result.",
+    ["result"],
+)
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def embedding_key(model: str, text: str) -> str:
+    return hashlib.sha1(f"{model}\x00{normalize_text(text)}".encode()).hexdigest()
+
+
+@dataclass
+class EmbeddingCacheStats:
+    hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    shared: int = 0
+    evictions: int = 0
+
+    def as_dict(self) -> dict:
+        stats = asdict(self)
+        lookups = self.hits + self.disk_hits + self.misses + self.shared
+        stats["hit_rate"] = (
+            round((lookups - self.misses) / lookups, 3) if lookups else 0.0
+        )
+        return stats
+
+
+class _DiskTier:
+    """Embeddings persisted to a SQLite file as float32 blobs."""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = asyncio.Lock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    async def _run(self, fn, *args):
+        async with self._lock:
+            return await asyncio.to_thread(fn, *args)
+
+    def _get(self, key: str) -> Optional[List[float]]:
+        row = self._conn.execute(
+            "SELECT vector FROM embeddings WHERE key = ?", (key,)
+        ).fetchone()
+        return np.frombuffer(row[0], dtype=np.float32).tolist() if row else None
+
+    def _set(self, key: str, vector: List[float]) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+            (key, np.asarray(vector, dtype=np.float32).tobytes()),
+        )
+        self._conn.commit()
+
+    async def get(self, key: str) -> Optional[List[float]]:
+        return await self._run(self._get, key)
+
+    async def set(self, key: str, vector: List[float]) -> None:
+        await self._run(self._set, key, vector)
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model: str,
+        max_entries: int,
+        disk_path: str = "",
+    ):
+        self.embeddings = embeddings
+        self.model = model
+        self.max_entries = max_entries
+        self.disk = _DiskTier(disk_path) if disk_path else None
+        self.stats = EmbeddingCacheStats()
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._in_flight: Dict[str, "asyncio.Task[List[float]]"] = {}
+
+    @classmethod
+    def from_settings(cls, embeddings: Embeddings, model: str):
+        settings = get_settings().embedding_cache
+        return cls(
+            embeddings,
+            model,
+            max_entries=settings.max_entries,
+            disk_path=settings.disk_path,
+        )
+
+    def as_dict(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "disk": self.disk is not None,
+            **self.stats.as_dict(),
+        }
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def _hit(self, key: str) -> Optional[List[float]]:
+        vector = self._entries.get(key)
+        if vector is not None:
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            EMBEDDING_CACHE_LOOKUPS.labels("hit").inc()
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = embedding_key(self.model, text)
+        vector = self._hit(key)
+        if vector is not None:
+            return vector
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.stats.shared += 1
+            EMBEDDING_CACHE_LOOKUPS.labels("shared").inc()
+        else:
+            # The lookup runs in its own task, so cancelling the caller that
+            # started it doesn't fail the others waiting on it.
+            task = asyncio.create_task(self._load(key, text))
+            self._in_flight[key] = task
+            task.add_done_callback(functools.partial(self._landed, key))
+        return await asyncio.shield(task)
+
+    def _landed(self, key: str, task: "asyncio.Task[List[float]]") -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark retrieved so a failure nobody else awaited isn't logged.
+        if not task.cancelled():
+            task.exception()
+
+    async def _load(self, key: str, text: str) -> List[float]:
+        if self.disk is not None:
+            try:
+                vector = await self.disk.get(key)
+            except Exception as e:
+                logger.warning(f"EmbeddingCache: disk read failed: {e}")
+                vector = None
+            if vector is not None:
+                self.stats.disk_hits += 1
+                EMBEDDING_CACHE_LOOKUPS.labels("disk_hit").inc()
+                self._remember(key, vector)
+                return vector
+
+        self.stats.misses += 1
+        EMBEDDING_CACHE_LOOKUPS.labels("miss").inc()
+        vector = await self.embeddings.aembed_query(text)
+        self._remember(key, vector)
+        if self.disk is not None:
+            try:
+                await self.disk.set(key, vector)
+            except Exception as e:
+                logger.warning(f"EmbeddingCache: disk write failed: {e}")
+        return vector
+
+    def embed_query(self, text: str) -> List[float]:
+        key = embedding_key(self.model, text)
+        vector = self._hit(key)
+        if vector is None:
+            self.stats.misses += 1
+            EMBEDDING_CACHE_LOOKUPS.labels("miss").inc()
+            vector = self.embeddings.embed_query(text)
+            self._remember(key, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
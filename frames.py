@@ -0,0 +1,49 @@
+"""
+Compact frames for the premium WebSocket stream
+
+Frames are encoded with orjson when it is installed (falling back to the
+standard library with compact separators) and carry only the fields the
+browser renders.
+"""
+
+import json
+from dataclasses import asdict
+from typing import List
+
+from datasense_types import Document, VideoRecord
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speed-up
+    orjson = None
+
+
+def encode(frame: dict) -> str:
+    """Serialize a frame to compact JSON."""
+    if orjson is not None:
+        return orjson.dumps(frame, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(frame, separators=(",", ":"))
+
+
+def video_cards(video_results: List[VideoRecord]) -> dict:
+    """The video card fields from AlloyDB results, as parallel lists."""
+    return {
+        "video_file_links": [video.video_file_path for video in video_results],
+        "video_file_names": [video.file_name for video in video_results],
+        "thumbnail_links": [video.thumbnail_uri for video in video_results],
+        "partner_names": [video.partner for video in video_results],
+    }
+
+
+def document_cards(documents: List[Document]) -> List[dict]:
+    """
+    The PDF card fields; the extracted segment text and relevance score are
+    only for synthesis.
+    """
+    cards = []
+    for doc in documents:
+        card = asdict(doc)
+        card.pop("segment_content", None)
+        card.pop("score", None)
+        cards.append(card)
+    return cards
@@ -2,20 +2,37 @@
 Helper functions to work with Gemini
 """
 
-from google import genai
+from __future__ import annotations
+
 from google.genai import types, Client
 from google.genai.types import Part, Content
 
-from typing import List, Tuple, Union
+from typing import TYPE_CHECKING, AsyncIterator, List, Optional, Tuple, Union
 
 from config import get_settings
-from database import VectorStore
+from llm import LLMClient
+from classifier import classify_locally, turn_stats
+from json_stream import JsonStringFieldStreamer
+from semantic_cache import CacheEntry, SemanticCache
+from speculation import SpeculativeRetrieval, start_retrieval
+from reranking import reranker
+from frames import document_cards, encode, video_cards
+from coalescing import Emit, premium_flights
+from scheduler import premium_scheduler
+from broker import message_broker
 from synthesizer import Synthesizer
+from telemetry import span, stage
 from pydantic import BaseModel, Field
-from search import SearchService, Document
-from dataclasses import dataclass, asdict
+from datasense_types import Document, SearchFilters
+from dataclasses import dataclass
+
+import logging, asyncio, functools
 
-import logging, asyncio
+if TYPE_CHECKING:
+    # langchain, the AlloyDB connector and the Discovery Engine client dominate
+    # cold start; main imports them lazily.
+    from database import VectorStore
+    from search import SearchService
 
 # Set up logging configuration
 logging.basicConfig(
@@ -25,12 +42,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Response schema for normal Gemini answer
-class GeminiAnswerResponse(BaseModel):
+# Response schema for a chat turn: the answer and the premium classification
+# come back from a single Gemini call.
+class GeminiTurnResponse(BaseModel):
     answer: str = Field(description="The answer to the user's question")
-
-# Response schema for Gemini classifier to determine if premium content is applicable
-class GeminiClassifierResponse(BaseModel):
     premium_applicable: bool = Field(
         description=(
             "Set to true ONLY if the user's query is a request for substantive "
@@ -70,31 +85,72 @@ def generate_config(response_schema) -> types.GenerateContentConfig:
         response_schema=response_schema,
     )
 
-async def generate_answer(client: Client, chat_history: List[Content]) -> str:
-    logger.info("Getting initial text answer from Gemini.")
+def _route_answer(llm_client: LLMClient, chat_history: List[Content]) -> str:
+    """Pick the answer model from the latest user turn and the history depth."""
+    question = chat_history[-1].parts[0].text if chat_history else ""
+    return llm_client.router.route_answer(question, len(chat_history) - 1)
+
 
-    response = await client.aio.models.generate_content(
-        model=get_settings().llm.gcp_model,
+async def generate_answer(
+    llm_client: LLMClient, chat_history: List[Content]
+) -> GeminiTurnResponse:
+    """
+    Get the answer and the premium_applicable flag from one Gemini call.
+    """
+    logger.info("Getting text answer and 'premium_applicable' flag from Gemini.")
+
+    response = await llm_client.generate_content(
         contents=chat_history,
-        config=generate_config(GeminiAnswerResponse),
+        config=generate_config(GeminiTurnResponse),
+        stage="answer",
+        model=_route_answer(llm_client, chat_history),
     )
-    return response.parsed.answer
+    return response.parsed
 
-async def is_premium_applicable(client: Client, chat_history: List[Content]) -> bool:
-    logger.info("Getting 'premium_applicable' flag from Gemini.")
-    user_question = chat_history[-1].parts[0].text
 
-    classifier_prompt = (
-        f"Analyze the following user query and determine if it is a request for "
-        f"substantive information. User Query: \"{user_question}\""
-    )
+def _to_user_content(user_turn: Union[Content, str]) -> Content:
+    if isinstance(user_turn, str):
+        return Content(role="user", parts=[Part.from_text(text=user_turn)])
+    elif isinstance(user_turn, Content):
+        return user_turn
+    raise TypeError("user_turn must be of type Content or str")
+
+
+async def _lookup_semantic_cache(
+    semantic_cache: Optional[SemanticCache],
+    vector_store: VectorStore,
+    chat_history: List[Content],
+    question: str,
+) -> Tuple[Optional[List[float]], Optional[CacheEntry]]:
+    """
+    Embed the question and look it up in the semantic cache.
+
+    Returns `(embedding, entry)`; the embedding is None when the turn is not
+    cacheable, and the entry is None on a miss.
+    """
+    cache_settings = get_settings().cache
+    if semantic_cache is None or not cache_settings.enabled:
+        return None, None
+    if cache_settings.standalone_only and len(chat_history) > 1:
+        return None, None
+    try:
+        embedding = await vector_store.embed_query(question)
+    except Exception as e:
+        logger.error(f"Gemini.py: Failed to embed question for semantic cache: {e}")
+        return None, None
+    return embedding, semantic_cache.lookup(embedding)
 
-    response = await client.aio.models.generate_content(
-        model=get_settings().llm.gcp_model,
-        contents=[classifier_prompt],
-        config=generate_config(GeminiClassifierResponse)
-    )
-    return response.parsed.premium_applicable
+
+def _start_speculative_retrieval(
+    question: str,
+    search_engine: SearchService,
+    vector_store: VectorStore,
+    filters: Optional[SearchFilters] = None,
+) -> Optional[SpeculativeRetrieval]:
+    if not get_settings().premium.speculative_retrieval:
+        return None
+    logger.info("Gemini.py: Starting speculative premium retrieval.")
+    return SpeculativeRetrieval(question, search_engine, vector_store, filters)
 
 
 async def generate_normal_response(
@@ -103,44 +159,78 @@ async def generate_normal_response(
     client_id: str,
     vector_store: VectorStore,
     search_engine: SearchService,
+    llm_client: LLMClient,
+    semantic_cache: Optional[SemanticCache] = None,
+    filters: Optional[SearchFilters] = None,
 ) -> NormalResponse:
     """
-    Normal Gemini response without RAG.
+    Normal Gemini response without RAG. `filters` narrow the video search of
+    the premium flow, if the turn triggers one.
     """
 
     logger.info("Gemini.py: Generating response from Gemini model.")
 
-    if isinstance(user_turn, str):
-        user_turn_content = Content(role="user", parts=[Part.from_text(text=user_turn)])
-    elif isinstance(user_turn, Content):
-        user_turn_content = user_turn
-    else:
-        raise TypeError("user_turn must be of type Content or str")
-
+    user_turn_content = _to_user_content(user_turn)
     chat_history.append(user_turn_content)
 
     # ==== START: Normal Gemini Response without RAG ==== #
 
-    # Configure the client and tool
-    client = genai.Client(
-        vertexai=True,
-        project=get_settings().llm.gcp_project,
-        location=get_settings().llm.gcp_location,
-    )
-
-    answer_task = asyncio.create_task(generate_answer(client, chat_history))
-    premium_flag_task = asyncio.create_task(is_premium_applicable(client, chat_history))
+    turn_stats.turns += 1
+    with stage("classifier"):
+        fast_path = classify_locally(user_turn_content.parts[0].text)
+    if fast_path:
+        turn_stats.fast_path_turns += 1
+        logger.info(f"Gemini.py: Answered locally. {turn_stats.as_dict()}")
+        return NormalResponse(
+            chat_history=chat_history,
+            gemini_response=fast_path.answer,
+            premium_applicable=fast_path.premium_applicable,
+        )
 
-    answer, premium_applicable = await asyncio.gather(answer_task, premium_flag_task)
+    question = user_turn_content.parts[0].text
+    embedding, cache_entry = await _lookup_semantic_cache(
+        semantic_cache, vector_store, chat_history, question
+    )
+    if cache_entry:
+        answer, premium_applicable = cache_entry.answer, cache_entry.premium_applicable
+        speculative_retrieval = None
+        logger.info("Gemini.py: Normal Gemini response served from cache.")
+    else:
+        speculative_retrieval = _start_speculative_retrieval(
+            question, search_engine, vector_store, filters
+        )
+        try:
+            # Reuse the process-wide client created at startup
+            with stage("answer"):
+                turn = await generate_answer(llm_client, chat_history)
+        except BaseException:
+            if speculative_retrieval:
+                speculative_retrieval.discard()
+            raise
+        turn_stats.llm_turns += 1
+        answer, premium_applicable = turn.answer, turn.premium_applicable
+        if embedding is not None:
+            cache_entry = semantic_cache.put_answer(
+                embedding, question, answer, premium_applicable
+            )
+        logger.info("Gemini.py: Normal Gemini response received.")
 
-    logger.info(f"Gemini.py: Normal Gemini response received. ")
     if premium_applicable:
         logger.info("Triggering background premium content generation flow.")
-        asyncio.create_task(
-            trigger_premium_flow(
-                chat_history, user_turn_content, client_id, vector_store, search_engine
-            )
+        await _schedule_premium_flow(
+            chat_history,
+            user_turn_content,
+            client_id,
+            vector_store,
+            search_engine,
+            llm_client,
+            semantic_cache,
+            cache_entry,
+            speculative_retrieval,
+            filters,
         )
+    elif speculative_retrieval:
+        speculative_retrieval.discard()
     return NormalResponse(
         chat_history=chat_history,
         gemini_response=answer,
@@ -148,12 +238,178 @@ async def generate_normal_response(
     )
 
 
-from typing import Dict
-from fastapi import WebSocket
-import json
+async def generate_streaming_response(
+    chat_history: List[Content],
+    user_turn: Union[Content, str],
+    client_id: str,
+    vector_store: VectorStore,
+    search_engine: SearchService,
+    llm_client: LLMClient,
+    semantic_cache: Optional[SemanticCache] = None,
+    filters: Optional[SearchFilters] = None,
+) -> AsyncIterator[dict]:
+    """
+    Normal Gemini response without RAG, streamed as it is generated.
+
+    Yields `{"event": "token", "data": {"text": ...}}` for every answer chunk,
+    then a trailing `premium` event carrying the full answer and the
+    premium_applicable flag. Both come from one structured-output call; the
+    answer field is decoded from the JSON stream as it arrives.
+    """
+    logger.info("Gemini.py: Streaming response from Gemini model.")
 
-# Global store for active WebSocket connections
-active_connections: Dict[str, WebSocket] = {}
+    user_turn_content = _to_user_content(user_turn)
+    chat_history.append(user_turn_content)
+
+    turn_stats.turns += 1
+    with stage("classifier"):
+        fast_path = classify_locally(user_turn_content.parts[0].text)
+    if fast_path:
+        turn_stats.fast_path_turns += 1
+        logger.info(f"Gemini.py: Answered locally. {turn_stats.as_dict()}")
+        yield {"event": "token", "data": {"text": fast_path.answer}}
+        yield {
+            "event": "premium",
+            "data": {
+                "gemini_response": fast_path.answer,
+                "premium_applicable": fast_path.premium_applicable,
+            },
+        }
+        return
+
+    question = user_turn_content.parts[0].text
+    embedding, cache_entry = await _lookup_semantic_cache(
+        semantic_cache, vector_store, chat_history, question
+    )
+    if cache_entry:
+        answer, premium_applicable = cache_entry.answer, cache_entry.premium_applicable
+        speculative_retrieval = None
+        yield {"event": "token", "data": {"text": answer}}
+        logger.info("Gemini.py: Streamed Gemini response served from cache.")
+    else:
+        speculative_retrieval = _start_speculative_retrieval(
+            question, search_engine, vector_store, filters
+        )
+        streamer = JsonStringFieldStreamer("answer")
+        try:
+            # Includes the time the client takes to consume each token.
+            with stage("answer"):
+                stream = llm_client.generate_content_stream(
+                    contents=chat_history,
+                    config=generate_config(GeminiTurnResponse),
+                    stage="answer",
+                    model=_route_answer(llm_client, chat_history),
+                )
+                async for chunk in stream:
+                    if not chunk.text:
+                        continue
+                    text = streamer.feed(chunk.text)
+                    if text:
+                        yield {"event": "token", "data": {"text": text}}
+
+            turn = GeminiTurnResponse.model_validate_json(streamer.text)
+        except BaseException:
+            # Includes GeneratorExit when the client disconnects mid-stream.
+            if speculative_retrieval:
+                speculative_retrieval.discard()
+            raise
+        turn_stats.llm_turns += 1
+        answer, premium_applicable = turn.answer, turn.premium_applicable
+        if embedding is not None:
+            cache_entry = semantic_cache.put_answer(
+                embedding, question, answer, premium_applicable
+            )
+        logger.info("Gemini.py: Streamed Gemini response completed.")
+
+    if premium_applicable:
+        logger.info("Triggering background premium content generation flow.")
+        await _schedule_premium_flow(
+            chat_history,
+            user_turn_content,
+            client_id,
+            vector_store,
+            search_engine,
+            llm_client,
+            semantic_cache,
+            cache_entry,
+            speculative_retrieval,
+            filters,
+        )
+    elif speculative_retrieval:
+        speculative_retrieval.discard()
+    yield {
+        "event": "premium",
+        "data": {
+            "gemini_response": answer,
+            "premium_applicable": premium_applicable,
+        },
+    }
+
+
+async def _send_to_client(client_id: str, message: str):
+    """
+    Deliver a message to the client's WebSocket, on whichever worker it is.
+    """
+    with stage("ws_send"):
+        delivered = await message_broker.publish(client_id, message)
+    if not delivered:
+        raise ConnectionError(f"No active WebSocket connection for client {client_id}")
+
+
+async def _schedule_premium_flow(
+    chat_history: List[Content],
+    user_turn_content: Content,
+    client_id: str,
+    vec: VectorStore,
+    search_engine: SearchService,
+    llm_client: LLMClient,
+    semantic_cache: Optional[SemanticCache],
+    cache_entry: Optional[CacheEntry],
+    speculative_retrieval: Optional[SpeculativeRetrieval],
+    filters: Optional[SearchFilters] = None,
+):
+    """
+    Queue the premium flow on the bounded scheduler, or tell the client it was
+    shed when the scheduler is at capacity.
+    """
+
+    def run():
+        return trigger_premium_flow(
+            chat_history,
+            user_turn_content,
+            client_id,
+            vec,
+            search_engine,
+            llm_client,
+            semantic_cache,
+            cache_entry,
+            speculative_retrieval,
+            filters,
+        )
+
+    accepted = premium_scheduler.submit(
+        client_id,
+        run,
+        on_cancel=speculative_retrieval.discard if speculative_retrieval else None,
+        # Only this WebSocket closing cancels the flow, not an older one.
+        connection_id=await message_broker.connection_id(client_id),
+    )
+    if accepted:
+        return
+
+    if speculative_retrieval:
+        speculative_retrieval.discard()
+    asyncio.create_task(
+        message_broker.publish(
+            client_id,
+            encode(
+                {
+                    "status": "error",
+                    "message": "Premium content is busy right now, please try again shortly.",
+                }
+            ),
+        )
+    )
 
 
 async def trigger_premium_flow(
@@ -162,53 +418,191 @@ async def trigger_premium_flow(
     client_id: str,
     vec: VectorStore,
     search_engine: SearchService,
+    llm_client: LLMClient,
+    semantic_cache: Optional[SemanticCache] = None,
+    cache_entry: Optional[CacheEntry] = None,
+    speculative_retrieval: Optional[SpeculativeRetrieval] = None,
+    filters: Optional[SearchFilters] = None,
 ):
     """
     Premium Gemini response with RAG.
+
+    When `cache_entry` already holds a premium payload it is sent straight to
+    the client, skipping retrieval and synthesis. Otherwise the synthesized
+    payload is stored on the entry for the next similar question.
+    `speculative_retrieval`, when given, supplies retrieval results that were
+    started alongside the normal answer. `filters` narrow the video search;
+    filtered answers neither come from nor go into the semantic cache.
+    Identical questions with the same filters in flight at the same time
+    share a single pipeline.
     """
     # ==== START: Trigger this when the response is premium worthy ==== #
     logger.info(
         f"Gemini.py: Starting premium response generation for client {client_id}"
     )
+    # The scheduler runs this in the context of the request that queued it,
+    # so the premium span is a child of that request's span.
+    with span("premium"):
+        await _deliver_premium(
+            chat_history,
+            user_turn_content,
+            client_id,
+            vec,
+            search_engine,
+            llm_client,
+            semantic_cache,
+            cache_entry,
+            speculative_retrieval,
+            filters,
+        )
 
-    websocket = active_connections.get(client_id)
 
-    logger.info(f"Gemini.py: Active connections: {websocket}")
-    if not websocket:
+async def _deliver_premium(
+    chat_history: List[Content],
+    user_turn_content: Content,
+    client_id: str,
+    vec: VectorStore,
+    search_engine: SearchService,
+    llm_client: LLMClient,
+    semantic_cache: Optional[SemanticCache],
+    cache_entry: Optional[CacheEntry],
+    speculative_retrieval: Optional[SpeculativeRetrieval],
+    filters: Optional[SearchFilters],
+):
+    if filters is not None:
+        # Cached premium payloads were built from the unfiltered video search.
+        cache_entry = None
+
+    if not await message_broker.is_connected(client_id):
         logger.error(
             f"Gemini.py: No active WebSocket connection found for client {client_id}"
         )
+        if speculative_retrieval:
+            speculative_retrieval.discard()
         return
 
-    try:
-        await websocket.send_text(
-            json.dumps(
-                {
-                    "status": "premium_started",
-                    "message": "Starting premium response generation...",
-                }
+    if cache_entry and cache_entry.premium_payload is not None:
+        logger.info(f"Gemini.py: Serving cached premium response to {client_id}")
+        if speculative_retrieval:
+            speculative_retrieval.discard()
+        try:
+            await _send_to_client(
+                client_id,
+                encode({"status": "completed", "data": cache_entry.premium_payload}),
+            )
+        except Exception as e:
+            logger.error(
+                f"Gemini.py: Failed to send cached premium response to client {client_id}: {e}"
             )
-        )
-    except Exception as e:
-        logger.error(
-            f"Gemini.py: Failed to send initial message to WebSocket for client {client_id}: {e}"
-        )
         return
 
-    try:
-        user_question = user_turn_content.parts[0].text
+    user_question = user_turn_content.parts[0].text
+    key = premium_flights.key(user_question)
+    if filters is not None:
+        key = f"{key}\x00{filters.key()}"
+    if speculative_retrieval and premium_flights.in_flight(key):
+        # The in-flight pipeline already has its own retrieval.
+        speculative_retrieval.discard()
+        speculative_retrieval = None
+
+    async def pipeline(emit: Emit):
+        await _run_premium_pipeline(
+            emit,
+            client_id,
+            user_question,
+            vec,
+            search_engine,
+            llm_client,
+            semantic_cache,
+            cache_entry,
+            speculative_retrieval,
+            filters,
+        )
+
+    await premium_flights.run(
+        key, client_id, functools.partial(_send_to_client, client_id), pipeline
+    )
 
-        await websocket.send_text(json.dumps({"status": "searching", "message": "Searching for relevant documents and videos..."}))
-        
-        search_task = asyncio.create_task(search_engine.search(user_question))
-        video_task = asyncio.to_thread(vec.similarity_search, user_question)
 
-        documents, video_results = await asyncio.gather(search_task, video_task)
-        await websocket.send_text(json.dumps({"status": "synthesizing", "message": "Synthesizing DataSense response..."}))
-        try:
-            response = await Synthesizer.generate_response(
-                question=user_question, video_context=video_results, documents=documents
+async def _run_premium_pipeline(
+    emit: Emit,
+    client_id: str,
+    user_question: str,
+    vec: VectorStore,
+    search_engine: SearchService,
+    llm_client: LLMClient,
+    semantic_cache: Optional[SemanticCache],
+    cache_entry: Optional[CacheEntry],
+    speculative_retrieval: Optional[SpeculativeRetrieval],
+    filters: Optional[SearchFilters],
+):
+    """
+    Retrieve, synthesize and emit the premium frames for one question.
+    """
+    try:
+        await emit({"status": "searching", "message": "Searching for relevant documents and videos..."})
+
+        if speculative_retrieval:
+            documents_task, videos_task = speculative_retrieval.claim()
+        else:
+            documents_task, videos_task = start_retrieval(
+                user_question, search_engine, vec, filters
             )
+        try:
+            # Push each source to the client as soon as it arrives instead of
+            # holding fast AlloyDB hits behind the slower search call. Each
+            # source is reranked on arrival; the user sees its best results.
+            pending = {documents_task, videos_task}
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task is videos_task:
+                        video_results = reranker.rank_videos(user_question, task.result())
+                        shown_videos = reranker.shown(
+                            video_results, reranker.video_results
+                        )
+                        await emit({"status": "videos", "data": video_cards(shown_videos)})
+                    else:
+                        documents = reranker.rank_documents(user_question, task.result())
+                        shown_documents = reranker.shown(
+                            documents, reranker.document_results
+                        )
+                        await emit(
+                            {
+                                "status": "documents",
+                                "data": {"pdf_documents": document_cards(shown_documents)},
+                            }
+                        )
+        finally:
+            documents_task.cancel()
+            videos_task.cancel()
+        video_results, documents = reranker.select(shown_videos, shown_documents)
+
+        await emit({"status": "synthesizing", "message": "Synthesizing DataSense response..."})
+        try:
+            if get_settings().llm.synthesis_streaming:
+
+                async def send_answer_delta(delta: str):
+                    await emit({"status": "premium_token", "delta": delta})
+
+                with stage("synthesis"):
+                    response = await Synthesizer.generate_response_stream(
+                        question=user_question,
+                        video_context=video_results,
+                        documents=documents,
+                        llm_client=llm_client,
+                        on_answer_delta=send_answer_delta,
+                    )
+            else:
+                with stage("synthesis"):
+                    response = await Synthesizer.generate_response(
+                        question=user_question,
+                        video_context=video_results,
+                        documents=documents,
+                        llm_client=llm_client,
+                    )
             logger.info(f"gemini.py: Synthesized response received")
 
             premium_bot_answer = response.answer
@@ -216,50 +610,38 @@ async def trigger_premium_flow(
             video_file_name = response.file_name
             thumbnail_link = response.thumbnail_link
             partner_name = response.partner_name
-            await websocket.send_text(
-                json.dumps(
-                    {
-                        "status": "completed",
-                        "data": {
-                            "gemini_response": premium_bot_answer,
-                            "video_file_links": video_file_link,
-                            "video_file_names": video_file_name,
-                            "thumbnail_links": thumbnail_link,
-                            "partner_names": partner_name, 
-                            "pdf_documents": [
-                                asdict(doc) for doc in documents
-                            ], 
-                        },
-                    }
+            premium_payload = {
+                "gemini_response": premium_bot_answer,
+                "video_file_links": video_file_link,
+                "video_file_names": video_file_name,
+                "thumbnail_links": thumbnail_link,
+                "partner_names": partner_name,
+            }
+            if cache_entry is not None:
+                semantic_cache.put_premium(
+                    cache_entry,
+                    {**premium_payload, "pdf_documents": document_cards(shown_documents)},
                 )
-            )
+            # The documents already went out in their own frame.
+            await emit({"status": "completed", "data": premium_payload})
         except (AttributeError, TypeError) as e:
             logger.error(f"Failed to parse Synthesizer response: {e}")
-            await websocket.send_text(
-                json.dumps(
-                    {
-                        "status": "error",
-                        "message": "Failed to generate premium response",
-                        "error": str(e),
-                    }
-                )
+            await emit(
+                {
+                    "status": "error",
+                    "message": "Failed to generate premium response",
+                    "error": str(e),
+                }
             )
 
     except Exception as e:
         logger.error(
             f"Gemini.py: Error during premium response generation for client {client_id}: {e}"
         )
-        try:
-            await websocket.send_text(
-                json.dumps(
-                    {
-                        "status": "error",
-                        "message": "An error occurred during premium response generation",
-                        "error": str(e),
-                    }
-                )
-            )
-        except Exception as ws_error:
-            logger.error(
-                f"Gemini.py: Failed to send error message to WebSocket for client {client_id}: {ws_error}"
-            )
+        await emit(
+            {
+                "status": "error",
+                "message": "An error occurred during premium response generation",
+                "error": str(e),
+            }
+        )
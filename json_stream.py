@@ -0,0 +1,94 @@
+"""
+Incremental parsing of streamed structured output
+"""
+
+import re
+
+
+class JsonStringFieldStreamer:
+    """
+    Incrementally extracts one string field from a streamed JSON object.
+
+    Gemini streams structured output as raw JSON text, so the answer arrives
+    wrapped in the other schema fields. `feed` returns the newly decoded part of
+    the field's value for every chunk, holding back incomplete escape sequences
+    (including the high half of an escaped surrogate pair) until the next chunk
+    completes them.
+    """
+
+    _ESCAPES = {
+        '"': '"',
+        "\\": "\\",
+        "/": "/",
+        "b": "\b",
+        "f": "\f",
+        "n": "\n",
+        "r": "\r",
+        "t": "\t",
+    }
+
+    def __init__(self, field: str):
+        self._key = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ""
+        self._pos = None
+        self._done = False
+
+    @property
+    def text(self) -> str:
+        """The full JSON text received so far."""
+        return self._buffer
+
+    def feed(self, chunk: str) -> str:
+        self._buffer += chunk
+        if self._done:
+            return ""
+        if self._pos is None:
+            match = self._key.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        buf = self._buffer
+        i = self._pos
+        out = []
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self._done = True
+                i += 1
+                break
+            if ch == "\\":
+                if i + 1 >= len(buf):
+                    break
+                esc = buf[i + 1]
+                if esc == "u":
+                    if i + 6 > len(buf):
+                        break
+                    code = int(buf[i + 2 : i + 6], 16)
+                    if 0xD800 <= code <= 0xDBFF:
+                        # Characters outside the BMP arrive as a surrogate
+                        # pair of escapes; hold the high half back until
+                        # the low half is available and combine them.
+                        pair = buf[i + 6 : i + 12]
+                        if len(pair) < 6 and "\\u".startswith(pair[:2]):
+                            break
+                        if pair[:2] == "\\u" and 0xDC00 <= int(pair[2:], 16) <= 0xDFFF:
+                            low = int(pair[2:], 16)
+                            out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                            i += 12
+                            continue
+                    if 0xD800 <= code <= 0xDFFF:
+                        # A lone surrogate can't be encoded as UTF-8.
+                        out.append("\ufffd")
+                        i += 6
+                        continue
+                    out.append(chr(code))
+                    i += 6
+                    continue
+                out.append(self._ESCAPES.get(esc, esc))
+                i += 2
+                continue
+            out.append(ch)
+            i += 1
+        self._pos = i
+        return "".join(out)
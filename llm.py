@@ -0,0 +1,178 @@
+"""
+Shared Gemini client
+
+A single `genai.Client` is created in the FastAPI startup hook and reused by
+every request, so credential resolution and HTTP connection setup are paid
+once per process instead of once per chat turn.
+"""
+
+import asyncio
+import time
+from typing import AsyncIterator, Optional
+
+from google import genai
+from google.genai import Client, types
+
+from config import get_settings, setup_logging
+from prompt_cache import GeminiPromptCache, PromptCache
+from resilience import LLMCallPolicy
+from routing import ModelRouter
+
+logger = setup_logging()
+
+
+class LLMClient:
+    """A process-wide, lifecycle-managed wrapper around `genai.Client`."""
+
+    def __init__(self, client: Client, settings):
+        """
+        Private constructor. Use the `create` classmethod for initialization.
+        """
+        self.client = client
+        self.settings = settings
+        self.policy = LLMCallPolicy.from_settings()
+        self.router = ModelRouter.from_settings()
+        cache_settings = get_settings().prompt_cache
+        self.prompt_cache: Optional[PromptCache] = (
+            GeminiPromptCache.from_settings(client) if cache_settings.enabled else None
+        )
+        self.cached_stages = {
+            stage.strip() for stage in cache_settings.stages.split(",") if stage.strip()
+        }
+        logger.info("LLMClient instance configured.")
+
+    @classmethod
+    async def create(cls):
+        """
+        Asynchronously creates the shared Gemini client.
+
+        Credential discovery can touch the filesystem and metadata server, so
+        it runs in a worker thread to keep the event loop free during startup.
+        """
+        logger.info("Asynchronously initializing LLMClient...")
+        settings = get_settings().llm
+
+        client = await asyncio.to_thread(
+            genai.Client,
+            vertexai=True,
+            project=settings.gcp_project,
+            location=settings.gcp_location,
+        )
+
+        logger.info("LLMClient initialized successfully.")
+        return cls(client, settings)
+
+    @property
+    def aio(self):
+        """The async surface of the underlying client (`client.aio`)."""
+        return self.client.aio
+
+    async def generate_content(
+        self,
+        contents,
+        config: types.GenerateContentConfig,
+        stage: str,
+        model: Optional[str] = None,
+    ) -> types.GenerateContentResponse:
+        """
+        `generate_content` with timeouts, retries, hedging and the circuit
+        breaker. `model` defaults to the configured model for `stage`.
+        """
+        used = {}
+
+        async def call(chosen: str):
+            used["model"] = chosen
+            return await self.client.aio.models.generate_content(
+                model=chosen,
+                contents=contents,
+                config=await self._with_cached_prompt(stage, chosen, config),
+            )
+
+        started = time.perf_counter()
+        response = await self.policy.call(
+            call, model or self.router.model_for(stage), stage=stage
+        )
+        self.router.record(
+            stage,
+            used["model"],
+            time.perf_counter() - started,
+            getattr(response, "usage_metadata", None),
+        )
+        return response
+
+    async def generate_content_stream(
+        self,
+        contents,
+        config: types.GenerateContentConfig,
+        stage: str,
+        model: Optional[str] = None,
+    ) -> AsyncIterator[types.GenerateContentResponse]:
+        """
+        `generate_content_stream` under the same policy, up to the first chunk.
+        """
+        used = {}
+
+        async def open_stream(chosen: str):
+            used["model"] = chosen
+            return await self.client.aio.models.generate_content_stream(
+                model=chosen,
+                contents=contents,
+                config=await self._with_cached_prompt(stage, chosen, config),
+            )
+
+        started = time.perf_counter()
+        usage_metadata = None
+        async for chunk in self.policy.stream(
+            open_stream, model or self.router.model_for(stage)
+        ):
+            # Usage is reported on the final chunk.
+            usage_metadata = getattr(chunk, "usage_metadata", None) or usage_metadata
+            yield chunk
+        self.router.record(
+            stage, used["model"], time.perf_counter() - started, usage_metadata
+        )
+
+    async def _with_cached_prompt(
+        self, stage: str, model: str, config: types.GenerateContentConfig
+    ) -> types.GenerateContentConfig:
+        """
+        Swap a static system instruction for a reference to cached content.
+        Runs per attempt, so a breaker fallback gets its own model's cache.
+        """
+        if (
+            self.prompt_cache is None
+            or stage not in self.cached_stages
+            or not config.system_instruction
+        ):
+            return config
+        name = await self.prompt_cache.get(model, config.system_instruction)
+        if name is None:
+            return config
+        # Instructions and tools live in the cached content and may not be
+        # repeated in the request.
+        return config.model_copy(
+            update={"cached_content": name, "system_instruction": None, "tools": None}
+        )
+
+    async def warm_up(self) -> bool:
+        """
+        Open the async connection and fetch an access token before the first
+        chat turn needs them. Fetching model metadata costs no tokens.
+        """
+        try:
+            await self.client.aio.models.get(model=self.settings.gcp_model)
+            return True
+        except Exception as e:
+            logger.error(f"LLMClient warm-up failed: {e}")
+            return False
+
+    async def close(self):
+        """Delete cached prompts and close the pooled HTTP connections."""
+        logger.info("Closing LLMClient connections...")
+        try:
+            if self.prompt_cache is not None:
+                await self.prompt_cache.close()
+            await self.client.aio.aclose()
+            self.client.close()
+        except Exception as e:
+            logger.error(f"Error while closing LLMClient: {e}")
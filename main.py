@@ -1,62 +1,164 @@
+import time
+
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.exceptions import HTTPException
 
 import datasense as ds
 from config import get_settings, setup_logging
-from datasense_types import UserMessage
-from search import SearchService
+from datasense_types import ResetRequest, UserMessage
 
-from database import VectorStore  # Assuming VectorStore class is in database.py
+from llm import LLMClient
+from semantic_cache import SemanticCache
+from sessions import SessionStore
+from compaction import HistoryCompactor
+from typing import Optional
 import asyncio  # You might need this if your setup logic uses async features directly,
 
 # but @app.on_event("startup") handles the async context
-from gemini import active_connections
+from broker import message_broker
+from frames import encode
+from classifier import turn_stats
+from speculation import speculation_stats
+from coalescing import premium_flights
+from context_packing import context_packer
+from reranking import reranker
+from scheduler import premium_scheduler
+from startup import startup_state
+from telemetry import span
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 
 app = FastAPI()
 logger = setup_logging()
+startup_state.record("import_app", time.perf_counter() - _import_started)
 
 
-@app.on_event("startup")
-async def startup_db_client():
-    print("Running application startup tasks...")
+async def _create_vector_store():
+    # `database` pulls in langchain and the AlloyDB connector; load it here
+    # rather than at import time so the server can bind its port sooner.
+    database = await startup_state.import_module("database")
+    return await database.VectorStore.create()
+
+
+async def _create_search_service():
+    # `search` pulls in the Discovery Engine client; defer it like `database`.
+    search = await startup_state.import_module("search")
+    search_settings = get_settings().search_engine
+    return await search.SearchService.create(
+        project_id=search_settings.project_number,
+        location=search_settings.location,
+        engine_id=search_settings.engine_id,
+    )
+
+
+async def _create_llm_client():
+    return await LLMClient.create()
+
+
+async def _initialize_backends():
+    """Create the backends concurrently and store them on `app.state`."""
     try:
-        app.state.vector_store = await VectorStore.create()
-        search_settings = get_settings().search_engine
-        app.state.search_engine = await SearchService.create(
-            project_id=search_settings.project_number,
-            location=search_settings.location,
-            engine_id=search_settings.engine_id,
+        (
+            app.state.vector_store,
+            app.state.search_engine,
+            app.state.llm_client,
+            _,
+        ) = await asyncio.gather(
+            startup_state.timed("vector_store", _create_vector_store()),
+            startup_state.timed("search_engine", _create_search_service()),
+            startup_state.timed("llm_client", _create_llm_client()),
+            startup_state.timed("broker", message_broker.start()),
+        )
+        app.state.semantic_cache = SemanticCache.from_settings()
+        app.state.session_store = SessionStore.from_settings()
+        app.state.compactor = (
+            await startup_state.timed(
+                "compactor", HistoryCompactor.create(app.state.llm_client)
+            )
+            if get_settings().history.enabled
+            else None
         )
-
     except Exception as e:
+        startup_state.error = str(e)
         print(f"CRITICAL: Error during async client initialization: {e}")
+        return
 
+    startup_state.mark_ready()
+    if get_settings().startup.warm_up:
+        app.state.warm_up_task = asyncio.create_task(_warm_up())
 
-# --- You might want a shutdown event to close connections cleanly ---
-# @app.on_event("shutdown")
-# async def shutdown_db_client():
-#     if hasattr(app.state, 'db') and app.state.db:
-#         print("Closing database connection...")
-#         # Assuming your db object has a close method or similar
-#         # await app.state.db.close() # Example: Adjust based on your db library
-#         print("Database connection closed.")
 
+async def _warm_up():
+    """Open the DB pool and the Gemini connection before the first turn."""
+    startup_state.warm["vector_store"], startup_state.warm["llm_client"] = (
+        await asyncio.gather(
+            startup_state.timed("warm_vector_store", app.state.vector_store.warm_up()),
+            startup_state.timed("warm_llm_client", app.state.llm_client.warm_up()),
+        )
+    )
+    logger.info(f"Warm-up finished: {startup_state.as_dict()}")
 
-# Static
-app.mount("/static", StaticFiles(directory="static"), name="static")
+
+async def _wait_until_ready():
+    """
+    Hold a request until a background startup finishes, or answer 503.
+    """
+    if startup_state.ready.is_set():
+        return
+    if startup_state.error is None:
+        try:
+            await asyncio.wait_for(
+                startup_state.ready.wait(),
+                get_settings().startup.ready_timeout_seconds,
+            )
+            return
+        except asyncio.TimeoutError:
+            pass
+    raise HTTPException(
+        status_code=503, detail="Service is starting up", headers={"Retry-After": "5"}
+    )
 
 
-print("Datasense Server starting up.")
-print("Project: ", get_settings().llm.gcp_project)
-print("Location: ", get_settings().llm.gcp_location)
-print("Model: ", get_settings().llm.gcp_model)
-print("Temperature: ", get_settings().llm.model_temperature)
-print("Top P: ", get_settings().llm.model_top_p)
-print("Max Output Tokens: ", get_settings().llm.model_max_output_tokens)
-print("System Instruction: ", get_settings().llm.system_instruction)
+@app.on_event("startup")
+async def startup_db_client():
+    print("Running application startup tasks...")
+    startup_state.begin()
+    settings = get_settings()
+    logger.info(
+        f"Datasense Server starting up: project={settings.llm.gcp_project} "
+        f"location={settings.llm.gcp_location} model={settings.llm.gcp_model} "
+        f"startup_mode={settings.startup.mode}"
+    )
+    premium_scheduler.start()
+    # A disconnect seen by any worker cancels that client's premium work here.
+    message_broker.add_disconnect_handler(premium_scheduler.cancel_client)
+    if settings.startup.mode == "background":
+        app.state.init_task = asyncio.create_task(_initialize_backends())
+    else:
+        await _initialize_backends()
+
+
+@app.on_event("shutdown")
+async def shutdown_db_client():
+    print("Running application shutdown tasks...")
+    for name in ("init_task", "warm_up_task"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+    await premium_scheduler.close()
+    await message_broker.close()
+    if getattr(app.state, "llm_client", None):
+        await app.state.llm_client.close()
+    if getattr(app.state, "session_store", None):
+        await app.state.session_store.close()
+
+
+# Static
+app.mount("/static", StaticFiles(directory="static"), name="static")
 
 
 @app.get("/")
@@ -67,28 +169,162 @@ async def root():
 
 
 @app.post("/chat")
-async def post_chat(user_message: UserMessage):
+async def post_chat(user_message: UserMessage, response: Response):
     """
     Takes user input. Gets Gemini response.
     Returns normal response immediately and processes premium response asynchronously if applicable.
+    The Server-Timing header breaks the turn down by stage.
     """
-    try:
-        return await ds.chat_response(
-            user_message.chatHistory,
-            user_message.message,
-            user_message.clientId,
-            app.state.vector_store,
-            app.state.search_engine,
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    await _wait_until_ready()
+    with span("chat") as current:
+        try:
+            result = await ds.chat_response(
+                user_message.chatHistory,
+                user_message.message,
+                user_message.clientId,
+                app.state.vector_store,
+                app.state.search_engine,
+                app.state.llm_client,
+                app.state.semantic_cache,
+                app.state.session_store,
+                app.state.compactor,
+                user_message.filters,
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=str(e),
+                headers={"Server-Timing": current.server_timing()},
+            )
+        response.headers["Server-Timing"] = current.server_timing()
+        return result
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {encode(data)}\n\n"
+
+
+@app.post("/chat/stream")
+async def post_chat_stream(user_message: UserMessage):
+    """
+    Takes user input. Streams the Gemini answer as Server-Sent Events.
+    Emits `token` events as the answer is generated, then a trailing `premium` event
+    with the full answer and premium_applicable flag.
+    """
+    # Before the response starts, so an early request gets a 503, not a
+    # 200 with an error event.
+    await _wait_until_ready()
+
+    async def event_stream():
+        # Headers are gone before the first token, so stage timings for a
+        # streamed turn only reach the logs and /metrics.
+        with span("chat_stream"):
+            async for frame in _chat_events():
+                yield frame
+
+    async def _chat_events():
+        try:
+            async for event in ds.chat_response_stream(
+                user_message.chatHistory,
+                user_message.message,
+                user_message.clientId,
+                app.state.vector_store,
+                app.state.search_engine,
+                app.state.llm_client,
+                app.state.semantic_cache,
+                app.state.session_store,
+                app.state.compactor,
+                user_message.filters,
+            ):
+                yield _sse_event(event["event"], event["data"])
+        except Exception as e:
+            logger.error(f"Error while streaming chat response: {e}")
+            yield _sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/stats")
+async def get_stats():
+    """
+    Counters for how chat turns were answered, how many LLM calls were saved,
+    how the semantic and query-embedding caches are performing, what
+    speculative retrieval saved, how often premium requests were coalesced,
+    what history compaction saved,
+    how loaded the premium task scheduler is, how Gemini calls are faring
+    (retries, hedges, circuit breaker), which models answered at what
+    latency and cost, how often static prompts came from the prompt cache, how
+    many retrieval candidates were reranked and how many context tokens
+    packing saved.
+    """
+    await _wait_until_ready()
+    return {
+        "turns": turn_stats.as_dict(),
+        "semantic_cache": app.state.semantic_cache.as_dict(),
+        "embedding_cache": (
+            app.state.vector_store.embedding_cache.as_dict()
+            if app.state.vector_store.embedding_cache
+            else None
+        ),
+        "speculative_retrieval": speculation_stats.as_dict(),
+        "premium_coalescing": premium_flights.stats.as_dict(),
+        "premium_scheduler": premium_scheduler.stats.as_dict(),
+        "llm_calls": app.state.llm_client.policy.as_dict(),
+        "model_routing": app.state.llm_client.router.as_dict(),
+        "prompt_cache": (
+            app.state.llm_client.prompt_cache.stats.as_dict()
+            if app.state.llm_client.prompt_cache
+            else None
+        ),
+        "reranking": reranker.as_dict(),
+        "context_packing": context_packer.as_dict(),
+        "history_compaction": (
+            app.state.compactor.stats.as_dict() if app.state.compactor else None
+        ),
+    }
+
+
+@app.get("/health/live")
+async def liveness():
+    """
+    Liveness. The process is up and serving; backends may still be starting.
+    """
+    return {"status": "ok"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """
+    Readiness. 200 once every backend is initialized, 503 before that or if
+    startup failed. Includes the import/startup time breakdown.
+    """
+    state = startup_state.as_dict()
+    return JSONResponse(content=state, status_code=200 if state["ready"] else 503)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus metrics, including per-stage latency histograms.
+    """
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.post("/reset")
-async def reset_chat():
+async def reset_chat(reset_request: Optional[ResetRequest] = None):
     """
-    Reset
+    Reset. Clears the client's server-side session when a clientId is given.
     """
+    await _wait_until_ready()
+    if reset_request is not None:
+        await app.state.session_store.reset(reset_request.clientId)
+        if app.state.compactor:
+            app.state.compactor.forget(reset_request.clientId)
     return {"message": "reset!"}
 
 
@@ -96,7 +332,7 @@ async def reset_chat():
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
     await websocket.accept()
     print(f"Client ID: {client_id} and websocket: {websocket}")
-    active_connections[client_id] = websocket
+    await message_broker.register(client_id, websocket)
 
     try:
         while True:
@@ -108,10 +344,11 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
     finally:
-        if client_id in active_connections:
-            print(f"Client ID: {client_id} disconnected")
-            active_connections.pop(client_id, None)
-            print(f"Active connections: {active_connections}")
+        print(f"Client ID: {client_id} disconnected")
+        # Nobody is left to receive this client's premium results; the broker
+        # tells every worker so each can cancel the client's tasks.
+        await message_broker.unregister(client_id, websocket)
+        print(f"Active connections: {len(message_broker.registry)}")
 
     # for i in range(5):
     #     await asyncio.sleep(1)
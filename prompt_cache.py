@@ -0,0 +1,144 @@
+"""
+Provider-side caching of static system prompts
+
+A stage whose system instruction never changes (the Synthesizer's) can have
+it stored once as Gemini cached content and referenced by name, instead of
+sending and re-processing the same instructions on every request. Cached
+input tokens are billed at a discount and skip prompt processing.
+
+`PromptCache` is the interface; `GeminiPromptCache` implements it with
+`client.aio.caches`. A prompt the provider refuses to cache (for example one
+below the model's minimum cacheable size) is remembered and sent inline.
+"""
+
+import asyncio
+import hashlib
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional, Set, Tuple
+
+from google.genai import Client, errors, types
+
+from config import get_settings, setup_logging
+
+logger = setup_logging()
+
+
+def prompt_key(model: str, system_instruction: str) -> str:
+    return hashlib.sha1(f"{model}\x00{system_instruction}".encode()).hexdigest()
+
+
+@dataclass
+class PromptCacheStats:
+    hits: int = 0
+    created: int = 0
+    unsupported: int = 0
+    failed: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class PromptCache(ABC):
+    def __init__(self):
+        self.stats = PromptCacheStats()
+
+    @abstractmethod
+    async def get(self, model: str, system_instruction: str) -> Optional[str]:
+        """
+        Name of the cached content holding `system_instruction` for `model`,
+        creating it if needed, or None to send the instruction inline.
+        """
+
+    async def close(self) -> None:
+        pass
+
+
+class GeminiPromptCache(PromptCache):
+    # Recreate an entry this long before it expires, so no request races
+    # the expiry.
+    REFRESH_MARGIN_SECONDS = 60
+    # After a failed create, send the prompt inline for this long.
+    RETRY_AFTER_SECONDS = 60
+
+    def __init__(self, client: Client, ttl_seconds: float):
+        super().__init__()
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, Tuple[str, float]] = {}
+        self._unsupported: Set[str] = set()
+        self._retry_at: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    @classmethod
+    def from_settings(cls, client: Client):
+        return cls(client, get_settings().prompt_cache.ttl_seconds)
+
+    def _fresh(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry and entry[1] - time.monotonic() > self.REFRESH_MARGIN_SECONDS:
+            return entry[0]
+        return None
+
+    async def get(self, model: str, system_instruction: str) -> Optional[str]:
+        key = prompt_key(model, system_instruction)
+        if key in self._unsupported or self._retry_at.get(key, 0) > time.monotonic():
+            return None
+        name = self._fresh(key)
+        if name:
+            self.stats.hits += 1
+            return name
+
+        # One create per prompt, however many requests arrive at once.
+        async with self._locks[key]:
+            name = self._fresh(key)
+            if name:
+                self.stats.hits += 1
+                return name
+            try:
+                cached = await self.client.aio.caches.create(
+                    model=model,
+                    config=types.CreateCachedContentConfig(
+                        system_instruction=system_instruction,
+                        ttl=f"{int(self.ttl_seconds)}s",
+                        display_name=f"datasense-{key[:12]}",
+                    ),
+                )
+            except errors.ClientError as e:
+                if e.code == 429:
+                    return self._failed(key, e)
+                self._unsupported.add(key)
+                self.stats.unsupported += 1
+                logger.warning(
+                    f"PromptCache: {model} won't cache this prompt, sending it inline: {e}"
+                )
+                return None
+            except Exception as e:
+                return self._failed(key, e)
+
+            # The entry being replaced expires on its own shortly; requests
+            # already using it keep working until then.
+            self._entries[key] = (cached.name, time.monotonic() + self.ttl_seconds)
+            self.stats.created += 1
+            logger.info(f"PromptCache: cached system prompt for {model} as {cached.name}")
+            return cached.name
+
+    def _failed(self, key: str, error: Exception) -> None:
+        self.stats.failed += 1
+        self._retry_at[key] = time.monotonic() + self.RETRY_AFTER_SECONDS
+        logger.error(f"PromptCache: failed to create cached content: {error}")
+        return None
+
+    async def _delete(self, name: str) -> None:
+        try:
+            await self.client.aio.caches.delete(name=name)
+        except Exception as e:
+            logger.warning(f"PromptCache: failed to delete {name}: {e}")
+
+    async def close(self) -> None:
+        """Delete the cached contents so they stop accruing storage cost."""
+        for name, _ in list(self._entries.values()):
+            await self._delete(name)
+        self._entries.clear()
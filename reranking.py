@@ -0,0 +1,191 @@
+"""
+Local reranking of merged video and PDF candidates
+
+AlloyDB and Vertex AI Search each rank their own results, but nothing ranks
+a video against a PDF. With reranking on, both sources are over-fetched and
+every candidate is scored against the question:
+
+- the relevance the source already reported. For videos this is the cosine
+  similarity the vector search returns; for PDFs, which Vertex AI Search
+  returns without a score, it is a prior from the result's position;
+- lexical overlap, the share of question terms the candidate contains.
+
+Both signals are local, so ranking never holds a frame behind a network call.
+
+Scores are absolute per candidate, so each source can be scored and shown as
+soon as it arrives; synthesis then gets only the best `top_n` of what was
+shown.
+"""
+
+import re
+import time
+from dataclasses import dataclass, asdict, replace
+from typing import List, Optional, Sequence, Tuple, TypeVar
+
+import numpy as np
+
+from config import get_settings, setup_logging
+from datasense_types import Document, VideoRecord
+
+logger = setup_logging()
+
+T = TypeVar("T")
+
+_WORD = re.compile(r"\w+")
+_STOP_WORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on "
+    "or our should that the this to was we what when where which who why will "
+    "with you your".split()
+)
+
+
+def _terms(text: str) -> List[str]:
+    return [
+        word
+        for word in _WORD.findall(text.lower())
+        if len(word) > 1 and word not in _STOP_WORDS
+    ]
+
+
+@dataclass
+class RerankStats:
+    requests: int = 0
+    candidates: int = 0
+    sent_to_synthesis: int = 0
+    seconds: float = 0.0
+
+    def as_dict(self) -> dict:
+        stats = asdict(self)
+        stats["seconds"] = round(self.seconds, 4)
+        return stats
+
+
+class Reranker:
+    def __init__(
+        self,
+        enabled: bool,
+        video_candidates: int,
+        document_candidates: int,
+        video_results: int,
+        document_results: int,
+        top_n: int,
+        lexical_weight: float,
+    ):
+        self.enabled = enabled
+        self.video_candidates = video_candidates
+        self.document_candidates = document_candidates
+        self.video_results = video_results
+        self.document_results = document_results
+        self.top_n = top_n
+        self.lexical_weight = lexical_weight
+        self.stats = RerankStats()
+
+    @classmethod
+    def from_settings(cls):
+        settings = get_settings().rerank
+        return cls(
+            enabled=settings.enabled,
+            video_candidates=settings.video_candidates,
+            document_candidates=settings.document_candidates,
+            video_results=settings.video_results,
+            document_results=settings.document_results,
+            top_n=settings.top_n,
+            lexical_weight=settings.lexical_weight,
+        )
+
+    def as_dict(self) -> dict:
+        return {"enabled": self.enabled, "top_n": self.top_n, **self.stats.as_dict()}
+
+    @property
+    def video_fetch(self) -> Optional[int]:
+        """How many videos to ask AlloyDB for; None for `VECTOR_SEARCH_K`."""
+        return self.video_candidates if self.enabled else None
+
+    @property
+    def document_fetch(self) -> int:
+        """How many documents to ask Vertex AI Search for."""
+        return self.document_candidates if self.enabled else self.document_results
+
+    def score(
+        self, question: str, texts: List[str], relevance: np.ndarray
+    ) -> np.ndarray:
+        """
+        Relevance of each text to the question: the source's own `relevance`
+        blended with lexical overlap.
+        """
+        if not texts:
+            return np.zeros(0, dtype=np.float32)
+        started = time.perf_counter()
+        question_terms = set(_terms(question))
+        overlap = np.array(
+            [
+                len(question_terms.intersection(_terms(text))) / len(question_terms)
+                if question_terms
+                else 0.0
+                for text in texts
+            ],
+            dtype=np.float32,
+        )
+        self.stats.seconds += time.perf_counter() - started
+        self.stats.candidates += len(texts)
+        return (1 - self.lexical_weight) * relevance + self.lexical_weight * overlap
+
+    def rank_videos(self, question: str, videos: List[VideoRecord]) -> List[VideoRecord]:
+        """
+        Videos best first, their `score` (the vector search's cosine
+        similarity) replaced by the reranker's.
+        """
+        if not self.enabled or not videos:
+            return videos
+        texts = [f"{video.file_name} {video.page_content}" for video in videos]
+        relevance = np.array([video.score for video in videos], dtype=np.float32)
+        for video, score in zip(videos, self.score(question, texts, relevance)):
+            video.score = float(score)
+        return sorted(videos, key=lambda video: video.score, reverse=True)
+
+    def rank_documents(self, question: str, documents: List[Document]) -> List[Document]:
+        """
+        Documents best first, with `score` set. Vertex AI Search's own order
+        stands in for their relevance, falling from 1 for its first result.
+        """
+        if not self.enabled or not documents:
+            return documents
+        texts = [
+            " ".join([doc.title, doc.segment_content, *(doc.snippets or [])])
+            for doc in documents
+        ]
+        relevance = 1 - np.arange(len(documents), dtype=np.float32) / len(documents)
+        scores = self.score(question, texts, relevance)
+        ranked = [replace(doc, score=float(s)) for doc, s in zip(documents, scores)]
+        return sorted(ranked, key=lambda doc: doc.score, reverse=True)
+
+    def shown(self, ranked: Sequence[T], limit: int) -> List[T]:
+        """The ranked candidates the user sees: the old result count per source."""
+        return list(ranked[:limit]) if self.enabled else list(ranked)
+
+    def select(
+        self, videos: List[VideoRecord], documents: List[Document]
+    ) -> Tuple[List[VideoRecord], List[Document]]:
+        """
+        The best `top_n` of the candidates shown to the user, for synthesis,
+        so the answer never cites a video or document the client didn't get.
+        Without reranking, the results the sources returned.
+        """
+        if not self.enabled:
+            return videos, documents
+        merged = sorted(
+            [*videos, *documents], key=lambda candidate: candidate.score, reverse=True
+        )[: self.top_n]
+        selected_videos = [c for c in merged if isinstance(c, VideoRecord)]
+        selected_documents = [c for c in merged if isinstance(c, Document)]
+        self.stats.requests += 1
+        self.stats.sent_to_synthesis += len(merged)
+        logger.info(
+            f"Reranker: sending {len(selected_videos)} videos and "
+            f"{len(selected_documents)} documents of "
+            f"{len(videos) + len(documents)} candidates"
+        )
+        return selected_videos, selected_documents
+
+
+reranker = Reranker.from_settings()
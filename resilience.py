@@ -0,0 +1,368 @@
+"""
+Timeouts, retries, hedging and a circuit breaker for Gemini calls
+
+`LLMCallPolicy.call` wraps one request/response call:
+
+- the call is duplicated ("hedged") once it runs longer than a high
+  percentile of recent calls of the same stage and model, and whichever
+  copy answers first wins;
+- every attempt has a timeout, and timeouts, 429s, 5xx and connection errors
+  are retried a bounded number of times with full-jitter backoff;
+- a circuit breaker watches the error rate and, while open, routes calls to a
+  cheaper fallback model or fails fast with `CircuitOpenError`.
+
+`LLMCallPolicy.stream` applies the same rules to streamed calls up to the
+first chunk; a stream that has started producing output is never retried.
+"""
+
+import asyncio
+import random
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, asdict
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+import httpx
+from google.genai import errors
+
+from config import get_settings, setup_logging
+
+logger = setup_logging()
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling Gemini while the breaker is open."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Errors that say the service is struggling, not that the request is bad."""
+    if isinstance(
+        error, (TimeoutError, ConnectionError, httpx.TransportError, errors.ServerError)
+    ):
+        return True
+    return isinstance(error, errors.ClientError) and error.code == 429
+
+
+@dataclass
+class LLMCallStats:
+    calls: int = 0
+    retries: int = 0
+    timeouts: int = 0
+    failures: int = 0
+    hedges_sent: int = 0
+    hedge_wins: int = 0
+    fallback_calls: int = 0
+    rejected: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class CircuitBreaker:
+    """
+    Opens when the failure rate over the last `window` calls reaches
+    `failure_rate`. After `open_seconds` one trial call is let through;
+    its outcome closes the breaker again or re-opens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(
+        self, failure_rate: float, window: int, min_calls: int, open_seconds: float
+    ):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.times_opened = 0
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                return False
+            self.state = self.HALF_OPEN
+        if self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    def record(self, ok: bool) -> None:
+        if self.state == self.HALF_OPEN:
+            self._trial_in_flight = False
+            if ok:
+                logger.info("CircuitBreaker: trial call succeeded, closing.")
+                self.state = self.CLOSED
+            else:
+                self._open()
+            return
+        self._outcomes.append(ok)
+        failures = self._outcomes.count(False)
+        if (
+            len(self._outcomes) >= self.min_calls
+            and failures / len(self._outcomes) >= self.failure_rate
+        ):
+            self._open()
+
+    def release(self) -> None:
+        """Give up a trial slot without an outcome, e.g. on cancellation."""
+        self._trial_in_flight = False
+
+    def _open(self) -> None:
+        logger.warning(f"CircuitBreaker: opening for {self.open_seconds}s.")
+        self.state = self.OPEN
+        self.times_opened += 1
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies."""
+
+    MIN_SAMPLES = 20
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self._samples) < self.MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class LLMCallPolicy:
+    def __init__(
+        self,
+        model: str,
+        fallback_model: str,
+        timeout: float,
+        max_retries: int,
+        retry_base_delay: float,
+        retry_max_delay: float,
+        hedge_enabled: bool,
+        hedge_percentile: float,
+        hedge_min_delay: float,
+        breaker: CircuitBreaker,
+    ):
+        self.model = model
+        self.fallback_model = fallback_model or None
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker
+        # Per (stage, model): a fast answer call and a long synthesis call
+        # have very different ideas of "slow".
+        self.latency: Dict[Tuple[str, str], LatencyTracker] = defaultdict(
+            LatencyTracker
+        )
+        self.stats = LLMCallStats()
+
+    @classmethod
+    def from_settings(cls):
+        settings = get_settings().llm
+        return cls(
+            model=settings.gcp_model,
+            fallback_model=settings.fallback_model,
+            timeout=settings.call_timeout_seconds,
+            max_retries=settings.max_retries,
+            retry_base_delay=settings.retry_base_delay_seconds,
+            retry_max_delay=settings.retry_max_delay_seconds,
+            hedge_enabled=settings.hedge_enabled,
+            hedge_percentile=settings.hedge_percentile,
+            hedge_min_delay=settings.hedge_min_delay_seconds,
+            breaker=CircuitBreaker(
+                failure_rate=settings.breaker_failure_rate,
+                window=settings.breaker_window,
+                min_calls=settings.breaker_min_calls,
+                open_seconds=settings.breaker_open_seconds,
+            ),
+        )
+
+    def as_dict(self) -> dict:
+        return {
+            **self.stats.as_dict(),
+            "breaker_state": self.breaker.state,
+            "breaker_opened": self.breaker.times_opened,
+            "hedge_delay_seconds": {
+                f"{stage}:{model}": self._hedge_delay(stage, model)
+                for stage, model in list(self.latency)
+            },
+        }
+
+    async def call(
+        self,
+        make_call: Callable[[str], Awaitable[T]],
+        model: Optional[str] = None,
+        stage: str = "default",
+    ) -> T:
+        """
+        Run `make_call(model_name)` under the policy and return its result.
+        Hedging compares against recent calls of the same `stage` and model.
+        """
+        self.stats.calls += 1
+        result, guarded = await self._with_retries(
+            lambda chosen: self._hedged(make_call, chosen, stage), model or self.model
+        )
+        if guarded:
+            self.breaker.record(True)
+        return result
+
+    async def stream(
+        self,
+        open_stream: Callable[[str], Awaitable[AsyncIterator[T]]],
+        model: Optional[str] = None,
+    ) -> AsyncIterator[T]:
+        """
+        Yield the chunks of `open_stream(model_name)`. Opening the stream and
+        waiting for its first chunk are retried; each later chunk only gets
+        the per-call timeout.
+        """
+        self.stats.calls += 1
+
+        async def first_chunk(chosen: str):
+            stream = await asyncio.wait_for(open_stream(chosen), self.timeout)
+            stream = stream.__aiter__()
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), self.timeout)
+            except StopAsyncIteration:
+                chunk = None
+            except TimeoutError:
+                self.stats.timeouts += 1
+                raise
+            return stream, chunk
+
+        (stream, chunk), guarded = await self._with_retries(
+            first_chunk, model or self.model
+        )
+        try:
+            while chunk is not None:
+                yield chunk
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), self.timeout)
+                except StopAsyncIteration:
+                    chunk = None
+        except Exception as e:
+            self.stats.failures += 1
+            if guarded:
+                self.breaker.record(not is_retryable(e))
+            raise
+        except BaseException:
+            # Cancelled, or the consumer stopped early.
+            if guarded:
+                self.breaker.release()
+            raise
+        if guarded:
+            self.breaker.record(True)
+
+    def _choose_model(self, model: str) -> Tuple[str, bool]:
+        """
+        The model to call and whether the breaker is tracking the call.
+        """
+        if self.breaker.allow():
+            return model, True
+        if self.fallback_model:
+            self.stats.fallback_calls += 1
+            return self.fallback_model, False
+        self.stats.rejected += 1
+        raise CircuitOpenError("Gemini circuit breaker is open")
+
+    async def _with_retries(
+        self, attempt: Callable[[str], Awaitable[T]], model: str
+    ) -> Tuple[T, bool]:
+        chosen, guarded = self._choose_model(model)
+        for retry in range(self.max_retries + 1):
+            try:
+                return await attempt(chosen), guarded
+            except asyncio.CancelledError:
+                if guarded:
+                    self.breaker.release()
+                raise
+            except Exception as e:
+                retryable = is_retryable(e)
+                if guarded:
+                    self.breaker.record(not retryable)
+                if not retryable or retry == self.max_retries:
+                    self.stats.failures += 1
+                    raise
+                self.stats.retries += 1
+                delay = random.uniform(
+                    0, min(self.retry_max_delay, self.retry_base_delay * 2**retry)
+                )
+                logger.warning(
+                    f"LLMCallPolicy: {chosen} failed ({type(e).__name__}: {e}), "
+                    f"retrying in {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+                # The failure may have opened the breaker.
+                chosen, guarded = self._choose_model(model)
+
+    def _hedge_delay(self, stage: str, model: str) -> Optional[float]:
+        if not self.hedge_enabled:
+            return None
+        percentile = self.latency[(stage, model)].percentile(self.hedge_percentile)
+        if percentile is None:
+            # Don't double every call before we know what "slow" looks like.
+            return None
+        return max(self.hedge_min_delay, percentile)
+
+    async def _hedged(
+        self, make_call: Callable[[str], Awaitable[T]], model: str, stage: str
+    ) -> T:
+        started = time.monotonic()
+        deadline = started + self.timeout
+        hedge_delay = self._hedge_delay(stage, model)
+        hedge_at = (
+            started + hedge_delay
+            if hedge_delay is not None and hedge_delay < self.timeout
+            else None
+        )
+        primary = asyncio.create_task(make_call(model))
+        tasks = [primary]
+        pending = {primary}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                wake_at = deadline if hedge_at is None else min(deadline, hedge_at)
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=max(0.0, wake_at - time.monotonic()),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.stats.hedge_wins += 1
+                        self.latency[(stage, model)].record(time.monotonic() - started)
+                        return task.result()
+                    error = task.exception()
+                if done:
+                    continue
+                if hedge_at is not None:
+                    # Slower than the hedge percentile: race a duplicate.
+                    self.stats.hedges_sent += 1
+                    hedge = asyncio.create_task(make_call(model))
+                    tasks.append(hedge)
+                    pending.add(hedge)
+                    hedge_at = None
+                    continue
+                self.stats.timeouts += 1
+                raise TimeoutError(f"{model} did not answer in {self.timeout}s")
+            # Every copy failed; surface the last error.
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
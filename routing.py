@@ -0,0 +1,218 @@
+"""
+Per-stage model routing
+
+Each Gemini call belongs to a stage: `answer` (the normal reply, which also
+carries the premium classification), `synthesis` (the premium answer) and
+`summary` (history compaction). Synthesis and summaries use a fixed model per
+stage. The answer model is picked per turn: simple turns go to the light
+model, complex ones to the answer model unless its recent p95 latency on
+answer calls is over budget.
+
+Every call's latency, tokens and estimated cost are recorded per stage and
+model, along with what the same tokens would have cost on the single global
+`GCP_MODEL` used before routing, with no prompt caching.
+"""
+
+import re
+from collections import defaultdict
+from dataclasses import dataclass, asdict
+from typing import Dict, Tuple
+
+from prometheus_client import Counter, Histogram
+
+from config import get_settings, setup_logging
+from resilience import LatencyTracker
+
+logger = setup_logging()
+
+# Input tokens served from a context cache are billed at a quarter of the price.
+CACHED_INPUT_PRICE_FACTOR = 0.25
+
+LLM_CALL_SECONDS = Histogram(
+    "datasense_llm_call_duration_seconds",
+    "Gemini call latency by stage and model, including retries and hedges.",
+    ["stage", "model"],
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 16, 32),
+)
+LLM_TOKENS = Counter(
+    "datasense_llm_tokens_total",
+    "Gemini tokens by stage, model and direction.",
+    ["stage", "model", "direction"],
+)
+LLM_COST = Counter(
+    "datasense_llm_cost_usd_total",
+    "Estimated Gemini spend by stage and model.",
+    ["stage", "model"],
+)
+MODEL_ROUTES = Counter(
+    "datasense_model_route_total",
+    "Answer-model routing decisions.",
+    ["model", "reason"],
+)
+
+# Wording that usually needs the stronger model: comparisons, explanations,
+# analysis and recommendations.
+_COMPLEX_CUES = re.compile(
+    r"\b(compare|comparison|versus|vs|why|explain|analy[sz]e|analysis|difference|"
+    r"differences|trends?|strateg(y|ies)|recommend|pros and cons|impact|"
+    r"summari[sz]e|evaluate|implications?)\b",
+    re.IGNORECASE,
+)
+
+
+def complexity(question: str, history_turns: int = 0) -> float:
+    """
+    Rough 0-1 estimate of how much reasoning a turn needs, from its length,
+    its wording, how many questions it asks and how deep the conversation is.
+    """
+    words = len(question.split())
+    score = 0.4 * min(words / 30, 1.0)
+    score += 0.25 * min(len(_COMPLEX_CUES.findall(question)), 2)
+    score += 0.1 * min(max(question.count("?") - 1, 0), 2)
+    score += 0.1 * min(history_turns / 10, 1.0)
+    return min(score, 1.0)
+
+
+def parse_prices(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse `"model=in/out,..."` (USD per million tokens)."""
+    prices = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, pair = item.partition("=")
+        input_price, _, output_price = pair.partition("/")
+        prices[model.strip()] = (float(input_price), float(output_price or input_price))
+    return prices
+
+
+@dataclass
+class _ModelUsage:
+    calls: int = 0
+    seconds: float = 0.0
+    input_tokens: int = 0
+    cached_input_tokens: int = 0
+    output_tokens: int = 0
+    cost_usd: float = 0.0
+    baseline_cost_usd: float = 0.0
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        stage_models: Dict[str, str],
+        light_model: str,
+        baseline_model: str,
+        routing_enabled: bool,
+        complexity_threshold: float,
+        latency_budget_seconds: float,
+        prices: Dict[str, Tuple[float, float]],
+    ):
+        self.stage_models = stage_models
+        self.light_model = light_model
+        self.baseline_model = baseline_model
+        self.routing_enabled = routing_enabled
+        self.complexity_threshold = complexity_threshold
+        self.latency_budget_seconds = latency_budget_seconds
+        self.prices = prices
+        self.routes: Dict[str, int] = defaultdict(int)
+        # Per (stage, model): long streamed synthesis calls must not count
+        # against the answer model's latency budget.
+        self._latency: Dict[Tuple[str, str], LatencyTracker] = defaultdict(
+            LatencyTracker
+        )
+        self._usage: Dict[Tuple[str, str], _ModelUsage] = defaultdict(_ModelUsage)
+
+    @classmethod
+    def from_settings(cls):
+        settings = get_settings().routing
+        return cls(
+            stage_models={
+                "answer": settings.answer_model,
+                "synthesis": settings.synthesis_model,
+                "summary": settings.summary_model,
+            },
+            light_model=settings.light_model,
+            baseline_model=get_settings().llm.gcp_model,
+            routing_enabled=settings.routing_enabled,
+            complexity_threshold=settings.complexity_threshold,
+            latency_budget_seconds=settings.latency_budget_seconds,
+            prices=parse_prices(settings.model_prices),
+        )
+
+    def model_for(self, stage: str) -> str:
+        return self.stage_models.get(stage, self.baseline_model)
+
+    def route_answer(self, question: str, history_turns: int = 0) -> str:
+        """Pick the model for this turn's answer."""
+        answer_model = self.model_for("answer")
+        if not self.routing_enabled:
+            return answer_model
+        score = complexity(question, history_turns)
+        if score < self.complexity_threshold:
+            model, reason = self.light_model, "simple"
+        else:
+            p95 = self._latency[("answer", answer_model)].percentile(95)
+            if p95 is not None and p95 > self.latency_budget_seconds:
+                model, reason = self.light_model, "latency"
+            else:
+                model, reason = answer_model, "complex"
+        self.routes[f"{model}:{reason}"] += 1
+        MODEL_ROUTES.labels(model, reason).inc()
+        logger.info(f"ModelRouter: complexity {score:.2f} -> {model} ({reason})")
+        return model
+
+    def record(self, stage: str, model: str, seconds: float, usage_metadata) -> None:
+        """Record one finished call; `usage_metadata` may be None."""
+        input_tokens = getattr(usage_metadata, "prompt_token_count", None) or 0
+        cached_tokens = (
+            getattr(usage_metadata, "cached_content_token_count", None) or 0
+        )
+        output_tokens = (getattr(usage_metadata, "candidates_token_count", None) or 0) + (
+            getattr(usage_metadata, "thoughts_token_count", None) or 0
+        )
+        cost = self._cost(model, input_tokens, output_tokens, cached_tokens)
+
+        self._latency[(stage, model)].record(seconds)
+        LLM_CALL_SECONDS.labels(stage, model).observe(seconds)
+        LLM_TOKENS.labels(stage, model, "input").inc(input_tokens)
+        LLM_TOKENS.labels(stage, model, "cached_input").inc(cached_tokens)
+        LLM_TOKENS.labels(stage, model, "output").inc(output_tokens)
+        LLM_COST.labels(stage, model).inc(cost)
+
+        usage = self._usage[(stage, model)]
+        usage.calls += 1
+        usage.seconds += seconds
+        usage.input_tokens += input_tokens
+        usage.cached_input_tokens += cached_tokens
+        usage.output_tokens += output_tokens
+        usage.cost_usd += cost
+        usage.baseline_cost_usd += self._cost(
+            self.baseline_model, input_tokens, output_tokens
+        )
+
+    def _cost(
+        self, model: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0
+    ) -> float:
+        input_price, output_price = self.prices.get(model, (0.0, 0.0))
+        billed_input = (
+            input_tokens - cached_tokens + cached_tokens * CACHED_INPUT_PRICE_FACTOR
+        )
+        return (billed_input * input_price + output_tokens * output_price) / 1e6
+
+    def as_dict(self) -> dict:
+        stages = {}
+        cost = baseline = 0.0
+        for (stage, model), usage in self._usage.items():
+            stages.setdefault(stage, {})[model] = {
+                **asdict(usage),
+                "mean_seconds": round(usage.seconds / usage.calls, 3),
+                "p95_seconds": self._latency[(stage, model)].percentile(95),
+            }
+            cost += usage.cost_usd
+            baseline += usage.baseline_cost_usd
+        return {
+            "routing_enabled": self.routing_enabled,
+            "routes": dict(self.routes),
+            "stages": stages,
+            "cost_usd": round(cost, 6),
+            "baseline_cost_usd": round(baseline, 6),
+            "cost_saved_usd": round(baseline - cost, 6),
+        }
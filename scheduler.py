@@ -0,0 +1,204 @@
+"""
+Bounded scheduler for background premium tasks
+
+Premium flows run on a fixed pool of worker tasks fed by a bounded queue
+instead of one bare `asyncio.create_task` per question. Each client may only
+have a limited number of premium tasks queued or running; work beyond the
+queue or per-client limits is shed, and a client's tasks are cancelled when
+the WebSocket they were queued for closes.
+"""
+
+import asyncio
+import contextvars
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from config import get_settings, setup_logging
+
+logger = setup_logging()
+
+
+@dataclass
+class SchedulerStats:
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    cancelled: int = 0
+    shed_queue_full: int = 0
+    shed_client_limit: int = 0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    running: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class _Job:
+    def __init__(
+        self,
+        client_id: str,
+        factory: Callable[[], Awaitable[None]],
+        on_cancel: Optional[Callable[[], None]],
+        connection_id: Optional[str],
+    ):
+        self.client_id = client_id
+        self.connection_id = connection_id
+        self.factory = factory
+        self.on_cancel = on_cancel
+        self.cancelled = False
+        self.task: Optional[asyncio.Task] = None
+        # Run in the submitter's context so its trace span carries over.
+        self.context = contextvars.copy_context()
+
+    def cancel(self) -> None:
+        if self.cancelled:
+            return
+        self.cancelled = True
+        if self.task is not None:
+            self.task.cancel()
+        elif self.on_cancel is not None:
+            # Never started, so the coroutine can't clean up after itself.
+            self.on_cancel()
+
+
+class PremiumScheduler:
+    """A worker pool with a bounded queue, per-client limits and cancellation."""
+
+    def __init__(self, max_workers: int, max_queue: int, per_client_limit: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.per_client_limit = per_client_limit
+        self.stats = SchedulerStats()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._jobs: Dict[str, List[_Job]] = {}
+
+    @classmethod
+    def from_settings(cls):
+        settings = get_settings().premium
+        return cls(
+            max_workers=settings.max_workers,
+            max_queue=settings.max_queue,
+            per_client_limit=settings.per_client_limit,
+        )
+
+    def start(self) -> None:
+        """Start the worker pool. Must be called from the running event loop."""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.max_workers)
+        ]
+        logger.info(f"PremiumScheduler started with {self.max_workers} workers.")
+
+    async def close(self) -> None:
+        for jobs in list(self._jobs.values()):
+            for job in list(jobs):
+                job.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(
+        self,
+        client_id: str,
+        factory: Callable[[], Awaitable[None]],
+        on_cancel: Optional[Callable[[], None]] = None,
+        connection_id: Optional[str] = None,
+    ) -> bool:
+        """
+        Queue `factory()` to run for `client_id`, on behalf of its WebSocket
+        `connection_id`.
+
+        Returns False, without queuing, when the client is at its limit or the
+        queue is full. `on_cancel` runs if the job is cancelled before it starts.
+        """
+        self.start()
+        jobs = self._jobs.setdefault(client_id, [])
+        if len(jobs) >= self.per_client_limit:
+            self.stats.shed_client_limit += 1
+            logger.warning(
+                f"PremiumScheduler: shedding task for {client_id}, client limit reached."
+            )
+            return False
+
+        job = _Job(client_id, factory, on_cancel, connection_id)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.stats.shed_queue_full += 1
+            logger.warning(
+                f"PremiumScheduler: shedding task for {client_id}, queue is full."
+            )
+            return False
+
+        jobs.append(job)
+        self.stats.submitted += 1
+        self._update_depth()
+        return True
+
+    def cancel_client(self, client_id: str, connection_id: Optional[str] = None) -> int:
+        """
+        Cancel a client's queued and running tasks: those of `connection_id`
+        and those queued without a connection, or all of them when no
+        connection is given. Tasks queued for a newer connection survive.
+        """
+        jobs = [
+            job
+            for job in self._jobs.get(client_id, [])
+            if connection_id is None
+            or job.connection_id is None
+            or job.connection_id == connection_id
+        ]
+        for job in jobs:
+            job.cancel()
+            self._forget(job)
+        self.stats.cancelled += len(jobs)
+        if jobs:
+            logger.info(f"PremiumScheduler: cancelled {len(jobs)} tasks for {client_id}.")
+        return len(jobs)
+
+    def _update_depth(self) -> None:
+        self.stats.queue_depth = self._queue.qsize()
+        self.stats.max_queue_depth = max(
+            self.stats.max_queue_depth, self.stats.queue_depth
+        )
+
+    def _forget(self, job: _Job) -> None:
+        jobs = self._jobs.get(job.client_id)
+        if jobs and job in jobs:
+            jobs.remove(job)
+            if not jobs:
+                del self._jobs[job.client_id]
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._queue.get()
+            self._update_depth()
+            if job.cancelled:
+                continue
+
+            job.task = asyncio.create_task(job.factory(), context=job.context)
+            self.stats.running += 1
+            try:
+                # asyncio.wait doesn't raise if the job itself gets cancelled.
+                await asyncio.wait([job.task])
+            finally:
+                self.stats.running -= 1
+                self._forget(job)
+
+            if job.task.cancelled():
+                continue
+            if job.task.exception() is not None:
+                self.stats.failed += 1
+                logger.error(
+                    f"PremiumScheduler: task for {job.client_id} failed: {job.task.exception()}"
+                )
+            else:
+                self.stats.completed += 1
+
+
+premium_scheduler = PremiumScheduler.from_settings()
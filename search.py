@@ -19,18 +19,11 @@ documents = search_documents(
 from google.api_core.client_options import ClientOptions
 from google.cloud import discoveryengine_v1 as discoveryengine
 import logging 
-from dataclasses import dataclass
 from typing import Dict, List, Union
 from google.protobuf.struct_pb2 import Struct, ListValue, Value
 
-@dataclass
-class Document:
-    title: str = ""
-    link: str  = ""
-    link_with_page: str = ""
-    snippets: List[str] = None
-    segment_content: str = ""
-    page_number: int = 1
+from datasense_types import Document
+from telemetry import stage
 
 class SearchService:
     """A reusable service for interacting with Vertex AI Search."""
@@ -58,12 +51,13 @@ class SearchService:
         serving_config = f"projects/{project_id}/locations/{location}/collections/default_collection/engines/{engine_id}/servingConfigs/default_config"
         return cls(client, serving_config)
 
-    async def search(self, search_query: str) -> List[Document]:
+    async def search(self, search_query: str, page_size: int = 5) -> List[Document]:
         """
         Performs an asynchronous search against the configured engine.
 
         Args:
             search_query: The user's query string.
+            page_size: How many documents to return.
 
         Returns:
             A list of Document objects.
@@ -73,7 +67,7 @@ class SearchService:
         request = discoveryengine.SearchRequest(
             serving_config=self.serving_config,
             query=search_query,
-            page_size=5,
+            page_size=page_size,
             content_search_spec=content_search_spec,
             query_expansion_spec=discoveryengine.SearchRequest.QueryExpansionSpec(
                 condition=discoveryengine.SearchRequest.QueryExpansionSpec.Condition.AUTO,
@@ -83,12 +77,13 @@ class SearchService:
             ),
         )
 
-        search_results_pager = await self.client.search(request)
+        with stage("search"):
+            search_results_pager = await self.client.search(request)
 
-        document_list = []
-        async for result in search_results_pager:
-            document = self._parse_search_result(result)
-            document_list.append(document)
+            document_list = []
+            async for result in search_results_pager:
+                document = self._parse_search_result(result)
+                document_list.append(document)
 
         return document_list
     
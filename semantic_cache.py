@@ -0,0 +1,189 @@
+"""
+Semantic answer cache
+
+Caches the normal answer and the synthesized premium payload for a question,
+keyed on the question's embedding. A lookup hits when the cosine similarity
+to a cached question is at or above the configured threshold, so rephrasings
+of the same question are answered without Gemini, Vertex AI Search or AlloyDB.
+"""
+
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import List, Optional
+
+import numpy as np
+
+from config import get_settings, setup_logging
+
+logger = setup_logging()
+
+
+@dataclass(eq=False)
+class CacheEntry:
+    key: int
+    question: str
+    embedding: np.ndarray
+    answer: str
+    premium_applicable: bool
+    created_at: float
+    premium_payload: Optional[dict] = None
+    size_bytes: int = 0
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    premium_hits: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+
+class SemanticCache:
+    """An in-memory, embedding-keyed cache with TTL, LRU eviction and a memory cap."""
+
+    def __init__(
+        self,
+        similarity_threshold: float,
+        ttl_seconds: float,
+        max_entries: int,
+        max_bytes: int,
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict()
+        self._next_key = 0
+        self._bytes = 0
+        # Stacked, normalized embeddings for vectorized lookups; rebuilt lazily.
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[int] = []
+
+    @classmethod
+    def from_settings(cls):
+        settings = get_settings().cache
+        return cls(
+            similarity_threshold=settings.similarity_threshold,
+            ttl_seconds=settings.ttl_seconds,
+            max_entries=settings.max_entries,
+            max_bytes=settings.max_bytes,
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def lookup(self, embedding: List[float]) -> Optional[CacheEntry]:
+        """Return the most similar live entry above the threshold, if any."""
+        self._expire()
+        if not self._entries:
+            self.stats.misses += 1
+            return None
+
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries.keys())
+            self._matrix = np.stack(
+                [self._entries[key].embedding for key in self._matrix_keys]
+            )
+        scores = self._matrix @ self._normalize(embedding)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            self.stats.misses += 1
+            return None
+
+        key = self._matrix_keys[best]
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        entry = self._entries[key]
+        if entry.premium_payload is not None:
+            self.stats.premium_hits += 1
+        logger.info(
+            f"SemanticCache: hit (similarity={scores[best]:.3f}) for '{entry.question}'"
+        )
+        return entry
+
+    def put_answer(
+        self,
+        embedding: List[float],
+        question: str,
+        answer: str,
+        premium_applicable: bool,
+    ) -> CacheEntry:
+        """Cache the normal answer for a question."""
+        entry = CacheEntry(
+            key=self._next_key,
+            question=question,
+            embedding=self._normalize(embedding),
+            answer=answer,
+            premium_applicable=premium_applicable,
+            created_at=time.monotonic(),
+        )
+        self._resize(entry)
+        self._entries[entry.key] = entry
+        self._next_key += 1
+        self._bytes += entry.size_bytes
+        self._matrix = None
+        self._evict()
+        return entry
+
+    def put_premium(self, entry: CacheEntry, payload: dict) -> None:
+        """Attach the synthesized premium payload to a cached answer."""
+        if self._entries.get(entry.key) is not entry:
+            # Evicted or expired while the premium flow was running.
+            return
+        self._bytes -= entry.size_bytes
+        entry.premium_payload = payload
+        self._resize(entry)
+        self._bytes += entry.size_bytes
+        self._evict()
+
+    def as_dict(self) -> dict:
+        stats = asdict(self.stats)
+        stats["entries"] = len(self._entries)
+        stats["size_bytes"] = self._bytes
+        return stats
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def _resize(entry: CacheEntry) -> None:
+        entry.size_bytes = (
+            entry.embedding.nbytes
+            + len(entry.question.encode())
+            + len(entry.answer.encode())
+            + (len(json.dumps(entry.premium_payload)) if entry.premium_payload else 0)
+        )
+
+    def _remove(self, key: int) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size_bytes
+        self._matrix = None
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        expired = [
+            key
+            for key, entry in self._entries.items()
+            if now - entry.created_at > self.ttl_seconds
+        ]
+        for key in expired:
+            self._remove(key)
+        self.stats.expirations += len(expired)
+
+    def _evict(self) -> None:
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            self._remove(next(iter(self._entries)))
+            self.stats.evictions += 1
@@ -0,0 +1,200 @@
+"""
+Server-side chat sessions
+
+Keeps each client's prepared Gemini `Content` history on the server, keyed by
+clientId, so the browser only sends the new message on every turn. Storage is
+pluggable: `InMemorySessionBackend` for a single process and
+`SQLiteSessionBackend` for history that survives restarts.
+"""
+
+import asyncio
+import json
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+
+from google.genai.types import Content
+
+from config import get_settings, setup_logging
+
+logger = setup_logging()
+
+
+class SessionBackend(ABC):
+    """Storage for per-client Content histories."""
+
+    @abstractmethod
+    async def get(self, client_id: str) -> Optional[List[Content]]:
+        """Return the stored history, or None for an unknown or expired session."""
+
+    @abstractmethod
+    async def set(self, client_id: str, history: List[Content]) -> None:
+        """Replace the stored history for a client."""
+
+    @abstractmethod
+    async def delete(self, client_id: str) -> None:
+        """Forget a client's history."""
+
+    async def close(self) -> None:
+        pass
+
+
+@dataclass
+class _Session:
+    history: List[Content]
+    last_seen: float
+
+
+class InMemorySessionBackend(SessionBackend):
+    """Process-local sessions with LRU eviction and an idle timeout."""
+
+    def __init__(self, max_sessions: int, idle_ttl_seconds: float):
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def get(self, client_id: str) -> Optional[List[Content]]:
+        self._evict_idle()
+        session = self._sessions.get(client_id)
+        if session is None:
+            return None
+        session.last_seen = time.monotonic()
+        self._sessions.move_to_end(client_id)
+        return list(session.history)
+
+    async def set(self, client_id: str, history: List[Content]) -> None:
+        self._sessions[client_id] = _Session(list(history), time.monotonic())
+        self._sessions.move_to_end(client_id)
+        while len(self._sessions) > self.max_sessions:
+            evicted, _ = self._sessions.popitem(last=False)
+            logger.info(f"Sessions: evicted least recently used session {evicted}")
+
+    async def delete(self, client_id: str) -> None:
+        self._sessions.pop(client_id, None)
+
+    def _evict_idle(self) -> None:
+        # Sessions are kept in last-seen order, so idle ones sit at the front.
+        cutoff = time.monotonic() - self.idle_ttl_seconds
+        while self._sessions:
+            client_id, session = next(iter(self._sessions.items()))
+            if session.last_seen >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """Sessions persisted to a SQLite file; queries run in a worker thread."""
+
+    def __init__(self, path: str, max_sessions: int, idle_ttl_seconds: float):
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = asyncio.Lock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "client_id TEXT PRIMARY KEY, history TEXT NOT NULL, last_seen REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen)"
+        )
+        self._conn.commit()
+
+    async def _run(self, fn, *args):
+        async with self._lock:
+            return await asyncio.to_thread(fn, *args)
+
+    def _get(self, client_id: str) -> Optional[str]:
+        now = time.time()
+        self._conn.execute(
+            "DELETE FROM sessions WHERE last_seen < ?", (now - self.idle_ttl_seconds,)
+        )
+        row = self._conn.execute(
+            "SELECT history FROM sessions WHERE client_id = ?", (client_id,)
+        ).fetchone()
+        if row:
+            self._conn.execute(
+                "UPDATE sessions SET last_seen = ? WHERE client_id = ?",
+                (now, client_id),
+            )
+        self._conn.commit()
+        return row[0] if row else None
+
+    def _set(self, client_id: str, history: str) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sessions (client_id, history, last_seen) VALUES (?, ?, ?)",
+            (client_id, history, time.time()),
+        )
+        self._conn.execute(
+            "DELETE FROM sessions WHERE client_id NOT IN "
+            "(SELECT client_id FROM sessions ORDER BY last_seen DESC LIMIT ?)",
+            (self.max_sessions,),
+        )
+        self._conn.commit()
+
+    def _delete(self, client_id: str) -> None:
+        self._conn.execute("DELETE FROM sessions WHERE client_id = ?", (client_id,))
+        self._conn.commit()
+
+    async def get(self, client_id: str) -> Optional[List[Content]]:
+        raw = await self._run(self._get, client_id)
+        if raw is None:
+            return None
+        return [Content.model_validate(item) for item in json.loads(raw)]
+
+    async def set(self, client_id: str, history: List[Content]) -> None:
+        raw = json.dumps(
+            [item.model_dump(mode="json", exclude_none=True) for item in history]
+        )
+        await self._run(self._set, client_id, raw)
+
+    async def delete(self, client_id: str) -> None:
+        await self._run(self._delete, client_id)
+
+    async def close(self) -> None:
+        await self._run(self._conn.close)
+
+
+class SessionStore:
+    """Per-client chat history with a bounded number of turns per session."""
+
+    def __init__(self, backend: SessionBackend, max_turns: int):
+        self.backend = backend
+        self.max_turns = max_turns
+
+    @classmethod
+    def from_settings(cls):
+        settings = get_settings().sessions
+        if settings.backend == "sqlite":
+            backend = SQLiteSessionBackend(
+                settings.sqlite_path, settings.max_sessions, settings.idle_ttl_seconds
+            )
+        elif settings.backend == "memory":
+            backend = InMemorySessionBackend(
+                settings.max_sessions, settings.idle_ttl_seconds
+            )
+        else:
+            raise ValueError(f"Unknown session backend: {settings.backend}")
+        logger.info(f"SessionStore configured with '{settings.backend}' backend.")
+        return cls(backend, settings.max_turns)
+
+    async def get_history(self, client_id: str) -> List[Content]:
+        return await self.backend.get(client_id) or []
+
+    async def save_history(self, client_id: str, history: List[Content]) -> None:
+        history = history[-self.max_turns :]
+        # Never start a trimmed history halfway through an exchange.
+        while history and history[0].role != "user":
+            history = history[1:]
+        await self.backend.set(client_id, history)
+
+    async def reset(self, client_id: str) -> None:
+        await self.backend.delete(client_id)
+
+    async def close(self) -> None:
+        await self.backend.close()
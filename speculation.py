@@ -0,0 +1,127 @@
+"""
+Speculative retrieval for the premium flow
+
+Starts Vertex AI Search and the AlloyDB similarity search while Gemini is
+still answering and classifying the turn. A premium turn picks up the
+results (or the in-flight task) instead of starting retrieval from scratch;
+a non-premium turn discards them.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, asdict
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from config import setup_logging
+from datasense_types import Document, SearchFilters, VideoRecord
+from reranking import reranker
+
+if TYPE_CHECKING:
+    # The Discovery Engine client is slow to import; main loads it lazily.
+    from search import SearchService
+
+logger = setup_logging()
+
+
+@dataclass
+class SpeculationStats:
+    started: int = 0
+    used: int = 0
+    discarded: int = 0
+    # Retrieval time that overlapped with the LLM call instead of adding to it.
+    time_saved_seconds: float = 0.0
+    # Retrieval time spent on turns that turned out not to be premium.
+    wasted_seconds: float = 0.0
+
+    def as_dict(self) -> dict:
+        stats = asdict(self)
+        stats["time_saved_seconds"] = round(self.time_saved_seconds, 3)
+        stats["wasted_seconds"] = round(self.wasted_seconds, 3)
+        return stats
+
+
+speculation_stats = SpeculationStats()
+
+
+def start_retrieval(
+    question: str,
+    search_engine: "SearchService",
+    vec,
+    filters: Optional[SearchFilters] = None,
+) -> Tuple["asyncio.Task[List[Document]]", "asyncio.Task[List[VideoRecord]]"]:
+    """
+    Start Vertex AI Search and the AlloyDB video search concurrently.
+
+    Returns the two tasks separately so callers can act on whichever source
+    finishes first. With reranking on, both sources are over-fetched.
+    `filters` narrow the video search.
+    """
+    documents_task = asyncio.create_task(
+        search_engine.search(question, page_size=reranker.document_fetch)
+    )
+    videos_task = asyncio.create_task(
+        vec.asimilarity_search(question, k=reranker.video_fetch, filters=filters)
+    )
+    return documents_task, videos_task
+
+
+class SpeculativeRetrieval:
+    """Premium-flow retrieval started ahead of the premium decision."""
+
+    def __init__(
+        self,
+        question: str,
+        search_engine: "SearchService",
+        vec,
+        filters: Optional[SearchFilters] = None,
+    ):
+        self.question = question
+        self._started_at = time.perf_counter()
+        self._finished_at = None
+        self.documents_task, self.videos_task = start_retrieval(
+            question, search_engine, vec, filters
+        )
+        # Completes when both sources have finished; also marks their
+        # exceptions as retrieved so discarded failures aren't logged.
+        self._both = asyncio.gather(
+            self.documents_task, self.videos_task, return_exceptions=True
+        )
+        self._both.add_done_callback(self._mark_finished)
+        speculation_stats.started += 1
+
+    def _mark_finished(self, _) -> None:
+        self._finished_at = time.perf_counter()
+
+    def claim(
+        self,
+    ) -> Tuple["asyncio.Task[List[Document]]", "asyncio.Task[List[VideoRecord]]"]:
+        """Hand the in-flight retrieval tasks to the premium flow."""
+        needed_at = time.perf_counter()
+        speculation_stats.used += 1
+
+        def account(_):
+            # Everything retrieval did before the premium flow asked for it
+            # would otherwise have been added on top of the LLM latency.
+            done_at = self._finished_at or time.perf_counter()
+            speculation_stats.time_saved_seconds += max(
+                0.0, min(needed_at, done_at) - self._started_at
+            )
+            logger.info(
+                f"Speculation: used results for '{self.question}' {speculation_stats.as_dict()}"
+            )
+
+        self._both.add_done_callback(account)
+        return self.documents_task, self.videos_task
+
+    def discard(self) -> None:
+        """Drop the results for a turn that turned out not to be premium."""
+        discarded_at = time.perf_counter()
+        self.documents_task.cancel()
+        self.videos_task.cancel()
+        speculation_stats.discarded += 1
+        speculation_stats.wasted_seconds += (
+            self._finished_at or discarded_at
+        ) - self._started_at
+        logger.info(
+            f"Speculation: discarded results for '{self.question}' {speculation_stats.as_dict()}"
+        )
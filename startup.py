@@ -0,0 +1,72 @@
+"""
+Startup bookkeeping
+
+Records how long each import and initialization phase took and whether the
+backends are ready, for the readiness endpoint and the startup log line.
+Heavy modules such as `database` (langchain, AlloyDB, Vertex AI) are imported
+here on first use, in a worker thread, rather than when the app is loaded.
+"""
+
+import asyncio
+import importlib
+import time
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Awaitable, Dict, Iterator, Optional, TypeVar
+
+from config import setup_logging
+
+logger = setup_logging()
+
+T = TypeVar("T")
+
+
+class StartupState:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.ready = asyncio.Event()
+        self.error: Optional[str] = None
+        self.warm: Dict[str, bool] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    def record(self, name: str, seconds: float) -> None:
+        self.phases[name] = seconds
+
+    async def timed(self, name: str, awaitable: Awaitable[T]) -> T:
+        with self.phase(name):
+            return await awaitable
+
+    async def import_module(self, name: str) -> ModuleType:
+        """Import `name` off the event loop; instant if it is already loaded."""
+        with self.phase(f"import_{name}"):
+            return await asyncio.to_thread(importlib.import_module, name)
+
+    def begin(self) -> None:
+        """Called from the startup hook; `ready` is measured from here."""
+        self.started = time.perf_counter()
+
+    def mark_ready(self) -> None:
+        self.record("ready", time.perf_counter() - self.started)
+        self.ready.set()
+        logger.info(f"Startup complete: {self.as_dict()['phases_ms']}")
+
+    def as_dict(self) -> dict:
+        return {
+            "ready": self.ready.is_set(),
+            "error": self.error,
+            "warm": self.warm,
+            "phases_ms": {
+                name: round(seconds * 1000, 1) for name, seconds in self.phases.items()
+            },
+        }
+
+
+startup_state = StartupState()
@@ -79,6 +79,24 @@ class ChatInterface {
         this.socket.onmessage = async (event) => {
             console.log("Received WebSocket message:", event.data);
             const data = JSON.parse(event.data);
+            if (data.status === "premium_token") {
+                // Partial premium answer; the "completed" frame carries the full text.
+                this.premiumMessage += data.delta;
+                return;
+            }
+            if (data.status === "videos") {
+                // Video cards arrive as soon as the vector search finishes;
+                // the completed frame replaces them with the synthesized picks.
+                this.fileLinks = data.data.video_file_links;
+                this.fileNames = data.data.video_file_names;
+                this.thumbnailLinks = data.data.thumbnail_links;
+                this.partnerNames = data.data.partner_names;
+                return;
+            }
+            if (data.status === "documents") {
+                this.pdfDocuments = data.data.pdf_documents;
+                return;
+            }
             this.status = data.status;
             this.status_message = data.message;
             if (this.status === "completed" && data.data) {
@@ -87,7 +105,9 @@ class ChatInterface {
                 this.fileNames = data.data.video_file_names;
                 this.thumbnailLinks = data.data.thumbnail_links;
                 this.partnerNames = data.data.partner_names;
-                this.pdfDocuments = data.data.pdf_documents;
+                if (data.data.pdf_documents) {
+                    this.pdfDocuments = data.data.pdf_documents;
+                }
                 this.tryDisplayPremiumContent();
             }
             this.showStatus();
@@ -139,9 +159,9 @@ class ChatInterface {
                 headers: {
                     'Content-Type': 'application/json'
                 },
+                // The server keeps the conversation for this clientId; only send the new message.
                 body: JSON.stringify({
                     message: messageText,
-                    chatHistory: this.chatHistory,
                     clientId: this.clientId
                  })
             });
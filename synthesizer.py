@@ -1,12 +1,13 @@
-from typing import List
-import pandas as pd
+import json
+from typing import Awaitable, Callable, List
 from pydantic import BaseModel, Field
 
-from google import genai
 from google.genai import types
 import logging
-from config import get_settings
-from search import Document
+from datasense_types import Document, VideoRecord
+from llm import LLMClient
+from context_packing import context_packer
+from json_stream import JsonStringFieldStreamer
 
 logging.basicConfig(
     level=logging.INFO,
@@ -38,21 +39,126 @@ class SynthesizedResponse(BaseModel):
     )
 
 
+# Static instructions only. Everything that changes per request goes in the
+# contents, so this prefix is byte-identical on every call and can be served
+# from the provider's prompt cache.
+SYSTEM_PROMPT = """
+    # Role and Purpose
+    You are an AI assistant. Your task is to synthesize a coherent and helpful answer
+    based on the given question and relevant context retrieved from a knowledge database.
+
+    # Guidelines:
+
+    1. Provide a clear and concise answer to the question based on the context.
+    2. The context is retrieved based on cosine similarity, so some information might be missing or irrelevant.
+    3. Do not use first person perspective.
+    4. Do not make up or infer information not present in the provided context.
+    5. Maintain a helpful and professional tone appropriate for customer service.
+
+    The relevant context retrieved from the knowledge database comes first in the
+    user's message, followed by the question from the user. Each passage starts
+    with a header line: "[video]" followed by the video's metadata as JSON, or
+    "[document]" followed by the document title and page. Take file links,
+    partner names, file names and thumbnail links from the video headers.
+
+    # Output Format
+    Your response MUST be a JSON object that strictly adheres to the following schema.
+    Ensure all fields are present and correctly typed.
+
+    ```json
+    {
+        "thought_process": "",
+        "file_link": [],
+        "partner_name": [],
+        "file_name": [],
+        "thumbnail_link": [],
+        "answer": "",
+        "enough_context": true or false
+    }
+    ```
+"""
+
+SYNTHESIS_CONFIG = types.GenerateContentConfig(
+    temperature=0.3,
+    system_instruction=SYSTEM_PROMPT,
+    response_mime_type="application/json",
+    response_schema=SynthesizedResponse,
+    tools=[],
+)
+
+
 class Synthesizer:
     @staticmethod
     async def generate_response(
-        question: str, video_context: pd.DataFrame, documents: List[Document]
+        question: str,
+        video_context: List[VideoRecord],
+        documents: List[Document],
+        llm_client: LLMClient,
     ) -> SynthesizedResponse:
         """Generates a synthesized response based on the question and context.
 
         Args:
             question: The user's question.
             context: The relevant context retrieved from the knowledge base.
+            llm_client: The shared Gemini client created at application startup.
 
         Returns:
             A SynthesizedResponse containing thought process and answer.
         """
-        video_context_str = Synthesizer.dataframe_to_json(
+        response = await llm_client.generate_content(
+            stage="synthesis",
+            contents=Synthesizer._build_contents(question, video_context, documents),
+            config=SYNTHESIS_CONFIG,
+        )
+
+        logger.info(f"Synthesizer.py: Synthesized response received: {response.text}")
+        logger.info(f"Synthesizer.py: Parsed response received: {response.parsed}")
+
+        return response.parsed
+
+    @staticmethod
+    async def generate_response_stream(
+        question: str,
+        video_context: List[VideoRecord],
+        documents: List[Document],
+        llm_client: LLMClient,
+        on_answer_delta: Callable[[str], Awaitable[None]],
+    ) -> SynthesizedResponse:
+        """Streams the synthesized answer while it is being generated.
+
+        Args:
+            question: The user's question.
+            video_context: Video records returned by the vector store.
+            documents: PDF documents returned by Vertex AI Search.
+            llm_client: The shared Gemini client created at application startup.
+            on_answer_delta: Awaited with each new piece of the `answer` field.
+
+        Returns:
+            The complete SynthesizedResponse, parsed once the stream ends.
+        """
+        streamer = JsonStringFieldStreamer("answer")
+
+        stream = llm_client.generate_content_stream(
+            stage="synthesis",
+            contents=Synthesizer._build_contents(question, video_context, documents),
+            config=SYNTHESIS_CONFIG,
+        )
+        async for chunk in stream:
+            if not chunk.text:
+                continue
+            delta = streamer.feed(chunk.text)
+            if delta:
+                await on_answer_delta(delta)
+
+        logger.info(f"Synthesizer.py: Streamed response received: {streamer.text}")
+        return SynthesizedResponse.model_validate_json(streamer.text)
+
+    @staticmethod
+    def _build_contents(
+        question: str, video_context: List[VideoRecord], documents: List[Document]
+    ) -> List[types.Content]:
+        """The per-request part of the prompt: retrieved context, then the question."""
+        video_context_str = Synthesizer.records_to_json(
             video_context,
             columns_to_keep=[
                 "video_file_path",
@@ -63,82 +169,44 @@ class Synthesizer:
             ],
         )
         documents_str = ".".join([doc.segment_content for doc in documents])
-
-        SYSTEM_PROMPT = f"""
-            # Role and Purpose
-            You are an AI assistant. Your task is to synthesize a coherent and helpful answer
-            based on the given question and relevant context retrieved from a knowledge database.
-
-            # Guidelines:
-
-            1. Provide a clear and concise answer to the question based on the context.
-            2. The context is retrieved based on cosine similarity, so some information might be missing or irrelevant.
-            3. Do not use first person perspective.
-            4. Do not make up or infer information not present in the provided context.
-            5. Maintain a helpful and professional tone appropriate for customer service.
-
-            Here is the relevant context retrieved from the knowledge database:
-            {video_context_str} {documents_str}
-
-            # Output Format
-            Your response MUST be a JSON object that strictly adheres to the following schema.
-            Ensure all fields are present and correctly typed.
-
-            ```json
-            {{
-                "thought_process": "",
-                "file_link": [],
-                "partner_name": [],
-                "file_name": [],
-                "thumbnail_link": [],
-                "answer": "",
-                "enough_context": true or false
-            }}
-        ```
-
-            Review the question from the user:
-        """
-
-        # Configure the client and tool
-        client = genai.Client(
-            vertexai=True,
-            project=get_settings().llm.gcp_project,
-            location=get_settings().llm.gcp_location,
+        context_str = f"{video_context_str} {documents_str}"
+        if context_packer.enabled:
+            context_str = context_packer.pack(
+                question, video_context, documents, baseline_text=context_str
+            ).text
+        context = (
+            "Here is the relevant context retrieved from the knowledge database:\n"
+            f"{context_str}"
         )
-        generate_content_config = types.GenerateContentConfig(
-            temperature=0.3,
-            system_instruction=SYSTEM_PROMPT,
-            response_mime_type="application/json",
-            response_schema=SynthesizedResponse,
-            tools=[],
-        )
-        response = client.models.generate_content(
-            model=get_settings().llm.gcp_model,
-            contents=question,
-            config=generate_content_config,
-        )
-
-        logger.info(f"Synthesizer.py: Synthesized response received: {response.text}")
-        logger.info(f"Synthesizer.py: Parsed response received: {response.parsed}")
-
-        return response.parsed
+        return [
+            types.Content(
+                role="user",
+                parts=[
+                    types.Part.from_text(text=context),
+                    types.Part.from_text(text=f"Review the question from the user:\n{question}"),
+                ],
+            )
+        ]
 
     @staticmethod
-    def dataframe_to_json(
-        context: pd.DataFrame,
+    def records_to_json(
+        context: List[VideoRecord],
         columns_to_keep: List[str],
     ) -> str:
         """
-        Convert the context DataFrame to a JSON string.
+        Convert the video records to a JSON string.
 
         Args:
-            context (pd.DataFrame): The context DataFrame.
-            columns_to_keep (List[str]): The columns to include in the output.
+            context (List[VideoRecord]): The video records.
+            columns_to_keep (List[str]): The fields to include in the output.
 
         Returns:
-            str: A JSON string representation of the selected columns.
+            str: A JSON string representation of the selected fields.
         """
-        if context.empty:
-            logger.warning("The context DataFrame is empty.")
+        if not context:
+            logger.warning("The video context is empty.")
             return "[]"
-        return context[columns_to_keep].to_json(orient="records", indent=2)
+        return json.dumps(
+            [{column: getattr(video, column) for column in columns_to_keep} for video in context],
+            indent=2,
+        )
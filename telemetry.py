@@ -0,0 +1,126 @@
+"""
+Per-stage latency instrumentation
+
+Every slow step of a chat turn runs inside `stage(...)`, which observes a
+Prometheus histogram and adds the duration to the current span. A span
+covers one request (`chat`) or one background premium flow (`premium`);
+the premium span is a child of the chat span that scheduled it, so both
+log lines share a trace id.
+
+    with span("chat") as current:
+        with stage("answer"):
+            ...
+    response.headers["Server-Timing"] = current.server_timing()
+"""
+
+import secrets
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from prometheus_client import Histogram
+
+from config import setup_logging
+
+logger = setup_logging()
+
+# Stages of a turn, from the cheap local classifier to the WebSocket send.
+STAGES = (
+    "classifier",
+    "answer",
+    "embedding",
+    "search",
+    "similarity_search",
+    "synthesis",
+    "ws_send",
+)
+
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+STAGE_SECONDS = Histogram(
+    "datasense_stage_duration_seconds",
+    "Time spent in each stage of a chat turn.",
+    ["stage"],
+    buckets=_BUCKETS,
+)
+SPAN_SECONDS = Histogram(
+    "datasense_span_duration_seconds",
+    "End-to-end time of a chat request or background premium flow.",
+    ["span"],
+    buckets=_BUCKETS,
+)
+# Export every stage from the first scrape, not only once it has run.
+for _stage in STAGES:
+    STAGE_SECONDS.labels(_stage)
+
+
+class Span:
+    """One traced unit of work and the stage timings recorded inside it."""
+
+    def __init__(self, name: str, parent: Optional["Span"] = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.timings: Dict[str, float] = {}
+        self.started = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    def record(self, stage_name: str, seconds: float) -> None:
+        # A stage can run more than once per span (e.g. several WS frames).
+        self.timings[stage_name] = self.timings.get(stage_name, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        """Format the timings as a `Server-Timing` header value."""
+        entries = [
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.timings.items()
+        ]
+        elapsed = (
+            self.duration
+            if self.duration is not None
+            else time.perf_counter() - self.started
+        )
+        entries.append(f"total;dur={elapsed * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str) -> Iterator[Span]:
+    """
+    Open a span as a child of the current one, if any. Tasks created inside
+    inherit it through the context, so their stages are recorded here too.
+    """
+    current = Span(name, parent=_current_span.get())
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        _current_span.reset(token)
+        current.duration = time.perf_counter() - current.started
+        SPAN_SECONDS.labels(name).observe(current.duration)
+        logger.info(
+            f"Span {name} trace_id={current.trace_id} span_id={current.span_id} "
+            f"parent_id={current.parent_id}: {current.server_timing()}"
+        )
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a stage into the histogram and the current span."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        STAGE_SECONDS.labels(name).observe(seconds)
+        current = _current_span.get()
+        if current is not None:
+            current.record(name, seconds)
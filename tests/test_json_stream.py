@@ -0,0 +1,28 @@
+import json
+
+import orjson
+
+from json_stream import JsonStringFieldStreamer
+
+
+def _stream(text: str, split: int) -> str:
+    streamer = JsonStringFieldStreamer("answer")
+    return streamer.feed(text[:split]) + streamer.feed(text[split:])
+
+
+def test_escaped_surrogate_pair_split_across_chunks():
+    answer = "hi \U0001F600 there"
+    text = json.dumps({"answer": answer, "sources": []})
+    assert "\\ud83d\\ude00" in text
+    for split in range(len(text) + 1):
+        streamed = _stream(text, split)
+        assert streamed == answer
+        orjson.dumps(streamed)
+
+
+def test_lone_surrogate_is_replaced():
+    text = '{"answer": "a\\ud83d b\\ude00"}'
+    for split in range(len(text) + 1):
+        streamed = _stream(text, split)
+        assert streamed == "a� b�"
+        orjson.dumps(streamed)
@@ -4,7 +4,7 @@ import vertexai
 import logging
 import pandas as pd
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 import asyncio
 from config import DatabaseSettings, LLMSettings
 
@@ -207,7 +207,8 @@ def insert_transcript_to_csv(
         {
             "id": str(uuid.uuid1()),
             "partner": str(partner),
-            "created_at": datetime.now().isoformat(),
+            # Naive UTC, the zone search filters compare `created_at` in.
+            "created_at": datetime.now(timezone.utc).replace(tzinfo=None).isoformat(),
             "file_name": str(videoFileName),
             "video_file_path": str(videoFilePath),
             "video_uri": str(GCSUri),
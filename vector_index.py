@@ -0,0 +1,133 @@
+"""
+Approximate nearest-neighbour index for the video table
+
+`VECTOR_INDEX_TYPE` picks the index `VectorStore.create_index` builds:
+
+- `hnsw` and `ivfflat`, from pgvector;
+- `ivf` and `scann`, from AlloyDB;
+- `exact`, no index at all.
+
+Build parameters (lists, m, ef_construction, ScaNN leaves) go into CREATE
+INDEX. Search parameters (probes, ef_search, leaves to search) are set for
+each query's transaction; filtered queries also turn on pgvector's iterative
+index scan, so a selective filter still gets k rows back from the index.
+`benchmarks/index_sweep.py` measures the recall and latency of each setting.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from langchain_google_alloydb_pg.indexes import (
+    BaseIndex,
+    HNSWIndex,
+    IVFFlatIndex,
+    IVFIndex,
+    ScaNNIndex,
+)
+
+from config import get_settings
+
+INDEX_TYPES = ("hnsw", "ivfflat", "ivf", "scann", "exact")
+ITERATIVE_SCAN_MODES = ("off", "strict_order", "relaxed_order")
+
+
+@dataclass(frozen=True)
+class IndexConfig:
+    index_type: str = "hnsw"
+    lists: int = 100
+    probes: int = 10
+    m: int = 16
+    ef_construction: int = 64
+    ef_search: int = 40
+    scann_num_leaves: int = 100
+    scann_leaves_to_search: int = 10
+    iterative_scan: str = "relaxed_order"
+
+    def __post_init__(self):
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(
+                f"Unknown vector index type {self.index_type!r}; "
+                f"expected one of {', '.join(INDEX_TYPES)}"
+            )
+        if self.iterative_scan not in ITERATIVE_SCAN_MODES:
+            raise ValueError(
+                f"Unknown iterative scan mode {self.iterative_scan!r}; "
+                f"expected one of {', '.join(ITERATIVE_SCAN_MODES)}"
+            )
+
+    @classmethod
+    def from_settings(cls):
+        settings = get_settings().database
+        return cls(
+            index_type=settings.index_type.lower(),
+            lists=settings.index_lists,
+            probes=settings.index_probes,
+            m=settings.hnsw_m,
+            ef_construction=settings.hnsw_ef_construction,
+            ef_search=settings.hnsw_ef_search,
+            scann_num_leaves=settings.scann_num_leaves,
+            scann_leaves_to_search=settings.scann_leaves_to_search,
+            iterative_scan=settings.iterative_scan.lower(),
+        )
+
+    def build(self) -> Optional[BaseIndex]:
+        """
+        The index to create, with this config's build parameters; None for
+        exact search.
+        """
+        if self.index_type == "hnsw":
+            return HNSWIndex(m=self.m, ef_construction=self.ef_construction)
+        if self.index_type == "ivfflat":
+            return IVFFlatIndex(lists=self.lists)
+        if self.index_type == "ivf":
+            return IVFIndex(lists=self.lists)
+        if self.index_type == "scann":
+            return ScaNNIndex(num_leaves=self.scann_num_leaves)
+        return None
+
+    def search_settings(self, filtered: bool = False) -> Dict[str, str]:
+        """
+        Server settings that control how much of the index a query scans.
+        `filtered` queries add the iterative scan where pgvector supports it.
+        """
+        if self.index_type == "hnsw":
+            settings = {"hnsw.ef_search": str(self.ef_search)}
+        elif self.index_type == "ivfflat":
+            settings = {"ivfflat.probes": str(self.probes)}
+        elif self.index_type == "ivf":
+            settings = {"ivf.probes": str(self.probes)}
+        elif self.index_type == "scann":
+            settings = {"scann.num_leaves_to_search": str(self.scann_leaves_to_search)}
+        else:
+            return {}
+        if filtered and self.iterative_scan != "off":
+            if self.index_type == "hnsw":
+                settings["hnsw.iterative_scan"] = self.iterative_scan
+            elif self.index_type == "ivfflat":
+                # ivfflat has no strict_order mode.
+                settings["ivfflat.iterative_scan"] = "relaxed_order"
+        return settings
+
+    def build_label(self) -> str:
+        if self.index_type == "hnsw":
+            return f"hnsw(m={self.m}, ef_construction={self.ef_construction})"
+        if self.index_type in ("ivfflat", "ivf"):
+            return f"{self.index_type}(lists={self.lists})"
+        if self.index_type == "scann":
+            return f"scann(num_leaves={self.scann_num_leaves})"
+        return "exact"
+
+    def search_label(self) -> str:
+        return ", ".join(f"{name}={value}" for name, value in self.search_settings().items())
+
+
+def set_config_statement(settings: Dict[str, str]) -> Tuple[str, dict]:
+    """
+    One statement applying `settings` for the current transaction only, so
+    they cost a single round trip and never leak into other pooled queries.
+    """
+    calls, params = [], {}
+    for i, (name, value) in enumerate(settings.items()):
+        calls.append(f"set_config(:name_{i}, :value_{i}, true)")
+        params[f"name_{i}"], params[f"value_{i}"] = name, value
+    return "SELECT " + ", ".join(calls), params